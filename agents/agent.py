@@ -1,4 +1,8 @@
 # 使用智能Agent，根据场景自动选择最适合的模型
-from agents.smart_agent import smart_agent
+from agents.smart_agent import get_smart_agent
 
-agent = smart_agent
\ No newline at end of file
+def __getattr__(name):
+    # `agent` 在首次访问时才创建，导入本模块不会构建任何模型或Agent
+    if name == 'agent':
+        return get_smart_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,215 @@
+"""
+基于向量嵌入的场景分类
+[router] mode = embedding 时，关键词规则只作为快速预筛：规则能明确判断的输入（图片路径、以 ocr 开头、
+带网址的下载请求、没有任何关键词）直接采用规则的结果；只命中了模糊关键词的输入（例如"图片"加一个斜杠）
+才用本地 Ollama 嵌入模型计算向量，与各场景标注示例的质心比较，取余弦相似度最高的场景。
+
+把文本问题误判为工具场景的代价最大：ReAct 工具 Agent 会额外调用好几次模型。
+
+- 向量按 模型 + 文本 缓存在 SQLite 中（与响应缓存位于同一目录），示例向量只在第一次使用时计算
+- 嵌入请求是异步的，经由后端路由（[backends]）发往提供嵌入模型的后端，不会阻塞守护进程中的其他请求
+- 只有最高分比第二名高出 min_margin 时才采用嵌入结果，否则保留规则的判断
+- 视觉/OCR 场景需要图片，输入中没有图片扩展名时不会被分到这两个场景
+- NumPy 未安装、嵌入模型不可用或超时时退回规则判断，并在一段时间内不再尝试
+"""
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config_manager import config
+
+# 各场景的标注示例
+EXAMPLES: Dict[str, List[str]] = {
+    'text': [
+        "解释一下快速排序的原理",
+        "把上面的内容翻译成英文",
+        "图片格式 png 和 jpg/jpeg 有什么区别",
+        "怎么在 linux 下查看 /var/log 里的日志",
+        "帮我写一段 python 代码读取 csv 文件",
+        "总结一下这段文字的要点",
+        "生成图片的 AI 模型有哪些，原理是什么",
+        "what is the difference between tcp and udp",
+        "给我讲讲图片压缩算法",
+        "写一封请假邮件",
+    ],
+    'tool': [
+        "下载这个视频 https://www.bilibili.com/video/BV1xx411c7mD",
+        "帮我生成一张日落海边的图片",
+        "创建一张猫咪在草地上玩耍的图片",
+        "把这首歌下载下来",
+        "下载这个文件到当前目录",
+        "画一张赛博朋克风格的城市夜景",
+        "download the video from youtube",
+        "给我做一张生日贺卡的图片",
+    ],
+    'vision': [
+        "这张图片里是什么 photo.jpg",
+        "描述一下 /home/user/pictures/cat.png 的内容",
+        "看看这张截图有什么问题 screenshot.png",
+        "分析这张图表 chart.png 说明了什么",
+        "图片里的人在做什么 D:\\images\\demo.jpg",
+        "what is in this picture image.webp",
+    ],
+    'ocr': [
+        "识别这张图片中的文字 scan.png",
+        "提取截图里的文字 screenshot.png",
+        "把这张表格图片转换成文字 table.jpg",
+        "识别发票上的内容 invoice.jpg",
+        "ocr receipt.png",
+        "把图片里的代码提取出来 code.png",
+    ],
+}
+
+EMBEDDING_DB_FILE = "embeddings.sqlite3"
+
+# 嵌入缓存的最大条目数，超出后删除最早的条目
+MAX_CACHED_EMBEDDINGS = 5000
+
+# 嵌入请求失败后多久内不再尝试（秒）
+RETRY_AFTER_FAILURE = 60.0
+
+
+class EmbeddingCache:
+    """模型 + 文本 -> 向量（float32）的磁盘缓存"""
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(keys))})", list(keys)).fetchall()
+        return dict(rows)
+
+    def put_many(self, items: Dict[str, bytes]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings(key, vector, created_at) VALUES (?, ?, ?)",
+                                   [(key, vector, now) for key, vector in items.items()])
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings "
+                "ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (MAX_CACHED_EMBEDDINGS,))
+
+
+class EmbeddingRouter:
+    """用标注示例的质心对输入做最近质心分类"""
+
+    def __init__(self, model: str, cache: EmbeddingCache, min_margin: float = 0.03,
+                 timeout: float = 3.0, max_chars: int = 1000):
+        """
+        Args:
+            model: Ollama 嵌入模型名
+            cache: 向量缓存
+            min_margin: 最高分至少比第二名高出多少才采用嵌入结果
+            timeout: 单次嵌入请求的超时时间（秒）
+            max_chars: 参与嵌入的最大字符数（长文本只取开头）
+        """
+        self.model = model
+        self.cache = cache
+        self.min_margin = min_margin
+        self.timeout = timeout
+        self.max_chars = max_chars
+        self._scenarios: List[str] = []
+        self._centroids = None
+        self._failed_at = 0.0
+
+    async def _embed(self, texts: List[str]):
+        """计算（或从缓存读取）一组文本的单位向量，返回 float32 矩阵"""
+        import numpy as np
+        from utils.backend_router import get_routed_client
+
+        keys = [EmbeddingCache.make_key(self.model, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        missing = [text for key, text in zip(keys, texts) if key not in cached]
+        if missing:
+            response = await asyncio.wait_for(get_routed_client().embed(model=self.model, input=missing),
+                                              self.timeout)
+            new_items = {}
+            for text, vector in zip(missing, response['embeddings']):
+                vector = np.asarray(vector, dtype=np.float32)
+                vector /= np.linalg.norm(vector) or 1.0
+                new_items[EmbeddingCache.make_key(self.model, text)] = vector.tobytes()
+            self.cache.put_many(new_items)
+            cached.update(new_items)
+        return np.stack([np.frombuffer(cached[key], dtype=np.float32) for key in keys])
+
+    async def _load_centroids(self):
+        import numpy as np
+
+        scenarios = list(EXAMPLES)
+        vectors = await self._embed([text for scenario in scenarios for text in EXAMPLES[scenario]])
+        centroids = []
+        start = 0
+        for scenario in scenarios:
+            count = len(EXAMPLES[scenario])
+            centroid = vectors[start:start + count].mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            start += count
+        self._scenarios = scenarios
+        self._centroids = np.stack(centroids)
+
+    async def classify(self, user_input: str, candidates: Sequence[str]) -> Optional[Tuple[str, float]]:
+        """
+        在候选场景中选出与输入最接近的场景
+
+        Returns:
+            (场景, 与第二名的分差)；无法判断（分差不足、嵌入不可用）时返回 None
+        """
+        if time.monotonic() - self._failed_at < RETRY_AFTER_FAILURE:
+            return None
+        try:
+            if self._centroids is None:
+                await self._load_centroids()
+            query = (await self._embed([user_input[:self.max_chars]]))[0]
+        except Exception:
+            # NumPy 未安装、嵌入模型未下载或服务超时：退回规则判断
+            self._failed_at = time.monotonic()
+            return None
+
+        scores = self._centroids @ query
+        ranked = sorted(((float(scores[i]), scenario) for i, scenario in enumerate(self._scenarios)
+                         if scenario in candidates), reverse=True)
+        if len(ranked) < 2:
+            return None
+        margin = ranked[0][0] - ranked[1][0]
+        if margin < self.min_margin:
+            return None
+        return ranked[0][1], margin
+
+
+_embedding_router = None
+
+
+def get_embedding_router() -> EmbeddingRouter:
+    """获取进程共享的嵌入路由器"""
+    global _embedding_router
+    if _embedding_router is None:
+        from utils.response_cache import DEFAULT_CACHE_DIR
+
+        router_config = config.get_router_config()
+        cache_dir = config.get_cache_config()['dir'] or DEFAULT_CACHE_DIR
+        _embedding_router = EmbeddingRouter(router_config['embedding_model'],
+                                            EmbeddingCache(os.path.join(cache_dir, EMBEDDING_DB_FILE)),
+                                            min_margin=router_config['min_margin'],
+                                            timeout=router_config['timeout'],
+                                            max_chars=router_config['max_chars'])
+    return _embedding_router
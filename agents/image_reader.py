@@ -1,25 +1,38 @@
-from agentscope.agent import ReActAgent
-from agentscope.formatter import OllamaChatFormatter
+_image_reader_agent = None
 
-# 使用增强模型管理器获取静音视觉模型
-try:
-    from llm_enhanced import EnhancedXXzhouModel
-    enhanced_model = EnhancedXXzhouModel()
-    vision_model = enhanced_model.get_silent_vision_model()
-except ImportError:
-    # 回退到原始实现
-    from llm import XXzhouModel
-    vision_model = XXzhouModel().get_vision_model()
+def get_image_reader_agent():
+    """获取图像识别Agent（首次调用时构建视觉模型和ReActAgent）"""
+    global _image_reader_agent
+    if _image_reader_agent is not None:
+        return _image_reader_agent
 
-image_reader_agent = ReActAgent(
-    name="image reader",
-    sys_prompt="你可以识别图片上的内容，并用语言描述图片内容。",
-    formatter=OllamaChatFormatter(),  # 使用标准formatter， SilentOllamaChatModel会处理thinking块
-    toolkit=[],
-    model=vision_model
-)
+    from agentscope.agent import ReActAgent
+    from agentscope.formatter import OllamaChatFormatter
 
-# 禁用控制台输出，避免thinking内容显示给用户
-image_reader_agent.set_console_output_enabled(False)
+    # 使用增强模型管理器获取静音视觉模型
+    try:
+        from llm_enhanced import EnhancedXXzhouModel
+        enhanced_model = EnhancedXXzhouModel()
+        vision_model = enhanced_model.get_silent_vision_model()
+    except ImportError:
+        # 回退到原始实现
+        from llm import XXzhouModel
+        vision_model = XXzhouModel().get_vision_model()
 
+    _image_reader_agent = ReActAgent(
+        name="image reader",
+        sys_prompt="你可以识别图片上的内容，并用语言描述图片内容。",
+        formatter=OllamaChatFormatter(),  # 使用标准formatter， SilentOllamaChatModel会处理thinking块
+        toolkit=[],
+        model=vision_model
+    )
 
+    # 禁用控制台输出，避免thinking内容显示给用户
+    _image_reader_agent.set_console_output_enabled(False)
+    return _image_reader_agent
+
+def __getattr__(name):
+    # 兼容 `from agents.image_reader import image_reader_agent`
+    if name == 'image_reader_agent':
+        return get_image_reader_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
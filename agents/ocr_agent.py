@@ -2,15 +2,15 @@
 OCR 专用 Agent
 专门用于图片文字识别，不添加解读和分析
 """
-from agentscope.agent import ReActAgent
-from agentscope.formatter import OllamaChatFormatter
-from agentscope.memory import InMemoryMemory
-from llm_enhanced import SilentOllamaChatModel
 
 class OCRAgent:
     """OCR 专用代理，专注于纯文字提取"""
 
     def __init__(self):
+        from agentscope.agent import ReActAgent
+        from agentscope.formatter import OllamaChatFormatter
+        from agentscope.memory import InMemoryMemory
+
         # 从 llm_enhanced 导入增强模型管理器
         from llm_enhanced import EnhancedXXzhouModel
         enhanced_model = EnhancedXXzhouModel()
@@ -52,5 +52,17 @@ class OCRAgent:
         """
         return await self.agent(msg)
 
-# 创建全局实例
-ocr_agent = OCRAgent()
\ No newline at end of file
+_ocr_agent = None
+
+def get_ocr_agent() -> OCRAgent:
+    """获取全局OCR代理（首次调用时创建）"""
+    global _ocr_agent
+    if _ocr_agent is None:
+        _ocr_agent = OCRAgent()
+    return _ocr_agent
+
+def __getattr__(name):
+    # 兼容 `from agents.ocr_agent import ocr_agent`
+    if name == 'ocr_agent':
+        return get_ocr_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,268 @@
+"""
+场景路由
+根据用户输入判断使用哪个场景（ocr / tool / vision / text）的模型
+
+规则只在导入时编译一次，每次判断对输入做一遍关键词扫描：
+- 关键词规则（'识别.*文字' 表示同一行内"识别"之后出现"文字"）不再逐条 re.search：
+  所有关键词合并为一个正则，一次扫描记录每个关键词在每一行中首次出现的结束位置和最后一次出现的起始位置，
+  再据此判断各条规则。原来的 `A.*B` 在一行中有大量 A 而没有 B 时（例如上万字的剪贴板文本）
+  会对每个 A 回溯到行尾，现在与输入长度成线性关系
+- 路径类规则仍是正则，同一优先级合并为一个带命名分组的交替正则；
+  其中 `[^\\s]+\\.(png|...)` 改写为等价的后行断言形式，避免在长行上逐个起点回溯
+- 结果中带有触发的规则，便于排查误判
+
+[router] mode = embedding 时，只命中了模糊关键词的输入再交给 agents.embedding_router 用嵌入向量复核。
+
+判断结果按输入文本缓存：同一条消息在守护进程调度、stream_response 和 SmartAgent 中只计算一次。
+嵌入复核是异步请求，经由 route_async 调用，不阻塞事件循环。
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# 按输入文本缓存的路由结果条数
+ROUTE_CACHE_SIZE = 64
+
+from config_manager import config
+
+SCENARIOS = ('tool', 'text', 'vision', 'ocr')
+
+IMAGE_EXTENSION_PATTERN = r'\.(png|jpg|jpeg|gif|webp)'
+
+# OCR检测
+OCR_PREFIX_RULE = r'^ocr\s'
+OCR_RULES = [
+    '文字识别', '文本识别', '提取文字',
+    '识别.*文字', '图片.*文字', '截图.*文字',
+    '文档.*识别', '表格.*识别'
+]
+
+# 工具检测
+TOOL_RULES = [
+    '下载.*视频', '生成.*图片', '创建.*图片', '图片.*生成',
+    '下载.*音乐', '下载.*文件', '图片.*处理', '给.*图片',
+    '下载.*http', '下载.*www', '下载.*url'
+]
+
+# 文件路径检测（更严格的路径检测）
+FILE_RULES = [
+    r'[a-zA-Z]:\\[^\\]+\\[^\\]+\\[^\\]+' + IMAGE_EXTENSION_PATTERN,  # Windows完整路径
+    r'^[^\\]+' + IMAGE_EXTENSION_PATTERN + r'$',  # 独立文件名（行首到行尾）
+    r'(?<=[^\\s])' + IMAGE_EXTENSION_PATTERN + r'(?:\s|$)',  # 文件名后跟空白或行尾
+]
+
+# 图片关键词（需同时包含图片引用才识别为vision）
+IMAGE_KEYWORD_RULES = [
+    '图片.*内容', '图片.*是什么', '图片.*描述',
+    '图片.*识别', '图像.*内容', '照片.*内容'
+]
+
+# 实际的图片引用：路径、URL、以图片扩展名结尾
+IMAGE_REFERENCE_PATTERN = r'[\\/]|http|www|' + IMAGE_EXTENSION_PATTERN + r'\s*\Z'
+
+# 明确的图片提及、截图相关
+IMAGE_MENTION_RULES = [
+    '附上.*图片', '附|.*图片', '附件.*图片', '上传.*图片', '提供.*图片', '这张.*图片', '那张.*图片',
+    '截图', '截屏', '屏幕快照'
+]
+
+# 包含图片扩展名、且带路径分隔符或以扩展名结尾时识别为vision
+IMAGE_PATH_RULE = 'image_extension_with_path'
+
+# 规则能明确判断的情形（以 ocr 开头、图片路径、带网址的下载请求），嵌入模式下不再复核
+DECISIVE_RULES = frozenset([OCR_PREFIX_RULE, *FILE_RULES, '下载.*http', '下载.*www', '下载.*url'])
+
+# 关键词 -> {行号: (首次出现的结束位置, 最后一次出现的起始位置)}
+KeywordLines = Dict[str, Dict[int, Tuple[int, int]]]
+
+
+class RouteDecision(NamedTuple):
+    """路由结果"""
+    scenario: str
+    rule: Optional[str]  # 触发的规则，默认的文本场景为 None
+
+    @property
+    def ambiguous(self) -> bool:
+        """是否只命中了模糊的关键词规则（没有命中任何规则的默认文本场景不算）"""
+        return self.rule is not None and self.rule not in DECISIVE_RULES
+
+
+class _KeywordRule:
+    """'A' 或 'A.*B' 形式的关键词规则（与正则相同，.* 不跨行）"""
+
+    def __init__(self, rule: str):
+        self.rule = rule
+        parts = rule.split('.*')
+        self.first = parts[0]
+        self.then = parts[1] if len(parts) > 1 else None
+
+    def keywords(self) -> List[str]:
+        return [self.first] + ([self.then] if self.then else [])
+
+    def matches(self, found: KeywordLines) -> bool:
+        first = found.get(self.first)
+        if not first:
+            return False
+        if self.then is None:
+            return True
+        then = found.get(self.then)
+        if not then:
+            return False
+        # 同一行中 A 的首次出现在 B 的最后一次出现之前即可
+        return any(line in then and end <= then[line][1] for line, (end, _) in first.items())
+
+
+class _KeywordScanner:
+    """一次扫描找出所有关键词在每一行中的位置"""
+
+    def __init__(self, keywords: List[str]):
+        ordered = sorted(set(keywords), key=len, reverse=True)
+        # 前瞻匹配使每个位置都被检查，重叠的关键词不会漏掉
+        self._pattern = re.compile('(?=(' + '|'.join(re.escape(keyword) for keyword in ordered) + '))')
+        # 同一位置命中的较短关键词一定是较长关键词的前缀
+        self._prefixes = {keyword: [other for other in ordered if keyword.startswith(other)] for keyword in ordered}
+
+    def scan(self, text: str) -> KeywordLines:
+        found: KeywordLines = {}
+        line = 0
+        line_checked = 0
+        for match in self._pattern.finditer(text):
+            pos = match.start()
+            line += text.count('\n', line_checked, pos)
+            line_checked = pos
+            for keyword in self._prefixes[match.group(1)]:
+                lines = found.setdefault(keyword, {})
+                if line in lines:
+                    lines[line] = (lines[line][0], pos)
+                else:
+                    lines[line] = (pos + len(keyword), pos)
+        return found
+
+
+class _RuleSet:
+    """同一优先级的正则规则，合并为一个交替正则"""
+
+    def __init__(self, rules: List[str]):
+        self.rules = rules
+        self.pattern = re.compile('|'.join(f'(?P<r{i}>{rule})' for i, rule in enumerate(rules)))
+
+    def search(self, text: str) -> Optional[str]:
+        """返回命中的规则，未命中返回 None"""
+        match = self.pattern.search(text)
+        return self.rules[int(match.lastgroup[1:])] if match else None
+
+
+def _first_match(rules: List[_KeywordRule], found: KeywordLines) -> Optional[str]:
+    for rule in rules:
+        if rule.matches(found):
+            return rule.rule
+    return None
+
+
+class ScenarioRouter:
+    """编译好的场景路由器"""
+
+    def __init__(self):
+        self._ocr_prefix = re.compile(OCR_PREFIX_RULE)
+        self._ocr_rules = [_KeywordRule(rule) for rule in OCR_RULES]
+        self._tool_rules = [_KeywordRule(rule) for rule in TOOL_RULES]
+        self._file_rules = _RuleSet(FILE_RULES)
+        self._image_extension = re.compile(IMAGE_EXTENSION_PATTERN)
+        self._image_path = re.compile(r'[\\/]|' + IMAGE_EXTENSION_PATTERN + r'\s*\Z')
+        self._image_keyword_rules = [_KeywordRule(rule) for rule in IMAGE_KEYWORD_RULES]
+        self._image_reference = re.compile(IMAGE_REFERENCE_PATTERN)
+        self._image_mention_rules = [_KeywordRule(rule) for rule in IMAGE_MENTION_RULES]
+
+        keyword_rules = self._ocr_rules + self._tool_rules + self._image_keyword_rules + self._image_mention_rules
+        self._scanner = _KeywordScanner([keyword for rule in keyword_rules for keyword in rule.keywords()])
+
+    def has_image_extension(self, user_input: str) -> bool:
+        return self._image_extension.search(user_input.lower()) is not None
+
+    def route(self, user_input: str) -> RouteDecision:
+        """判断用户输入的场景类型"""
+        text = user_input.lower()
+        found = self._scanner.scan(text)
+
+        # OCR检测
+        if self._ocr_prefix.search(text):
+            return RouteDecision('ocr', OCR_PREFIX_RULE)
+        rule = _first_match(self._ocr_rules, found)
+        if rule is not None:
+            return RouteDecision('ocr', rule)
+
+        # 工具检测
+        rule = _first_match(self._tool_rules, found)
+        if rule is not None:
+            return RouteDecision('tool', rule)
+
+        # 文件路径检测
+        rule = self._file_rules.search(text)
+        if rule is not None:
+            return RouteDecision('vision', rule)
+
+        # 只有明确包含图片扩展名且看起来像文件路径时才识别为vision
+        if self._image_extension.search(text) and self._image_path.search(text):
+            return RouteDecision('vision', IMAGE_PATH_RULE)
+
+        # 智能图像检测：只有当包含图片关键字 AND 包含文件路径/图片引用时才触发vision
+        rule = _first_match(self._image_keyword_rules, found)
+        if rule is not None and (self._image_reference.search(text)
+                                 or _first_match(self._image_mention_rules, found) is not None):
+            return RouteDecision('vision', rule)
+
+        # 默认为文本对话
+        return RouteDecision('text', None)
+
+
+_router = None
+
+
+def get_scenario_router() -> ScenarioRouter:
+    """获取进程共享的场景路由器（首次调用时编译规则）"""
+    global _router
+    if _router is None:
+        _router = ScenarioRouter()
+    return _router
+
+
+async def _refine_with_embedding(decision: RouteDecision, user_input: str) -> RouteDecision:
+    """用嵌入向量复核模糊的规则判断；嵌入不可用或分差不足时保留规则的结果"""
+    from agents.embedding_router import get_embedding_router
+
+    # 视觉/OCR 场景需要图片
+    if get_scenario_router().has_image_extension(user_input):
+        candidates = SCENARIOS
+    else:
+        candidates = ('tool', 'text')
+    result = await get_embedding_router().classify(user_input, candidates)
+    if result is None:
+        return decision
+    scenario, margin = result
+    return RouteDecision(scenario, f"embedding(margin={margin:.3f}, rule={decision.rule})")
+
+
+@lru_cache(maxsize=ROUTE_CACHE_SIZE)
+def route(user_input: str) -> RouteDecision:
+    """按关键词规则判断场景类型（按输入文本缓存，不做嵌入复核）"""
+    return get_scenario_router().route(user_input)
+
+
+# 嵌入复核采用的结果（按输入文本缓存）
+_refined: Dict[str, RouteDecision] = {}
+
+
+async def route_async(user_input: str) -> RouteDecision:
+    """判断场景类型；[router] mode = embedding 时用嵌入向量复核模糊的规则判断"""
+    decision = route(user_input)
+    if not decision.ambiguous or config.get_router_config()['mode'] != 'embedding':
+        return decision
+    refined = _refined.get(user_input)
+    if refined is None:
+        refined = await _refine_with_embedding(decision, user_input)
+        # 嵌入不可用或分差不足时不缓存，之后仍可再尝试
+        if refined is not decision:
+            if len(_refined) >= ROUTE_CACHE_SIZE:
+                _refined.pop(next(iter(_refined)))
+            _refined[user_input] = refined
+    return refined
@@ -1,39 +1,91 @@
-import re
 import os
-from typing import Optional
-from agentscope.agent import ReActAgent
-from agentscope.formatter import OllamaChatFormatter
-from agentscope.memory import InMemoryMemory
-from agentscope.tool import Toolkit
-from agentscope.message import Msg
+from typing import Optional, TYPE_CHECKING
 from config_manager import config
+from agents.scenario_router import route_async
 
-from llm import XXzhouModel
-from tools.download_video import download_video
-from tools.create_image import create_images
-from tools.image_reader import images_reader
+if TYPE_CHECKING:
+    from agentscope.message import Msg
+
+# agentscope、模型和工具均在首次使用对应场景时才导入和构建，导入本模块几乎没有开销
 
 class SmartAgent:
     """智能Agent，根据用户输入自动选择最适合的模型"""
 
+    # 支持的场景类型
+    SCENARIOS = ('tool', 'text', 'vision', 'ocr')
+
     def __init__(self):
-        self.model_manager = XXzhouModel()
+        self._model_manager = None
 
         # 从配置文件加载模型配置
         self.model_names = self._load_model_config()
 
-        # 初始化工具套件
-        self.toolkit = Toolkit()
-        self.toolkit.register_tool_function(download_video)
-        self.toolkit.register_tool_function(create_images)
-        self.toolkit.register_tool_function(images_reader)
-
-        # 导入OCR工具
+        # 已构建的场景Agent（按场景懒加载并缓存）
+        self._agents = {}
+
+    @property
+    def model_manager(self):
+        """模型管理器（首次访问时创建）"""
+        if self._model_manager is None:
+            from llm import XXzhouModel
+            self._model_manager = XXzhouModel()
+        return self._model_manager
+
+    def get_agent(self, scenario: str):
+        """
+        获取指定场景的Agent，首次使用时构建其模型、Toolkit和ReActAgent
+
+        Args:
+            scenario: 场景类型（tool/text/vision/ocr）
+
+        Returns:
+            ReActAgent: 该场景的Agent
+        """
+        if scenario not in self._agents:
+            builder = getattr(self, f"_build_{scenario}_agent")
+            self._agents[scenario] = builder()
+        return self._agents[scenario]
+
+    def preload(self, scenarios=None):
+        """预先构建指定场景的Agent（默认全部场景），用于常驻进程预热"""
+        for scenario in scenarios or self.SCENARIOS:
+            self.get_agent(scenario)
+
+    @property
+    def tool_agent(self):
+        return self.get_agent('tool')
+
+    @property
+    def text_agent(self):
+        return self.get_agent('text')
+
+    @property
+    def vision_agent(self):
+        return self.get_agent('vision')
+
+    @property
+    def ocr_agent(self):
+        return self.get_agent('ocr')
+
+    def _build_tool_agent(self):
+        """构建工具调用Agent"""
+        from agentscope.agent import ReActAgent
+        from agentscope.formatter import OllamaChatFormatter
+        from agentscope.memory import InMemoryMemory
+        from agentscope.tool import Toolkit
+        from tools.download_video import download_video
+        from tools.create_image import create_images
+        from tools.image_reader import images_reader
         from utils.ocr_utils import ocr_image
-        self.toolkit.register_tool_function(ocr_image)
 
-        # 创建不同场景的Agent
-        self.tool_agent = ReActAgent(
+        # 初始化工具套件
+        toolkit = Toolkit()
+        toolkit.register_tool_function(download_video)
+        toolkit.register_tool_function(create_images)
+        toolkit.register_tool_function(images_reader)
+        toolkit.register_tool_function(ocr_image)
+
+        tool_agent = ReActAgent(
             name="小帅工具助手",
             sys_prompt="""
             1. 你可以使用download_video工具下载视频。
@@ -43,13 +95,20 @@ class SmartAgent:
             请专注于调用合适的工具来完成用户的任务。
             """,
             formatter=OllamaChatFormatter(),
-            toolkit=self.toolkit,
+            toolkit=toolkit,
             memory=InMemoryMemory(),
             model=self.model_manager.get_tool_calling_model()
         )
-        self.tool_agent.set_console_output_enabled(False)
+        tool_agent.set_console_output_enabled(False)
+        return tool_agent
 
-        self.text_agent = ReActAgent(
+    def _build_text_agent(self):
+        """构建文本对话Agent"""
+        from agentscope.agent import ReActAgent
+        from agentscope.formatter import OllamaChatFormatter
+        from agentscope.memory import InMemoryMemory
+
+        text_agent = ReActAgent(
             name="小帅对话助手",
             sys_prompt="""
             你是一个智能助手，专注于对话和文本处理。
@@ -60,7 +119,16 @@ class SmartAgent:
             memory=InMemoryMemory(),
             model=self.model_manager.get_general_text_model()
         )
-        self.text_agent.set_console_output_enabled(False)
+        text_agent.set_console_output_enabled(False)
+        return text_agent
+
+    def _build_vision_agent(self):
+        """构建视觉识别Agent"""
+        from agentscope.agent import ReActAgent
+        from agentscope.formatter import OllamaChatFormatter
+        from agentscope.memory import InMemoryMemory
+        from agentscope.tool import Toolkit
+        from tools.image_reader import images_reader
 
         # 为视觉agent创建独立的toolkit
         vision_toolkit = Toolkit()
@@ -70,18 +138,18 @@ class SmartAgent:
         try:
             from llm_enhanced import EnhancedXXzhouModel
             enhanced_model = EnhancedXXzhouModel()
-            self.vision_model = enhanced_model.get_silent_vision_model()
+            vision_model = enhanced_model.get_silent_vision_model()
         except ImportError:
-            self.vision_model = self.model_manager.get_vision_model()
+            vision_model = self.model_manager.get_vision_model()
 
-        self.vision_agent = ReActAgent(
+        vision_agent = ReActAgent(
             name="小帅视觉助手",
             sys_prompt="""
 你是一个专业的图片识别助手。当用户提供图片路径或图片相关请求时，你必须：
 
 1. 使用 images_reader 工具来识别和分析图片内容
 2. 根据用户的具体问题，调用 images_reader(prompt, image_dir) 工具
-3. 其中 prompt 是用户的问题，image_dir 是图片的文件路径
+3. 其中 prompt 是用户的问题，image_dir 是图片的文件路径；用户询问一个目录中的多张图片时，image_dir 直接传目录路径
 4. 然后根据工具返回的结果，详细回答用户的问题
 
 重要：不要解释文件路径或文件格式，而是要实际调用工具来分析图片内容！
@@ -89,9 +157,18 @@ class SmartAgent:
             formatter=OllamaChatFormatter(),
             toolkit=vision_toolkit,  # 只保留图像识别功能
             memory=InMemoryMemory(),
-            model=self.vision_model
+            model=vision_model
         )
-        self.vision_agent.set_console_output_enabled(False)
+        vision_agent.set_console_output_enabled(False)
+        return vision_agent
+
+    def _build_ocr_agent(self):
+        """构建OCR Agent"""
+        from agentscope.agent import ReActAgent
+        from agentscope.formatter import OllamaChatFormatter
+        from agentscope.memory import InMemoryMemory
+        from agentscope.tool import Toolkit
+        from utils.ocr_utils import ocr_image
 
         # 创建OCR专用的toolkit
         ocr_toolkit = Toolkit()
@@ -101,11 +178,11 @@ class SmartAgent:
         try:
             from llm_enhanced import EnhancedXXzhouModel
             enhanced_model = EnhancedXXzhouModel()
-            self.ocr_model = enhanced_model.get_ocr_model()
+            ocr_model = enhanced_model.get_ocr_model()
         except ImportError:
-            self.ocr_model = self.model_manager.get_vision_model()
+            ocr_model = self.model_manager.get_vision_model()
 
-        self.ocr_agent = ReActAgent(
+        ocr_agent = ReActAgent(
             name="小帅OCR助手",
             sys_prompt="""你是一个专业的OCR（文字识别）助手。当用户提供图片时，你必须：
 
@@ -118,89 +195,30 @@ class SmartAgent:
             formatter=OllamaChatFormatter(),
             toolkit=ocr_toolkit,
             memory=InMemoryMemory(),
-            model=self.ocr_model
+            model=ocr_model
         )
-        self.ocr_agent.set_console_output_enabled(False)
+        ocr_agent.set_console_output_enabled(False)
+        return ocr_agent
+
+    async def reset_memory(self):
+        """清空已构建的场景Agent的对话记忆（守护进程在每次请求结束后调用）"""
+        for scenario_agent in self._agents.values():
+            await scenario_agent.memory.clear()
 
     def _load_model_config(self):
         """从配置文件加载模型配置"""
         return config.get_models()
 
-    def _detect_scenario(self, user_input: str) -> str:
-        """检测用户输入的场景类型"""
-        user_input = user_input.lower()
-
-        # OCR检测
-        ocr_patterns = [
-            r'^ocr\s', r'文字识别', r'文本识别', r'提取文字',
-            r'识别.*文字', r'图片.*文字', r'截图.*文字',
-            r'文档.*识别', r'表格.*识别'
-        ]
-
-        for pattern in ocr_patterns:
-            if re.search(pattern, user_input):
-                return 'ocr'
-
-        # 工具检测
-        tool_patterns = [
-            r'下载.*视频', r'生成.*图片', r'创建.*图片', r'图片.*生成',
-            r'下载.*音乐', r'下载.*文件', r'图片.*处理', r'给.*图片.*',
-            r'下载.*http', r'下载.*www', r'下载.*url'
-        ]
-
-        for pattern in tool_patterns:
-            if re.search(pattern, user_input):
-                return 'tool'
-
-        # 文件路径检测（更严格的路径检测）
-        file_patterns = [
-            r'[a-zA-Z]:\\[^\\]+\\[^\\]+\\[^\\]+\.(png|jpg|jpeg|gif|webp)',  # Windows完整路径
-            r'^[^\\]+\.(png|jpg|jpeg|gif|webp)$',  # 独立文件名（行首到行尾）
-            r'[^\\s]+\.(png|jpg|jpeg|gif|webp)(?:\s|$)',  # 文件名后跟空白或行尾
-        ]
-
-        for pattern in file_patterns:
-            if re.search(pattern, user_input):
-                return 'vision'
-
-        # 只有明确包含图片扩展名且看起来像文件路径时才识别为vision
-        if re.search(r'.*\.(png|jpg|jpeg|gif|webp)', user_input):
-            # 额外检查：如果包含路径分隔符或者是完整路径，才识别为vision
-            if ('\\' in user_input or '/' in user_input or
-                user_input.strip().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))):
-                return 'vision'
-
-        # 智能图像检测：只有当包含图片关键字 AND 包含文件路径/图片引用时才触发vision
-        image_keyword_patterns = [
-            r'图片.*内容', r'图片.*是什么', r'图片.*描述',
-            r'图片.*识别', r'图像.*内容', r'照片.*内容'
-        ]
-
-        has_image_keywords = any(re.search(pattern, user_input) for pattern in image_keyword_patterns)
-
-        # 检查是否包含实际的图片引用（路径、URL、或明确的图片提及）
-        has_actual_image_reference = (
-            '\\' in user_input or  # Windows路径
-            '/' in user_input or   # Unix路径
-            'http' in user_input or  # URL
-            'www' in user_input or   # WWW
-            user_input.strip().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')) or  # 文件结尾
-            re.search(r'(?:附[上|件]|上传|提供|这张|那张).*图片', user_input) or  # 明确的图片引用
-            re.search(r'截图|截屏|屏幕快照', user_input)  # 截图相关
-        )
-
-        if has_image_keywords and has_actual_image_reference:
-            return 'vision'
+    async def _detect_scenario(self, user_input: str) -> str:
+        """检测用户输入的场景类型（规则已预编译，同一输入只计算一次）"""
+        return (await route_async(user_input)).scenario
 
-        # 默认为文本对话
-        return 'text'
-
-    async def __call__(self, msg: Msg) -> any:
+    async def __call__(self, msg: "Msg") -> any:
         """根据用户输入自动选择合适的Agent处理请求"""
         user_input = msg.content if isinstance(msg.content, str) else str(msg.content)
 
         # 检测场景
-        scenario = self._detect_scenario(user_input)
+        scenario = await self._detect_scenario(user_input)
 
         print(f"[系统] 检测到场景类型: {scenario}")
         print(f"[系统] 当前使用模型: {self.model_names[scenario]}")
@@ -241,6 +259,17 @@ class SmartAgent:
                     ]
                     return msg
 
-# 创建智能Agent实例
-smart_agent = SmartAgent()
-agent = smart_agent  # 为了兼容现有代码
\ No newline at end of file
+_smart_agent = None
+
+def get_smart_agent() -> SmartAgent:
+    """获取全局智能Agent实例（首次调用时创建）"""
+    global _smart_agent
+    if _smart_agent is None:
+        _smart_agent = SmartAgent()
+    return _smart_agent
+
+def __getattr__(name):
+    # 兼容 `from agents.smart_agent import smart_agent`：模块属性在首次访问时才创建实例
+    if name in ('smart_agent', 'agent'):
+        return get_smart_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
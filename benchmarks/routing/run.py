@@ -0,0 +1,144 @@
+"""
+场景路由准确率与延迟基准测试
+
+在标注语料（corpus.jsonl，中英文、路径、网址和剪贴板大小的长文本）上并排比较多种路由实现：
+- 每个场景的混淆矩阵和准确率
+- 单次路由耗时的 p50 / p99
+- 最慢的输入及其长度；以及把长文本逐级加长时，耗时仍在预算内的最大输入长度
+
+默认只比较离线实现（原逐条 re.search 的规则、编译后的规则）；加 --embedding 时同时测试嵌入路由
+（需要本地 Ollama 和嵌入模型，向量会写入 .cache/embeddings.sqlite3）。
+
+用法：
+    python benchmarks/routing/run.py [--repeat 20] [--budget-ms 5] [--embedding]
+
+语料格式：每行一个 JSON 对象 {"text": ..., "label": "text|tool|vision|ocr"}，
+可选 "repeat": N 表示把 text 重复 N 次，用于构造剪贴板大小的输入而不必把长文本存进仓库。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Callable, Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(os.path.dirname(BENCH_DIR))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from agents.scenario_router import SCENARIOS, ScenarioRouter
+from scenario_routing import legacy_detect_scenario
+
+CORPUS_FILE = os.path.join(BENCH_DIR, "corpus.jsonl")
+
+# 长度扫描使用的段落（不含任何路由关键词以外的特殊字符，模拟粘贴的长文本）
+SWEEP_PARAGRAPH = "本地模型的推理速度主要受内存带宽影响，生成速度与量化方式有关。"
+SWEEP_LENGTHS = (1000, 4000, 16000, 64000)
+
+
+def load_corpus(path: str = CORPUS_FILE) -> List[Tuple[str, str]]:
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            corpus.append((item['text'] * item.get('repeat', 1), item['label']))
+    return corpus
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def evaluate(route: Callable[[str], str], corpus: List[Tuple[str, str]], repeat: int) -> Dict:
+    """对一种实现计算混淆矩阵和逐条耗时"""
+    confusion = {label: {predicted: 0 for predicted in SCENARIOS} for label in SCENARIOS}
+    timings = []
+    slowest = (0.0, 0)
+    for text, label in corpus:
+        confusion[label][route(text)] += 1
+        start = time.perf_counter()
+        for _ in range(repeat):
+            route(text)
+        elapsed = (time.perf_counter() - start) / repeat * 1e6
+        timings.append(elapsed)
+        slowest = max(slowest, (elapsed, len(text)))
+    return {'confusion': confusion, 'timings': timings, 'slowest': slowest}
+
+
+def max_length_within_budget(route: Callable[[str], str], budget_us: float) -> Tuple[int, List[Tuple[int, float]]]:
+    """把长文本逐级加长，返回耗时不超过预算的最大长度和每一级的耗时"""
+    results = []
+    within = 0
+    for length in SWEEP_LENGTHS:
+        text = (SWEEP_PARAGRAPH * (length // len(SWEEP_PARAGRAPH) + 1))[:length]
+        start = time.perf_counter()
+        route(text)
+        elapsed = (time.perf_counter() - start) * 1e6
+        results.append((length, elapsed))
+        if elapsed <= budget_us:
+            within = length
+    return within, results
+
+
+def print_report(name: str, result: Dict, sweep: Tuple[int, List[Tuple[int, float]]], budget_ms: float):
+    confusion = result['confusion']
+    total = sum(sum(row.values()) for row in confusion.values())
+    correct = sum(confusion[label][label] for label in SCENARIOS)
+    print(f"\n=== {name} ===")
+    print(f"准确率: {correct}/{total} ({correct / total:.0%})")
+    print("标注\\预测 " + "".join(f"{scenario:>8}" for scenario in SCENARIOS) + "    召回率")
+    for label in SCENARIOS:
+        row = confusion[label]
+        count = sum(row.values())
+        recall = f"{row[label] / count:.0%}" if count else "-"
+        print(f"{label:<10}" + "".join(f"{row[predicted]:>8}" for predicted in SCENARIOS) + f"{recall:>10}")
+    timings = result['timings']
+    slowest_us, slowest_length = result['slowest']
+    print(f"耗时: p50 {_percentile(timings, 50):.1f} us  p99 {_percentile(timings, 99):.1f} us  "
+          f"最慢 {slowest_us:.1f} us（输入 {slowest_length} 字符）")
+    within, steps = sweep
+    print("长度扫描: " + "  ".join(f"{length}字 {elapsed / 1000:.2f} ms" for length, elapsed in steps))
+    print(f"耗时不超过 {budget_ms:g} ms 的最大输入长度: {within or '<' + str(SWEEP_LENGTHS[0])} 字符")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="场景路由准确率与延迟基准测试")
+    parser.add_argument('--repeat', type=int, default=20, help="每条输入重复计时的次数")
+    parser.add_argument('--budget-ms', type=float, default=5.0, help="长度扫描的单次路由耗时预算（毫秒）")
+    parser.add_argument('--embedding', action='store_true', help="同时测试嵌入路由（需要本地 Ollama）")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    router = ScenarioRouter()
+    implementations = [
+        ('legacy re.search', legacy_detect_scenario),
+        ('compiled rules', lambda text: router.route(text).scenario),
+    ]
+    if args.embedding:
+        from agents.scenario_router import _refine_with_embedding
+
+        # 共享的异步客户端绑定在第一个事件循环上，所有调用使用同一个循环
+        loop = asyncio.new_event_loop()
+
+        def embedding_route(text):
+            decision = router.route(text)
+            if not decision.ambiguous:
+                return decision.scenario
+            return loop.run_until_complete(_refine_with_embedding(decision, text)).scenario
+        implementations.append(('embedding', embedding_route))
+
+    print(f"语料: {len(corpus)} 条，最长 {max(len(text) for text, _ in corpus)} 字符")
+    for name, route in implementations:
+        result = evaluate(route, corpus, args.repeat)
+        sweep = max_length_within_budget(route, args.budget_ms * 1000)
+        print_report(name, result, sweep, args.budget_ms)
+
+
+if __name__ == "__main__":
+    main()
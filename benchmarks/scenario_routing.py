@@ -0,0 +1,151 @@
+"""
+场景路由微基准测试
+
+对比原来逐条 re.search 的 _detect_scenario（legacy_detect_scenario，保留原实现作为对照）与
+编译后的 ScenarioRouter，并校验两者在语料上的判断结果一致。
+
+语料包括常见的短提示词和上万字的剪贴板文本（原规则中的 `[^\\s]+\\.(png|...)` 在这类长行上回溯严重）。
+
+用法：
+    python benchmarks/scenario_routing.py [--repeat 200]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from agents.scenario_router import ScenarioRouter
+
+PROMPTS = [
+    "解释一下快速排序",
+    "帮我写一个python脚本，批量重命名文件",
+    "下载视频 https://www.bilibili.com/video/BV1xx411c7mD",
+    "生成一张猫咪的图片",
+    "ocr screenshot.png",
+    "识别这张截图里的文字",
+    "提取文字",
+    "表格识别一下",
+    "D:\\code\\py\\xshuai\\images\\demo.png",
+    "/home/user/pictures/photo.jpg 这张图片是什么",
+    "这张图片的内容是什么 截图",
+    "图片里描述了什么",
+    "把上面的翻译成英文",
+    "what is the capital of france",
+    "summary.md 的内容总结一下",
+]
+
+
+def _clipboard_inputs():
+    """模拟粘贴的长文本：中文长段落、日志、代码"""
+    paragraph = "本地模型的推理速度主要受内存带宽影响，量化可以减少权重读取量，从而提高生成速度。" * 250
+    log = "\n".join(f"2024-05-01 12:00:{i % 60:02d} INFO worker-{i % 8} handled request id={i} in {i % 97} ms"
+                    for i in range(160))
+    code = "\n".join(f"    result_{i} = compute(value_{i}, factor={i})  # 计算第 {i} 项" for i in range(220))
+    return [paragraph, paragraph + " 看看 a.png", log, code, "请总结：" + paragraph]
+
+
+def legacy_detect_scenario(user_input: str) -> str:
+    """原 SmartAgent._detect_scenario 的实现（逐条 re.search，每次调用重新构建规则列表）"""
+    user_input = user_input.lower()
+
+    # OCR检测
+    ocr_patterns = [
+        r'^ocr\s', r'文字识别', r'文本识别', r'提取文字',
+        r'识别.*文字', r'图片.*文字', r'截图.*文字',
+        r'文档.*识别', r'表格.*识别'
+    ]
+
+    for pattern in ocr_patterns:
+        if re.search(pattern, user_input):
+            return 'ocr'
+
+    # 工具检测
+    tool_patterns = [
+        r'下载.*视频', r'生成.*图片', r'创建.*图片', r'图片.*生成',
+        r'下载.*音乐', r'下载.*文件', r'图片.*处理', r'给.*图片.*',
+        r'下载.*http', r'下载.*www', r'下载.*url'
+    ]
+
+    for pattern in tool_patterns:
+        if re.search(pattern, user_input):
+            return 'tool'
+
+    # 文件路径检测（更严格的路径检测）
+    file_patterns = [
+        r'[a-zA-Z]:\\[^\\]+\\[^\\]+\\[^\\]+\.(png|jpg|jpeg|gif|webp)',  # Windows完整路径
+        r'^[^\\]+\.(png|jpg|jpeg|gif|webp)$',  # 独立文件名（行首到行尾）
+        r'[^\\s]+\.(png|jpg|jpeg|gif|webp)(?:\s|$)',  # 文件名后跟空白或行尾
+    ]
+
+    for pattern in file_patterns:
+        if re.search(pattern, user_input):
+            return 'vision'
+
+    # 只有明确包含图片扩展名且看起来像文件路径时才识别为vision
+    if re.search(r'.*\.(png|jpg|jpeg|gif|webp)', user_input):
+        # 额外检查：如果包含路径分隔符或者是完整路径，才识别为vision
+        if ('\\' in user_input or '/' in user_input or
+            user_input.strip().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))):
+            return 'vision'
+
+    # 智能图像检测：只有当包含图片关键字 AND 包含文件路径/图片引用时才触发vision
+    image_keyword_patterns = [
+        r'图片.*内容', r'图片.*是什么', r'图片.*描述',
+        r'图片.*识别', r'图像.*内容', r'照片.*内容'
+    ]
+
+    has_image_keywords = any(re.search(pattern, user_input) for pattern in image_keyword_patterns)
+
+    # 检查是否包含实际的图片引用（路径、URL、或明确的图片提及）
+    has_actual_image_reference = (
+        '\\' in user_input or  # Windows路径
+        '/' in user_input or   # Unix路径
+        'http' in user_input or  # URL
+        'www' in user_input or   # WWW
+        user_input.strip().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')) or  # 文件结尾
+        re.search(r'(?:附[上|件]|上传|提供|这张|那张).*图片', user_input) or  # 明确的图片引用
+        re.search(r'截图|截屏|屏幕快照', user_input)  # 截图相关
+    )
+
+    if has_image_keywords and has_actual_image_reference:
+        return 'vision'
+
+    # 默认为文本对话
+    return 'text'
+
+
+def _time_per_call(func, inputs, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in inputs:
+            func(text)
+    return (time.perf_counter() - start) / (repeat * len(inputs)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="场景路由微基准测试")
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    router = ScenarioRouter()
+    clipboard = _clipboard_inputs()
+
+    mismatches = [text[:40] for text in PROMPTS + clipboard
+                  if legacy_detect_scenario(text) != router.route(text).scenario]
+    if mismatches:
+        print(f"判断结果不一致: {mismatches}")
+        sys.exit(1)
+
+    for label, inputs, repeat in (('短提示词', PROMPTS, args.repeat),
+                                  ('剪贴板长文本', clipboard, max(1, args.repeat // 50))):
+        legacy = _time_per_call(legacy_detect_scenario, inputs, repeat)
+        compiled = _time_per_call(router.route, inputs, repeat)
+        print(f"{label:<8}legacy {legacy:10.1f} us/次   compiled {compiled:10.1f} us/次   ({legacy / compiled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+流式输出写入开销基准测试
+
+对比逐 token 调用 print(..., flush=True) 与 TerminalWriter 合并写入，输出重定向到文件（原始模式）。
+
+用法：
+    python benchmarks/terminal_output.py [--tokens 20000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from utils.terminal_writer import TerminalWriter
+
+TOKENS = ["本地", "模型", "的", "推理", "速度", "，", "主要", "受", "内存", "带宽", "影响", "。\n"]
+
+
+def _per_token_print(stream, count):
+    for i in range(count):
+        print(TOKENS[i % len(TOKENS)], end='', flush=True, file=stream)
+
+
+def _coalesced(stream, count):
+    with TerminalWriter(stream) as out:
+        for i in range(count):
+            out.write(TOKENS[i % len(TOKENS)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式输出写入开销基准测试")
+    parser.add_argument('--tokens', type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, func in (('per-token print', _per_token_print), ('TerminalWriter', _coalesced)):
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as stream:
+            start = time.perf_counter()
+            func(stream, args.tokens)
+            elapsed = (time.perf_counter() - start) * 1000
+        print(f"{name:<16}{elapsed:9.1f} ms  ({args.tokens} tokens)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+文本场景首字延迟（time-to-first-token）基准测试
+
+对比两种构建方式：
+- eager：模拟改造前的行为，导入后立即构建全部场景的 Agent、模型和 Toolkit
+- lazy：改造后的行为，只在用到某个场景时才构建
+
+每轮都在独立的子进程中冷启动运行，统计从进程启动到收到第一个 token 的时间。
+
+用法：
+    python benchmarks/ttft_text.py [--runs 5] [--prompt 你好] [--no-generate]
+
+--no-generate 只测量到"准备发送请求"为止，不需要 Ollama 服务。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _child(mode: str, prompt: str, generate: bool):
+    """子进程：冷启动并测量各阶段耗时，结果以 JSON 输出到 stdout 最后一行"""
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT_DIR)
+
+    from agents.smart_agent import get_smart_agent
+    smart_agent = get_smart_agent()
+    if mode == 'eager':
+        from agents.image_reader import get_image_reader_agent
+        from agents.ocr_agent import get_ocr_agent
+        smart_agent.preload()
+        get_image_reader_agent()
+        get_ocr_agent()
+    setup_done = time.perf_counter()
+
+    scenario = asyncio.run(smart_agent._detect_scenario(prompt))
+    model_name = smart_agent.model_names[scenario]
+    ready = time.perf_counter()
+
+    first_token = None
+    if generate:
+        from utils.ollama_transport import get_client
+        stream = get_client().chat(model=model_name,
+                                   messages=[{"role": "user", "content": prompt}],
+                                   stream=True)
+        for chunk in stream:
+            if chunk['message']['content']:
+                first_token = time.perf_counter()
+                break
+
+    print(json.dumps({
+        'setup_ms': (setup_done - start) * 1000,
+        'ready_ms': (ready - start) * 1000,
+        'ttft_ms': (first_token - start) * 1000 if first_token else None,
+        'scenario': scenario,
+    }))
+
+
+def _run_once(mode: str, prompt: str, generate: bool) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', mode, '--prompt', prompt]
+    if not generate:
+        cmd.append('--no-generate')
+    wall_start = time.perf_counter()
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', cwd=ROOT_DIR)
+    wall_ms = (time.perf_counter() - wall_start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    record = json.loads(result.stdout.strip().splitlines()[-1])
+    record['wall_ms'] = wall_ms
+    return record
+
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def _fmt(value):
+    return f"{value:9.1f}" if value is not None else "      n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本场景首字延迟基准测试")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--prompt', default="用一句话介绍一下你自己")
+    parser.add_argument('--no-generate', action='store_true')
+    parser.add_argument('--child', choices=['eager', 'lazy'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, args.prompt, not args.no_generate)
+        return
+
+    print(f"提示词: {args.prompt}  轮数: {args.runs}")
+    print(f"{'模式':<6}{'构建(ms)':>12}{'就绪(ms)':>12}{'首字(ms)':>12}{'进程墙钟(ms)':>14}")
+    for mode in ('eager', 'lazy'):
+        records = [_run_once(mode, args.prompt, not args.no_generate) for _ in range(args.runs)]
+        print(f"{mode:<8}"
+              f"{_fmt(_median([r['setup_ms'] for r in records]))}   "
+              f"{_fmt(_median([r['ready_ms'] for r in records]))}   "
+              f"{_fmt(_median([r['ttft_ms'] for r in records]))}   "
+              f"{_fmt(_median([r['wall_ms'] for r in records]))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,12 @@
 import os
 import time
-import tempfile
 from typing import Optional, List, Any
 import win32clipboard
 from PIL import Image, ImageGrab
 import io
 from config_manager import config
 from decorators import safe_execute, retry_on_failure
+from utils.clipboard_image import dib_to_image, save_temp_image
 
 class ClipboardManager:
     """剪贴板操作管理器"""
@@ -93,11 +93,8 @@ class ClipboardManager:
 
     @safe_execute(default_return="")
     def _save_temp_image(self, img: Image.Image) -> str:
-        """保存临时图片文件"""
-        temp_dir = tempfile.gettempdir()
-        temp_path = os.path.join(temp_dir, f"clipboard_image_{os.getpid()}.png")
-        img.save(temp_path, 'PNG')
-        return temp_path
+        """保存临时图片文件（守护进程通过路径读取，使用最快的 PNG 压缩级别）"""
+        return save_temp_image(img)
 
     @safe_execute(default_return="")
     def _save_image_from_clipboard(self) -> str:
@@ -142,20 +139,8 @@ class ClipboardManager:
     def _process_dib_data(self, data: bytes) -> str:
         """处理DIB格式数据"""
         try:
-            # 创建BMP文件头
-            bmp_header = b'BM'
-            file_size = len(data) + 14
-            bmp_header += file_size.to_bytes(4, 'little')
-            bmp_header += b'\x00\x00'  # Reserved
-            bmp_header += b'\x00\x00'  # Reserved
-            bmp_header += (54).to_bytes(4, 'little')  # Offset to pixel data
-
-            # 创建完整的BMP数据
-            bmp_data = bmp_header + data
-
-            # 使用PIL读取BMP数据
-            img = Image.open(io.BytesIO(bmp_data))
-            return self._save_temp_image(img)
+            # 直接解析 DIB 数据，不再拼接 BMP 文件头复制整份数据
+            return self._save_temp_image(dib_to_image(data))
         except Exception:
             return ""
 
@@ -3,17 +3,82 @@ import configparser
 from typing import Dict, Any, Optional
 
 class ConfigManager:
+    # 各场景的默认推理选项，可被 [options.<场景>] 配置段覆盖
+    DEFAULT_MODEL_OPTIONS = {
+        'tool': {"temperature": 0.3, "top_p": 0.9, "num_predict": 512},
+        'text': {"temperature": 0.7, "top_p": 0.9, "num_predict": 1024},
+        'vision': {"temperature": 0.5, "top_p": 0.9, "num_predict": 1024},
+        'ocr': {"temperature": 0.1, "top_p": 0.8, "num_predict": 512, "repeat_penalty": 1.1},
+    }
+
     def __init__(self, config_file: str = "model_config.ini"):
         self.config_file = config_file
         self.config = configparser.ConfigParser()
         self._load_config()
 
+    @property
+    def config_path(self) -> str:
+        """配置文件的完整路径"""
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), self.config_file)
+
     def _load_config(self):
         """加载配置文件"""
-        config_path = os.path.join(os.path.dirname(__file__), self.config_file)
+        config_path = self.config_path
         if os.path.exists(config_path):
             self.config.read(config_path, encoding='utf-8')
 
+    def update_section(self, section: str, values: Dict[str, Any]):
+        """
+        写回配置项并保留文件中的注释和顺序
+
+        已存在的键原地替换，不存在的键追加到该段末尾，不存在的段追加到文件末尾。
+
+        Args:
+            section: 配置段名
+            values: 要写入的键值
+        """
+        config_path = self.config_path
+        lines = []
+        if os.path.exists(config_path):
+            with open(config_path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+
+        pending = {key: str(value) for key, value in values.items()}
+        section_start = None
+        section_end = len(lines)
+        for index, line in enumerate(lines):
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                if section_start is not None:
+                    section_end = index
+                    break
+                if stripped[1:-1].strip() == section:
+                    section_start = index
+                continue
+            if section_start is None or stripped.startswith(('#', ';')) or '=' not in stripped:
+                continue
+            key = stripped.split('=', 1)[0].strip()
+            if key in pending:
+                lines[index] = f"{key} = {pending.pop(key)}"
+
+        new_lines = [f"{key} = {value}" for key, value in pending.items()]
+        if section_start is None:
+            if lines and lines[-1].strip():
+                lines.append('')
+            lines.extend([f"[{section}]"] + new_lines)
+        elif new_lines:
+            # 插在该段最后一个非空行之后
+            insert_at = section_end
+            while insert_at > section_start + 1 and not lines[insert_at - 1].strip():
+                insert_at -= 1
+            lines[insert_at:insert_at] = new_lines
+
+        with open(config_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        self.config = configparser.ConfigParser()
+        self._load_config()
+
     def get(self, section: str, key: str, fallback: Any = None) -> Any:
         """获取配置值"""
         return self.config.get(section, key, fallback=fallback)
@@ -68,7 +133,157 @@ class ConfigManager:
             'temp_directory': self.get('system', 'temp_directory', ''),
             'max_retries': self.get_int('system', 'max_retries', 3),
             'retry_delay': self.get_int('system', 'retry_delay', 2),
-            'connection_timeout': self.get_int('system', 'connection_timeout', 5)
+            'connection_timeout': self.get_int('system', 'connection_timeout', 5),
+            'read_timeout': self.get_float('system', 'read_timeout', 0.0),
+            'pool_max_connections': self.get_int('system', 'pool_max_connections', 10),
+            'keepalive_expiry': self.get_float('system', 'keepalive_expiry', 60.0),
+            'health_cache_ttl': self.get_float('system', 'health_cache_ttl', 30.0),
+            'startup_timeout': self.get_float('system', 'startup_timeout', 30.0)
+        }
+
+    def get_server_config(self) -> Dict[str, Any]:
+        """获取由 xs 启动的 Ollama 服务的启动参数（空字符串表示使用 Ollama 默认值）"""
+        return {
+            'num_parallel': self.get('server', 'num_parallel', ''),
+            'max_loaded_models': self.get('server', 'max_loaded_models', ''),
+            'keep_alive': self.get('server', 'keep_alive', ''),
+            'flash_attention': self.get('server', 'flash_attention', ''),
+            'context_length': self.get('server', 'context_length', ''),
+            'kv_cache_type': self.get('server', 'kv_cache_type', ''),
+            'num_thread': self.get_int('server', 'num_thread', 0)
+        }
+
+    def get_request_defaults(self) -> Dict[str, Any]:
+        """获取所有推理请求共用的默认选项（来自 [server] 配置）"""
+        defaults = {}
+        num_thread = self.get_server_config()['num_thread']
+        if num_thread > 0:
+            defaults['num_thread'] = num_thread
+        return defaults
+
+    @staticmethod
+    def _parse_option_value(value: str) -> Any:
+        """把配置中的选项值转换为 int/float/bool，无法转换时保留字符串"""
+        value = value.strip()
+        for cast in (int, float):
+            try:
+                return cast(value)
+            except ValueError:
+                pass
+        if value.lower() in ('true', 'false'):
+            return value.lower() == 'true'
+        return value
+
+    def get_model_options(self, scenario: str) -> Dict[str, Any]:
+        """获取场景的推理选项（num_ctx、num_thread、num_batch、采样参数等，不含 keep_alive）
+
+        优先级：[options.<场景>] > 场景默认值 > [server] 中的全局默认值
+        """
+        options = self.get_request_defaults()
+        options.update(self.DEFAULT_MODEL_OPTIONS.get(scenario, {}))
+        section = f'options.{scenario}'
+        if section in self.config:
+            for key, value in self.config.items(section):
+                if key == 'keep_alive' or not value.strip():
+                    continue
+                options[key] = self._parse_option_value(value)
+        return options
+
+    def get_keep_alive(self, scenario: str) -> Optional[str]:
+        """获取场景模型的 keep_alive，未配置时返回 None（使用服务端默认值）"""
+        value = self.get(f'options.{scenario}', 'keep_alive', '')
+        return value.strip() or None
+
+    def get_deadlines(self, scenario: str) -> Dict[str, float]:
+        """获取场景的响应时限（秒，0 表示不限制）
+
+        total: 整个请求的最长耗时；stall: 流式输出中两次收到内容之间的最长间隔
+        """
+        return {
+            'total': self.get_float('deadlines', scenario, 300.0),
+            'stall': self.get_float('deadlines', 'stall_timeout', 60.0)
+        }
+
+    def get_cache_config(self) -> Dict[str, Any]:
+        """获取响应缓存配置"""
+        return {
+            'enabled': self.get_boolean('cache', 'enabled', True),
+            'dir': self.get('cache', 'dir', ''),
+            'max_size_mb': self.get_float('cache', 'max_size_mb', 100.0),
+            'max_age_days': self.get_float('cache', 'max_age_days', 30.0),
+            'max_temperature': self.get_float('cache', 'max_temperature', 0.3),
+            'similar_max_distance': self.get_int('cache', 'similar_max_distance', 10),
+            'similar_max_pixels': self.get_int('cache', 'similar_max_pixels', 8),
+            'similar_max_entries': self.get_int('cache', 'similar_max_entries', 200)
+        }
+
+    def get_image_config(self) -> Dict[str, Any]:
+        """获取图片预处理配置"""
+        return {
+            'enabled': self.get_boolean('image', 'enabled', True),
+            'vision_max_side': self.get_int('image', 'vision_max_side', 1280),
+            'ocr_max_side': self.get_int('image', 'ocr_max_side', 2048),
+            'ocr_grayscale': self.get_boolean('image', 'ocr_grayscale', True),
+            'vision_format': self.get('image', 'vision_format', 'jpeg').strip().lower(),
+            'ocr_format': self.get('image', 'ocr_format', 'png').strip().lower(),
+            'jpeg_quality': self.get_int('image', 'jpeg_quality', 85),
+            'cache_dir': self.get('image', 'cache_dir', ''),
+            'cache_max_entries': self.get_int('image', 'cache_max_entries', 200),
+            'multi_max_images': self.get_int('image', 'multi_max_images', 16),
+            'multi_concurrency': max(1, self.get_int('image', 'multi_concurrency', 2)),
+            'multi_mode': self.get('image', 'multi_mode', 'parallel').strip().lower()
+        }
+
+    def get_ocr_config(self) -> Dict[str, Any]:
+        """获取分块 OCR 和批量 OCR 配置"""
+        return {
+            'tile_height': self.get_int('ocr', 'tile_height', 1024),
+            'tile_overlap': self.get_int('ocr', 'tile_overlap', 64),
+            'tile_concurrency': max(1, self.get_int('ocr', 'tile_concurrency', 2)),
+            'batch_concurrency': max(1, self.get_int('ocr', 'batch_concurrency', 2)),
+            'batch_output': self.get('ocr', 'batch_output', 'ocr_results.jsonl')
+        }
+
+    def get_session_config(self) -> Dict[str, Any]:
+        """获取命名会话配置"""
+        return {
+            'dir': self.get('session', 'dir', ''),
+            'ttl_hours': self.get_float('session', 'ttl_hours', 24.0),
+            'max_turns': self.get_int('session', 'max_turns', 10)
+        }
+
+    def get_backends(self) -> Dict[str, str]:
+        """获取 [backends] 中的后端列表（名称 -> "地址 [模型...]"）"""
+        if 'backends' not in self.config:
+            return {}
+        return dict(self.config.items('backends'))
+
+    def get_routing_config(self) -> Dict[str, Any]:
+        """获取多后端路由配置"""
+        return {
+            'eject_seconds': self.get_float('routing', 'eject_seconds', 30.0),
+            'max_eject_seconds': self.get_float('routing', 'max_eject_seconds', 300.0),
+            'latency_alpha': self.get_float('routing', 'latency_alpha', 0.3),
+            'ps_ttl': self.get_float('routing', 'ps_ttl', 2.0)
+        }
+
+    def get_router_config(self) -> Dict[str, Any]:
+        """获取场景路由配置"""
+        return {
+            'mode': self.get('router', 'mode', 'rules').strip().lower(),
+            'embedding_model': self.get('router', 'embedding_model', 'nomic-embed-text'),
+            'min_margin': self.get_float('router', 'min_margin', 0.03),
+            'timeout': self.get_float('router', 'timeout', 3.0),
+            'max_chars': self.get_int('router', 'max_chars', 1000)
+        }
+
+    def get_daemon_config(self) -> Dict[str, Any]:
+        """获取常驻守护进程配置"""
+        return {
+            'socket_path': self.get('daemon', 'socket_path', ''),
+            'connect_timeout': self.get_float('daemon', 'connect_timeout', 0.2),
+            'scheduler_max_skips': self.get_int('daemon', 'scheduler_max_skips', 3),
+            'scheduler_pin': self.get_boolean('daemon', 'scheduler_pin', True)
         }
 
     def get_security_config(self) -> Dict[str, Any]:
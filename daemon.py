@@ -0,0 +1,245 @@
+"""
+小帅常驻守护进程
+通过 Unix 域套接字接收 xs 客户端的请求，复用常驻内存的 SmartAgent、模型客户端和工具注册表
+
+协议：客户端发送一行 JSON（argv、cwd、clipboard、tty），服务端将输出以 UTF-8 文本流式写回，
+写完后关闭连接。
+"""
+import os
+import sys
+import json
+import codecs
+import socket
+import asyncio
+import tempfile
+import contextlib
+
+
+def get_socket_path() -> str:
+    """获取守护进程套接字路径"""
+    from config_manager import config
+    socket_path = config.get_daemon_config()['socket_path']
+    if socket_path:
+        return socket_path
+    uid = os.getuid() if hasattr(os, 'getuid') else os.getpid()
+    return os.path.join(tempfile.gettempdir(), f"xshuai_{uid}.sock")
+
+
+def is_supported() -> bool:
+    """当前平台是否支持 Unix 域套接字"""
+    return hasattr(socket, 'AF_UNIX')
+
+
+class _SocketStdout:
+    """把 stdout 写入转发到客户端连接"""
+
+    encoding = 'utf-8'
+
+    def __init__(self, writer: asyncio.StreamWriter, tty: bool = False):
+        self._writer = writer
+        self._tty = tty
+
+    def write(self, text):
+        if not self._writer.is_closing():
+            self._writer.write(text.encode('utf-8', errors='replace'))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        # 反映客户端的 stdout 是否为终端，决定流式输出按时间预算刷新还是按块缓冲
+        return self._tty
+
+
+async def serve(handler, on_request_done=None, classify=None):
+    """
+    启动守护进程并处理请求
+
+    Args:
+        handler: 执行一次命令的协程函数，签名为 handler(args, cwd=..., clipboard_content=...)
+        on_request_done: 每次请求结束后调用的协程函数（例如清空Agent记忆）
+        classify: 返回请求将使用的模型名的协程函数，签名为 classify(args, clipboard_content)；
+                  提供时按模型驻留情况调度排队的请求，否则按到达顺序执行
+    """
+    if not is_supported():
+        print("当前平台不支持Unix域套接字，无法启动守护进程")
+        return
+
+    socket_path = get_socket_path()
+    if os.path.exists(socket_path):
+        probe = _connect(socket_path, timeout=0.5)
+        if probe is not None:
+            probe.close()
+            print(f"守护进程已在运行: {socket_path}")
+            return
+        # 上次异常退出留下的套接字文件
+        os.unlink(socket_path)
+
+    # 同一时刻只处理一个请求：stdout 重定向和工作目录都是进程级状态；
+    # 排队的请求由调度器按模型驻留情况决定执行顺序，减少模型换入换出
+    from utils.model_scheduler import ModelScheduler
+    from config_manager import config
+    daemon_config = config.get_daemon_config()
+    scheduler = ModelScheduler(max_skips=daemon_config['scheduler_max_skips'] if classify else 0,
+                               pin=bool(classify) and daemon_config['scheduler_pin'],
+                               report=lambda line: print(line, flush=True))
+    stop_event = asyncio.Event()
+
+    async def handle_client(reader, writer):
+        try:
+            line = await reader.readline()
+            if not line:
+                # 探测连接，没有请求内容
+                writer.close()
+                return
+            request = json.loads(line.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError) as e:
+            writer.write(f"无效的请求: {e}\n".encode('utf-8'))
+            await writer.drain()
+            writer.close()
+            return
+
+        if request.get('command') == 'stats':
+            from utils.backend_router import get_router
+            lines = scheduler.describe()
+            if get_router().is_multi:
+                lines += get_router().describe()
+            writer.write(("\n".join(lines) + "\n").encode('utf-8'))
+            await writer.drain()
+            writer.close()
+            return
+
+        if request.get('command') == 'shutdown':
+            writer.write("守护进程正在退出\n".encode('utf-8'))
+            await writer.drain()
+            writer.close()
+            stop_event.set()
+            return
+
+        model = None
+        if classify is not None:
+            try:
+                model = await classify(request.get('argv', []), request.get('clipboard'))
+            except Exception:
+                model = None
+
+        async with scheduler.slot(model):
+            previous_cwd = os.getcwd()
+            cwd = request.get('cwd') or previous_cwd
+            try:
+                os.chdir(cwd)
+                with contextlib.redirect_stdout(_SocketStdout(writer, bool(request.get('tty')))):
+                    await _run_until_disconnect(
+                        handler(request.get('argv', []), cwd=cwd,
+                                clipboard_content=request.get('clipboard')),
+                        reader)
+            except Exception as e:
+                if not writer.is_closing():
+                    writer.write(f"守护进程处理请求出错: {e}\n".encode('utf-8'))
+            finally:
+                os.chdir(previous_cwd)
+                if on_request_done is not None:
+                    try:
+                        await on_request_done()
+                    except Exception:
+                        pass
+
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    server = await asyncio.start_unix_server(handle_client, path=socket_path)
+    os.chmod(socket_path, 0o600)
+    print(f"小帅守护进程已启动，监听: {socket_path}")
+    try:
+        async with server:
+            await stop_event.wait()
+    finally:
+        await scheduler.close()
+        for line in scheduler.describe():
+            print(line)
+        with contextlib.suppress(OSError):
+            os.unlink(socket_path)
+        print("小帅守护进程已退出")
+
+
+async def _run_until_disconnect(coro, reader: asyncio.StreamReader):
+    """
+    执行请求，客户端断开（例如在 xs 中按 Ctrl-C）时取消请求
+
+    取消会传递到正在进行的 Ollama 流式请求，连接被关闭后服务端立即停止生成。
+    """
+    task = asyncio.ensure_future(coro)
+    # 客户端发送请求后不再写入数据，读到 EOF 即表示连接已断开
+    disconnected = asyncio.ensure_future(reader.read(1))
+    try:
+        await asyncio.wait({task, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    finally:
+        disconnected.cancel()
+
+
+def _connect(socket_path: str, timeout: float):
+    """连接守护进程，失败时返回 None"""
+    if not is_supported() or not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def forward_request(args, clipboard_content=None, command=None) -> bool:
+    """
+    把一次 xs 调用转发给守护进程，并把结果流式写到 stdout
+
+    Args:
+        args: 命令参数（不含程序名）
+        clipboard_content: 客户端读取的剪贴板内容
+        command: 控制命令（例如 'shutdown'）
+
+    Returns:
+        bool: 守护进程是否处理了该请求；False 表示调用方应在本进程中执行
+    """
+    from config_manager import config
+    sock = _connect(get_socket_path(), config.get_daemon_config()['connect_timeout'])
+    if sock is None:
+        return False
+
+    request = {
+        'argv': list(args),
+        'cwd': os.path.abspath(os.getcwd()),
+        'clipboard': clipboard_content,
+        'tty': sys.stdout.isatty(),
+    }
+    if command:
+        request['command'] = command
+
+    out = sys.stdout.buffer if hasattr(sys.stdout, 'buffer') else None
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    try:
+        sock.settimeout(None)
+        sock.sendall(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            if out is not None:
+                out.write(data)
+                out.flush()
+            else:
+                sys.stdout.write(decoder.decode(data))
+                sys.stdout.flush()
+    finally:
+        sock.close()
+    return True
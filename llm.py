@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 from agentscope.model import OllamaChatModel
 from config_manager import config
+from utils.ollama_transport import share_client, model_client_kwargs
 
 # 导入增强的静音模型
 try:
@@ -18,53 +19,49 @@ class XXzhouModel():
         # Ollama不需要API密钥，使用本地模型
         self.model_config = config.get_models()
 
+    @staticmethod
+    def model_kwargs(scenario: str) -> dict:
+        """获取场景模型的 options 和 keep_alive（来自 [options.<场景>] 配置）及共享传输层的 client_kwargs
+
+        未配置 keep_alive 时显式传 None：OllamaChatModel 的默认值 "5m" 会随每个请求发出，
+        覆盖 [server] keep_alive 设置的服务端默认值；None 不会发送，与原生文本路径一致
+        """
+        return {"options": config.get_model_options(scenario),
+                "keep_alive": config.get_keep_alive(scenario),
+                "client_kwargs": model_client_kwargs()}
+
     def get_tool_calling_model(self):
         """获取专门用于工具调用的模型"""
-        return OllamaChatModel(
+        return share_client(OllamaChatModel(
             model_name=self.model_config['tool'],
             stream=True,
-            options={
-                "temperature": 0.3,  # 工具调用需要更确定性
-                "top_p": 0.9,
-                "num_predict": 512   # 工具调用通常不需要太长输出
-            }
-        )
+            **self.model_kwargs('tool')
+        ))
 
     def get_general_text_model(self):
         """获取通用文本生成模型"""
-        return OllamaChatModel(
+        return share_client(OllamaChatModel(
             model_name=self.model_config['text'],
             stream=True,
-            options={
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "num_predict": 1024
-            }
-        )
+            **self.model_kwargs('text')
+        ))
 
     def get_vision_model(self):
         """获取视觉识别模型"""
         if ENHANCED_MODE:
             # 使用静音模型，彻底解决 thinking 警告
-            return SilentOllamaChatModel(
+            return share_client(SilentOllamaChatModel(
                 model_name=self.model_config['vision'],
                 stream=True,
-                options={
-                    "temperature": 0.5,
-                    "top_p": 0.9,
-                    "num_predict": 1024
-                }
-            )
+                **self.model_kwargs('vision')
+            ))
         else:
             # 回退到原始实现（保留现有的stop参数）
-            return OllamaChatModel(
+            kwargs = self.model_kwargs('vision')
+            # 禁用thinking模式以避免警告
+            kwargs["options"]["stop"] = ["<thinking>", "</thinking>"]
+            return share_client(OllamaChatModel(
                 model_name=self.model_config['vision'],
                 stream=True,
-                options={
-                    "temperature": 0.5,
-                    "top_p": 0.9,
-                    "num_predict": 1024,
-                    # 禁用thinking模式以避免警告
-                    "stop": ["<thinking>", "</thinking>"]
-                }
-            )
+                **kwargs
+            ))
@@ -4,6 +4,7 @@
 """
 from agentscope.model import OllamaChatModel
 from agentscope.message import Msg, TextBlock
+from utils.ollama_transport import share_client
 import logging
 
 class SilentOllamaChatModel(OllamaChatModel):
@@ -137,15 +138,11 @@ class EnhancedXXzhouModel:
         Returns:
             SilentOllamaChatModel: 配置了静音处理的视觉模型
         """
-        return SilentOllamaChatModel(
+        return share_client(SilentOllamaChatModel(
             model_name=self.model_config['vision'],
             stream=True,
-            options={
-                "temperature": 0.5,
-                "top_p": 0.9,
-                "num_predict": 1024
-            }
-        )
+            **self.original_model.model_kwargs('vision')
+        ))
 
     def get_silent_text_model(self):
         """
@@ -154,15 +151,11 @@ class EnhancedXXzhouModel:
         Returns:
             SilentOllamaChatModel: 配置了静音处理的文本模型
         """
-        return SilentOllamaChatModel(
-            model_name=self.model_config['text_model'],
+        return share_client(SilentOllamaChatModel(
+            model_name=self.model_config['text'],
             stream=True,
-            options={
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "num_predict": 1024
-            }
-        )
+            **self.original_model.model_kwargs('text')
+        ))
 
     def get_silent_tool_calling_model(self):
         """
@@ -171,30 +164,21 @@ class EnhancedXXzhouModel:
         Returns:
             SilentOllamaChatModel: 配置了静音处理的工具调用模型
         """
-        return SilentOllamaChatModel(
-            model_name=self.model_config['tool_model'],
+        return share_client(SilentOllamaChatModel(
+            model_name=self.model_config['tool'],
             stream=True,
-            options={
-                "temperature": 0.3,
-                "top_p": 0.9,
-                "num_predict": 512
-            }
-        )
+            **self.original_model.model_kwargs('tool')
+        ))
 
     def get_ocr_model(self):
         """
-        获取专用的 OCR 模型（优化参数配置）
+        获取专用的 OCR 模型（优化参数配置，见 [options.ocr]）
 
         Returns:
             SilentOllamaChatModel: 专门用于 OCR 的模型
         """
-        return SilentOllamaChatModel(
+        return share_client(SilentOllamaChatModel(
             model_name=self.model_config.get('ocr', self.model_config['vision']),
             stream=True,
-            options={
-                "temperature": 0.1,  # OCR 需要更高的确定性
-                "top_p": 0.8,      # 降低随机性
-                "num_predict": 512,  # OCR 输出通常较短
-                "repeat_penalty": 1.1  # 避免重复
-            }
-        )
\ No newline at end of file
+            **self.original_model.model_kwargs('ocr')
+        ))
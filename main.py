@@ -1,28 +1,12 @@
-import sys,asyncio,os
+import sys,asyncio,os,subprocess
 import warnings
 import logging
-import atexit
-from agents.agent import agent
-from agentscope.message import Msg
-from ollama import Client
+from utils.startup_profiler import profiler
 from decorators import safe_execute, retry_on_failure
 from config_manager import config
 
-# 全局变量用于保持Ollama日志文件句柄打开
-_ollama_log_handle = None
-
-def close_ollama_log():
-    """安全关闭Ollama日志文件句柄"""
-    global _ollama_log_handle
-    if _ollama_log_handle and not _ollama_log_handle.closed:
-        try:
-            _ollama_log_handle.close()
-        except Exception:
-            pass
-        _ollama_log_handle = None
-
-# 注册清理函数
-atexit.register(close_ollama_log)
+# 文本场景只需要 config 和 ollama 客户端；agentscope、Agent 栈和 PIL 都在实际用到时才导入
+profiler.mark("config load")
 
 # 设置环境变量来抑制警告
 os.environ['PYTHONWARNINGS'] = 'ignore'
@@ -34,20 +18,15 @@ warnings.filterwarnings("ignore")
 logging.basicConfig(level=logging.ERROR)
 logging.getLogger().setLevel(logging.ERROR)
 
-# 尝试导入PIL ImageGrab for better clipboard handling
-try:
-    from PIL import ImageGrab
-except ImportError:
-    ImageGrab = None
-
 # Set UTF-8 encoding for stdout to handle Unicode properly
-if sys.stdout.encoding != 'utf-8':
+# 编码在启动时统一设置一次（无法编码的字符直接替换），之后的输出无需逐次处理 UnicodeEncodeError
+if sys.stdout.encoding != 'utf-8' or sys.stdout.errors != 'replace':
     try:
-        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
     except AttributeError:
         # For older Python versions or when reconfigure is not available
         import io
-        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
 
 # 完全重写stderr来过滤thinking警告
 class FilteredStderr:
@@ -70,147 +49,88 @@ class FilteredStderr:
 sys.stderr = FilteredStderr(sys.stderr)
 
 # 如果过滤器还不能完全抑制警告，尝试更激进的方法
-import os
 if os.name == 'nt':  # Windows
-    import subprocess
     subprocess.Popen('', shell=True)  # 防止stderr被完全关闭
 
 def safe_print(text, end='\n', flush=True):
-    """Safely print text to console with UTF-8 encoding"""
-    try:
-        print(text, end=end, flush=flush)
-    except UnicodeEncodeError:
-        # Fallback: remove problematic characters
-        cleaned_text = ''.join(char for char in text if ord(char) < 65536)
-        print(cleaned_text, end=end, flush=flush)
+    """Safely print text to console with UTF-8 encoding
+
+    stdout 在启动时已设置为 errors='replace'，这里不再需要逐次捕获编码错误；
+    逐 token 的流式输出请使用 utils.terminal_writer.TerminalWriter
+    """
+    print(text, end=end, flush=flush)
 
 @safe_execute(default_return=False, exceptions=(ConnectionError, TimeoutError, OSError))
 def is_ollama_running():
-    """检查Ollama服务是否正在运行，支持VPN环境"""
-    import subprocess
-    import socket
-
-    # 从配置获取端口
-    system_config = config.get_system_config()
-    ollama_port = system_config['ollama_port']
-    ollama_host = system_config['ollama_host']
-
-    # 方法1：检查端口是否被监听（最快）
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(system_config['connection_timeout'])
-        result = sock.connect_ex((ollama_host, ollama_port))
-        sock.close()
-        if result == 0:
-            return True
-    except (socket.error, OSError) as e:
-        logging.debug(f"Port check failed: {e}")
-
-    # 方法2：检查进程是否存在
-    try:
-        result = subprocess.run(['tasklist', '/FI', 'IMAGENAME eq ollama.exe'],
-                              capture_output=True, text=True, timeout=2)
-        if 'ollama.exe' in result.stdout:
-            return True
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError, OSError) as e:
-        logging.debug(f"Process check failed: {e}")
-
-    return False
+    """检查Ollama服务是否已就绪（TTL 内的健康记录直接复用，否则探测 /api/version）"""
+    from utils.ollama_health import is_ollama_ready
+    return is_ollama_ready()
 
 @safe_execute(default_return=False, exceptions=(subprocess.TimeoutExpired, FileNotFoundError, OSError, PermissionError))
 def ensure_ollama_running():
     """确保Ollama服务正在运行，如果未运行则启动它"""
+    from utils import ollama_health
+    from utils.backend_router import uses_local_backend
+
+    # [backends] 中只有远程后端时不需要本机 Ollama，远程后端的健康由路由器负责
+    if not uses_local_backend():
+        return True
+
     safe_print("检查 Ollama 服务状态...")
     # 首先检查Ollama是否已经在运行
+    cache_fresh = ollama_health.is_health_cache_fresh()
     if is_ollama_running():
         safe_print("Ollama 服务已在运行")
+        if not cache_fresh:
+            # 健康缓存过期后的首次确认：提示运行中服务与 [server] 配置不一致的启动参数
+            for line in ollama_health.describe_server_profile(only_mismatch=True):
+                safe_print(line)
         return True
-    safe_print("Ollama 服务未运行，尝试启动...")
+
+    # 进程已存在但尚未就绪（例如刚刚启动），等待就绪而不是重复启动
+    if ollama_health.is_ollama_process_running():
+        safe_print("Ollama 进程已存在，等待服务就绪...")
+        if ollama_health.wait_until_ready():
+            safe_print("Ollama 服务已就绪")
+            return True
+        safe_print("Ollama 进程存在但服务未响应，尝试重新启动...")
+    else:
+        safe_print("Ollama 服务未运行，尝试启动...")
 
     # 检查ollama命令是否存在
-    try:
-        import subprocess
-        result = subprocess.run(['ollama', '--version'], capture_output=True, text=True, timeout=5)
-        if result.returncode != 0:
-            safe_print("错误: 未找到Ollama命令。请确保已安装Ollama。")
-            return False
-    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
-        safe_print(f"错误: 未找到Ollama命令。请确保已安装Ollama。详情: {e}")
+    if not ollama_health.is_ollama_installed():
+        safe_print("错误: 未找到Ollama命令。请确保已安装Ollama。")
         return False
 
-    # 启动Ollama服务
+    # 启动Ollama服务（跨进程加锁，并发的 xs 调用只会启动一个服务）
     try:
         safe_print("检测到Ollama服务未运行，正在启动...")
-        import subprocess
-        import os
-        import datetime
-
-        # 创建logs目录
-        logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
-        if not os.path.exists(logs_dir):
-            os.makedirs(logs_dir)
-
-        # 生成带时间戳的日志文件名
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_file = os.path.join(logs_dir, f"ollama_{timestamp}.log")
-
-        # 检测是否需要VPN兼容模式
-        vpn_mode = False
-        try:
-            # 检查是否有VPN网络接口（简单检测）
-            result = subprocess.run(['ipconfig'], capture_output=True, text=True, timeout=5)
-            if 'VPN' in result.stdout or 'Tunnel' in result.stdout:
-                vpn_mode = True
-                safe_print("检测到VPN环境，使用兼容模式启动...")
-        except:
-            pass
-
-        # 打开日志文件用于写入并存储为全局变量
-        global _ollama_log_handle
-        if _ollama_log_handle:
-            close_ollama_log()  # 先关闭之前的句柄
-
-        try:
-            _ollama_log_handle = open(log_file, 'w', encoding='utf-8')
-        except Exception as e:
-            safe_print(f"无法创建日志文件 {log_file}: {e}")
-            _ollama_log_handle = None
-
-        # 启动Ollama服务
-        if vpn_mode:
-            # VPN兼容模式：监听所有接口
-            env = os.environ.copy()
-            env['OLLAMA_HOST'] = '0.0.0.0'
-            env['OLLAMA_ORIGINS'] = '*'
-            subprocess.Popen(['ollama', 'serve', '--host', '0.0.0.0', '--port', '11434'],
-                           stdout=_ollama_log_handle, stderr=_ollama_log_handle, env=env)
-        else:
-            # 标准模式
-            subprocess.Popen(['ollama', 'serve'], stdout=_ollama_log_handle, stderr=_ollama_log_handle)
-
-        safe_print(f"Ollama服务已在后台启动，日志保存至: {log_file}")
-
-        # 等待一小段时间确保 Ollama 开始监听端口
-        import time
-        time.sleep(2)
-        safe_print("等待 2 秒后继续执行...")
-
-        return True
-
+        return ollama_health.launch_ollama_server(report=safe_print)
     except Exception as e:
         safe_print(f"启动Ollama服务时出错: {e}")
         return False
 
-def save_clipboard_image():
-    """Save clipboard image to temporary file and return path"""
+def read_clipboard_image():
+    """
+    读取剪贴板中的图片
+
+    Returns:
+        内存中的 ClipboardImage；剪贴板中是图片文件时返回文件路径；没有图片时返回空字符串
+    """
     import time
+    from utils.clipboard_image import ClipboardImage, dib_to_image
+
+    # 尝试导入PIL ImageGrab for better clipboard handling
+    try:
+        from PIL import ImageGrab
+    except ImportError:
+        ImageGrab = None
 
     max_attempts = 2  # 最多尝试2次
 
     for attempt in range(max_attempts):
         try:
             import win32clipboard
-            import tempfile
             import os
             from PIL import Image
             import io
@@ -229,10 +149,7 @@ def save_clipboard_image():
                     img = ImageGrab.grabclipboard()
                     if img is not None:
                         if isinstance(img, Image.Image):
-                            temp_dir = tempfile.gettempdir()
-                            temp_image_path = os.path.join(temp_dir, f"clipboard_image_{os.getpid()}.png")
-                            img.save(temp_image_path, 'PNG')
-                            return temp_image_path
+                            return ClipboardImage(img)
                         elif isinstance(img, list) and len(img) > 0:
                             # Handle case where clipboard contains file paths
                             first_file = img[0]
@@ -299,44 +216,20 @@ def save_clipboard_image():
                         try:
                             data = win32clipboard.GetClipboardData(fmt)
                             if data:
-                                # Create a temporary file to save the image
-                                temp_dir = tempfile.gettempdir()
-                                temp_image_path = os.path.join(temp_dir, f"clipboard_image_{os.getpid()}.png")
-
-                                # Handle DIB format
+                                # Handle DIB format（直接解析 DIB 数据，不再拼接 BMP 文件头）
                                 if fmt == win32clipboard.CF_DIB:
                                     try:
-                                        from io import BytesIO
-
-                                        # Create a BMP file in memory from DIB data
-                                        bmp_header = b'BM'  # BMP signature
-
-                                        # Calculate file size
-                                        file_size = len(data) + 14  # 14 bytes for BMP header
-                                        bmp_header += file_size.to_bytes(4, 'little')
-                                        bmp_header += b'\x00\x00'  # Reserved
-                                        bmp_header += b'\x00\x00'  # Reserved
-                                        bmp_header += (54).to_bytes(4, 'little')  # Offset to pixel data
-
-                                        # Create complete BMP data
-                                        bmp_data = bmp_header + data
-
-                                        # Use PIL to read the BMP data
-                                        img = Image.open(BytesIO(bmp_data))
-                                        img.save(temp_image_path, 'PNG')
-                                        return temp_image_path
-
+                                        return ClipboardImage(dib_to_image(data), raw=data)
                                     except Exception as e:
                                         continue
 
-                                # Handle other formats - try to save directly
+                                # Handle other formats - decode in memory
                                 else:
                                     try:
-                                        # Try to save as image
                                         if isinstance(data, bytes):
                                             img = Image.open(io.BytesIO(data))
-                                            img.save(temp_image_path, 'PNG')
-                                            return temp_image_path
+                                            img.load()
+                                            return ClipboardImage(img, raw=data)
                                     except Exception as e:
                                         continue
 
@@ -367,8 +260,19 @@ def save_clipboard_image():
 
     return ""
 
-def get_clipboard_content():
-    """Get clipboard content (text or image path) from Windows clipboard"""
+def save_clipboard_image():
+    """Save clipboard image to temporary file and return path"""
+    from utils.clipboard_image import ClipboardImage
+
+    image = read_clipboard_image()
+    return image.path() if isinstance(image, ClipboardImage) else image
+
+def get_clipboard_content(keep_image_in_memory=False):
+    """Get clipboard content (text or image path) from Windows clipboard
+
+    Args:
+        keep_image_in_memory: 剪贴板中是图片时返回内存中的 ClipboardImage 而不是临时文件路径
+    """
     import time
 
     max_retries = 3
@@ -436,7 +340,7 @@ def get_clipboard_content():
                     pass
 
                 # Check for image content
-                image_path = save_clipboard_image()
+                image_path = read_clipboard_image() if keep_image_in_memory else save_clipboard_image()
                 if image_path:
                     return image_path
 
@@ -466,14 +370,76 @@ def get_clipboard_content():
 
     return ""
 
-async def stream_response(msg):
-    """真正的流式输出响应"""
+def build_user_msg(content):
+    """构建发送给 AgentScope Agent 的用户消息（仅在非文本场景导入 agentscope）"""
+    from agentscope.message import Msg
+    return Msg(name="user", role="user", content=content)
+
+def agent_result_text(res):
+    """提取 Agent 返回结果中的文本内容（忽略thinking块），用于记录会话"""
+    if isinstance(res.content, str):
+        return res.content
+    parts = []
+    for content in res.content or []:
+        if isinstance(content, dict) and content.get('type') == 'text':
+            parts.append(content.get('text', ''))
+    return "\n".join(part for part in parts if part)
+
+async def load_session_history(target_agent, session):
+    """把会话最近的对话注入 Agent 记忆，使工具、视觉等场景也能理解追问"""
+    from agentscope.message import Msg
+    history = session.recent_turns()
+    if history:
+        await target_agent.memory.add([
+            Msg(name=turn['role'], role=turn['role'], content=turn['content']) for turn in history
+        ])
+
+def display_agent_result(res):
+    """显示 Agent 返回结果中的文本内容，忽略thinking块"""
+    if res.content and len(res.content) > 0:
+        # 只显示文本内容，忽略thinking块
+        text_displayed = False
+        for content in res.content:
+            if isinstance(content, dict):
+                # 跳过thinking块
+                if content.get('type') == 'thinking':
+                    continue
+                elif 'text' in content:
+                    safe_print(content['text'])
+                    text_displayed = True
+                elif 'content' in content:
+                    safe_print(content['content'])
+                    text_displayed = True
+                elif content.get('type') == 'text':
+                    safe_print(content.get('text', str(content)))
+                    text_displayed = True
+                else:
+                    # 如果是其他类型但不是thinking，也显示
+                    if content.get('type') != 'thinking':
+                        safe_print(str(content))
+                        text_displayed = True
+            else:
+                # 非字典类型，直接显示
+                safe_print(str(content))
+                text_displayed = True
+
+        if not text_displayed:
+            safe_print("处理完成，但没有可显示的文本内容")
+    else:
+        safe_print("无响应内容")
+
+async def stream_response(full_content, session=None):
+    """真正的流式输出响应
+
+    Args:
+        full_content: 用户输入（末尾附带"当前目录为：..."）
+        session: 命名会话（xs -s <名称>），None 表示无状态的单次调用
+    """
     try:
-        # Get the current working agent
-        from agents.smart_agent import smart_agent
+        # Get the current working agent（只做路由，不构建任何Agent）
+        from agents.smart_agent import get_smart_agent
+        smart_agent = get_smart_agent()
 
-        # Extract original user input (without directory info)
-        full_content = msg.content if isinstance(msg.content, str) else str(msg.content)
         # Remove the directory suffix to get original user input
         if "当前目录为：" in full_content:
             user_input = full_content.split("当前目录为：")[0].strip()
@@ -481,140 +447,222 @@ async def stream_response(msg):
             user_input = full_content
 
         # Detect scenario and get appropriate agent
-        scenario = smart_agent._detect_scenario(user_input)
+        scenario = await smart_agent._detect_scenario(user_input)
+        profiler.mark("routing")
 
         print(f"[系统] 检测到场景类型: {scenario}")
         print(f"[系统] 当前使用模型: {smart_agent.model_names[scenario]}")
 
         # For text-only scenarios, use native Ollama streaming
+        deadlines = config.get_deadlines(scenario)
+
         if scenario == 'text':
+            from utils.ollama_transport import iter_stream, request_keep_alive, StreamDeadlineExceeded
+            from utils.backend_router import get_routed_client
+            from utils.terminal_writer import TerminalWriter
+            from utils.response_cache import get_response_cache, is_cacheable, make_key, timing_metadata
+
             # Get the model name for direct Ollama call
             model_name = smart_agent.model_names[scenario]
 
             # Prepare messages for Ollama
             messages = [{"role": "user", "content": user_input}]
 
-            # Create Ollama client (不设置超时，避免影响流式输出)
-            client = Client()
+            # 相同模型、参数和输入直接返回缓存结果（会话中的回答依赖历史，不使用缓存）
+            options = config.get_model_options(scenario)
+            cache = get_response_cache()
+            cache_key = None
+            if session is None and cache is not None and is_cacheable(options):
+                cache_key = make_key(model_name, options, text=user_input)
+                cached = cache.get(cache_key)
+                if cached:
+                    safe_print("[系统] 命中响应缓存")
+                    profiler.mark("first byte")
+                    with TerminalWriter() as out:
+                        out.write(cached['text'])
+                    print()
+                    return
+
+            # 共享的带连接池的异步 Ollama 客户端，流式读取时不阻塞事件循环；
+            # 配置了多个 [backends] 时按模型驻留、延迟和负载选择后端，首个数据块之前失败会自动切换
+            client = get_routed_client()
 
             # Stream the response directly from Ollama
+            response_parts = []
+            final_chunk = None
             try:
                 safe_print("正在生成响应...")
-                stream = client.chat(
-                    model=model_name,
-                    messages=messages,
-                    stream=True
-                )
-
-                # Process the stream with real-time output
-                response_text = ""
-                for chunk in stream:
-                    if 'message' in chunk and 'content' in chunk['message']:
-                        content = chunk['message']['content']
+                out = TerminalWriter()
+                if session is not None:
+                    # 会话：generate 接口会返回 context，带上上一轮的 context 即可续写，无需重新预填充历史
+                    context = session.context_for(model_name)
+                    stream = await client.generate(
+                        model=model_name,
+                        prompt=user_input if context else session.build_prompt(user_input),
+                        context=context,
+                        stream=True,
+                        options=options,
+                        keep_alive=request_keep_alive(config.get_keep_alive(scenario))
+                    )
+                else:
+                    stream = await client.chat(
+                        model=model_name,
+                        messages=messages,
+                        stream=True,
+                        options=options,
+                        keep_alive=request_keep_alive(config.get_keep_alive(scenario))
+                    )
+
+                # 超时、Ctrl-C 或请求被取消时 iter_stream 会关闭连接，Ollama 随即停止生成
+                with out:
+                    async for chunk in iter_stream(stream, deadlines['total'], deadlines['stall']):
+                        content = chunk['response'] if session is not None else chunk['message']['content']
                         if content:
-                            # 立即输出每个字符
-                            safe_print(content, end='', flush=True)
-                            response_text += content
-
-                if response_text:
+                            if not response_parts:
+                                profiler.mark("first byte")
+                            # 合并写入：遇到换行或每 16 ms 刷新一次
+                            out.write(content)
+                            response_parts.append(content)
+                        if chunk['done']:
+                            final_chunk = chunk
+
+                if response_parts:
                     print()  # Final newline
+                    if cache_key:
+                        cache.put(cache_key, model_name, ''.join(response_parts), timing_metadata(final_chunk))
+                    if session is not None:
+                        session.add_turn(user_input, ''.join(response_parts), scenario, model_name,
+                                         final_chunk['context'] if final_chunk else None)
                 else:
                     safe_print("未收到有效响应")
 
+            except StreamDeadlineExceeded as e:
+                safe_print(f"\n[已中止] {e}")
+                return
+            except asyncio.CancelledError:
+                if response_parts:
+                    print()
+                safe_print("[已取消] 已停止生成")
+                raise
             except Exception as e:
+                from utils.ollama_health import invalidate_on_connection_error
+                invalidate_on_connection_error(e)
                 safe_print(f"\n连接 Ollama 服务失败: {e}")
                 safe_print("请检查 Ollama 服务是否正常启动...")
                 return
         else:
             # For tool/vision scenarios, use AgentScope with better feedback
+            msg = build_user_msg(full_content)
 
             # 直接调用相应的agent，避免重复检测场景
             if scenario == 'vision':
-                res = await smart_agent.vision_agent(msg)
+                target_agent = smart_agent.vision_agent
             elif scenario == 'tool':
-                res = await smart_agent.tool_agent(msg)
+                target_agent = smart_agent.tool_agent
+            elif scenario == 'ocr':
+                target_agent = smart_agent.ocr_agent
             else:
-                res = await smart_agent.text_agent(msg)
-
-            if res.content and len(res.content) > 0:
-                # 只显示文本内容，忽略thinking块
-                text_displayed = False
-                for content in res.content:
-                    if isinstance(content, dict):
-                        # 跳过thinking块
-                        if content.get('type') == 'thinking':
-                            continue
-                        elif 'text' in content:
-                            safe_print(content['text'])
-                            text_displayed = True
-                        elif 'content' in content:
-                            safe_print(content['content'])
-                            text_displayed = True
-                        elif content.get('type') == 'text':
-                            safe_print(content.get('text', str(content)))
-                            text_displayed = True
-                        else:
-                            # 如果是其他类型但不是thinking，也显示
-                            if content.get('type') != 'thinking':
-                                safe_print(str(content))
-                                text_displayed = True
-                    else:
-                        # 非字典类型，直接显示
-                        safe_print(str(content))
-                        text_displayed = True
+                target_agent = smart_agent.text_agent
 
-                if not text_displayed:
-                    safe_print("处理完成，但没有可显示的文本内容")
-            else:
-                safe_print("无响应内容")
+            if session is not None:
+                await load_session_history(target_agent, session)
+
+            # 模型输出边生成边显示（丢弃thinking块，工具调用显示进度）；
+            # 超时后取消 Agent 调用，正在进行的模型请求会随之断开
+            from utils.agent_stream import AgentStreamPrinter
+            printer = AgentStreamPrinter()
+            try:
+                with printer.attach(target_agent):
+                    res = await asyncio.wait_for(target_agent(msg), deadlines['total'] or None)
+            except asyncio.TimeoutError:
+                safe_print(f"[已中止] 响应超过总时限 {deadlines['total']:g} 秒")
+                return
+
+            # 首字已在 printer 收到第一个数据块时记录；没有流式输出时以完成时间为准（同名阶段只记录第一次）
+            profiler.mark("first byte")
+            if not printer.streamed(res):
+                display_agent_result(res)
+            if session is not None:
+                session.add_turn(user_input, agent_result_text(res), scenario)
 
     except Exception as e:
+        from utils.ollama_health import invalidate_on_connection_error
+        invalidate_on_connection_error(e)
         safe_print(f"Error in streaming response: {e}")
         # Fallback to regular response using AgentScope
         try:
-            res = await agent(msg)
-            if res.content and len(res.content) > 0:
-                # 只显示文本内容，忽略thinking块
-                text_displayed = False
-                for content in res.content:
-                    if isinstance(content, dict):
-                        # 跳过thinking块
-                        if content.get('type') == 'thinking':
-                            continue
-                        elif 'text' in content:
-                            safe_print(content['text'])
-                            text_displayed = True
-                        elif 'content' in content:
-                            safe_print(content['content'])
-                            text_displayed = True
-                        elif content.get('type') == 'text':
-                            safe_print(content.get('text', str(content)))
-                            text_displayed = True
-                        else:
-                            # 如果是其他类型但不是thinking，也显示
-                            if content.get('type') != 'thinking':
-                                safe_print(str(content))
-                                text_displayed = True
-                    else:
-                        # 非字典类型，直接显示
-                        safe_print(str(content))
-                        text_displayed = True
-
-                if not text_displayed:
-                    safe_print("处理完成，但没有可显示的文本内容")
-            else:
-                safe_print("无响应内容")
+            from agents.agent import agent
+            res = await agent(build_user_msg(full_content))
+            display_agent_result(res)
         except Exception as fallback_error:
             safe_print(f"回退响应错误: {fallback_error}")
 
-async def handle_ocr_command():
-    """Handle OCR-specific commands"""
+async def handle_ocr_batch(args, tiled=False):
+    """批量OCR：xs ocr <目录|通配符|图片>... [识别要求] [--out 结果文件] [-j 并发数]
+
+    Args:
+        args: 'ocr' 之后的参数
+        tiled: 批量识别不支持 --tiled，给出提示后按整张识别
+    """
+    from utils.ocr_batch import collect_images, is_batch_input, run_ocr_batch
+
+    ocr_config = config.get_ocr_config()
+    output_path = ocr_config['batch_output']
+    concurrency = ocr_config['batch_concurrency']
+    inputs, prompt_parts = [], []
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg in ('--out', '-o', '-j', '--jobs') and index + 1 < len(args):
+            if arg in ('--out', '-o'):
+                output_path = args[index + 1]
+            elif args[index + 1].isdigit():
+                concurrency = max(1, int(args[index + 1]))
+            index += 2
+            continue
+        if not prompt_parts and (is_batch_input(arg) or os.path.isfile(arg)):
+            inputs.append(arg)
+        else:
+            prompt_parts.append(arg)
+        index += 1
+
+    images = collect_images(inputs)
+    if not images:
+        safe_print(f"未找到图片文件: {' '.join(inputs)}")
+        return
+    if tiled:
+        safe_print("[系统] 批量识别不支持 --tiled，按整张图片识别")
+
+    safe_print(f"[批量OCR] 共 {len(images)} 张图片，并发 {concurrency}，结果写入 {os.path.abspath(output_path)}")
+    stats = await run_ocr_batch(images, " ".join(prompt_parts), output_path, concurrency)
+    safe_print(f"[批量OCR] 完成 {stats['done']} 张，跳过已识别 {stats['skipped']} 张，失败 {stats['failed']} 张")
+
+async def handle_ocr_command(args, clipboard_content=None, session=None):
+    """Handle OCR-specific commands
+
+    Args:
+        args: 命令参数（不含程序名），args[0] 为 'ocr'
+        clipboard_content: 客户端预先读取的剪贴板内容（守护进程模式下使用）
+        session: 命名会话，识别结果会记录到会话中供后续追问
+    """
     import os
 
+    # --tiled：长截图、文档扫描件分块识别
+    tiled = '--tiled' in args
+    args = [arg for arg in args if arg != '--tiled']
+
+    # 目录、通配符或多个图片文件（shell 已展开通配符）：批量识别
+    if len(args) >= 2:
+        from utils.ocr_batch import is_batch_input
+        if is_batch_input(args[1]) or (len(args) >= 3 and os.path.isfile(args[1]) and os.path.isfile(args[2])):
+            await handle_ocr_batch(args[1:], tiled)
+            return
+
     # Check if we have an image path or should use clipboard
-    if len(sys.argv) == 2:
-        # xs ocr - use clipboard
-        clipboard_content = get_clipboard_content()
+    if len(args) == 1:
+        # xs ocr - use clipboard（本进程读取时截图留在内存中，不写临时文件）
+        if clipboard_content is None:
+            clipboard_content = get_clipboard_content(keep_image_in_memory=True)
         if not clipboard_content:
             safe_print("剪贴板为空或无法读取内容")
             safe_print("提示：请确保已复制图片到剪贴板，或使用 'xs ocr <图片路径>'")
@@ -622,9 +670,11 @@ async def handle_ocr_command():
 
         image_path = clipboard_content
         prompt = "请识别图片中的所有文字内容。"
-    elif len(sys.argv) >= 3:
+        from_clipboard = True
+    elif len(args) >= 2:
         # xs ocr <image_path> [prompt]
-        image_path = sys.argv[2]
+        image_path = args[1]
+        from_clipboard = False
 
         # Check if image path exists
         if not os.path.exists(image_path):
@@ -632,28 +682,42 @@ async def handle_ocr_command():
             return
 
         # Get prompt if provided
-        if len(sys.argv) > 3:
-            prompt = " ".join(sys.argv[3:])
+        if len(args) > 2:
+            prompt = " ".join(args[2:])
         else:
             prompt = "请识别图片中的所有文字内容。"
     else:
-        safe_print("OCR命令格式: xs ocr [图片路径] [可选: 识别要求]")
+        safe_print("OCR命令格式: xs ocr [--tiled] [图片路径] [可选: 识别要求]")
         safe_print("示例1: xs ocr (使用剪贴板图片)")
         safe_print("示例2: xs ocr image.png")
         safe_print("示例3: xs ocr image.png 提取表格内容")
+        safe_print("示例4: xs ocr --tiled long_screenshot.png (长截图分块识别)")
+        safe_print("示例5: xs ocr receipts/ --out receipts.jsonl -j 4 (批量识别目录或通配符，可断点续跑)")
         return
 
     # Import OCR utilities
     try:
-        from utils.ocr_utils import ocr_image
+        from utils.ocr_utils import run_ocr, run_clipboard_ocr
     except ImportError:
         safe_print("错误: OCR功能未正确配置")
         return
 
-    # Perform OCR
+    # Perform OCR（剪贴板截图额外按感知哈希查找近似截图的识别结果；调用模型时识别结果边生成边显示）
+    from utils.agent_stream import AgentStreamPrinter
+    printer = AgentStreamPrinter()
     try:
-        result = await ocr_image(prompt, image_path)
-        if result.content and len(result.content) > 0:
+        if from_clipboard:
+            result = await run_clipboard_ocr(prompt, image_path, printer, tiled)
+        else:
+            result = await run_ocr(prompt, image_path, printer, tiled)
+        if result.metadata and 'distance' in result.metadata:
+            safe_print(f"[系统] 命中近似截图的识别结果（汉明距离 {result.metadata['distance']}）")
+        elif result.metadata and result.metadata.get('cached'):
+            safe_print("[系统] 命中响应缓存")
+        if result.metadata and result.metadata.get('streamed'):
+            if session is not None:
+                session.add_turn(f"识别图片 {image_path} 中的文字：{prompt}", agent_result_text(result), 'ocr')
+        elif result.content and len(result.content) > 0:
             for content in result.content:
                 if isinstance(content, dict) and 'text' in content:
                     safe_print(content['text'])
@@ -661,13 +725,127 @@ async def handle_ocr_command():
                     safe_print(content.text)
                 else:
                     safe_print(str(content))
+            if session is not None and result.metadata is not None:
+                session.add_turn(f"识别图片 {image_path} 中的文字：{prompt}", agent_result_text(result), 'ocr')
         else:
             safe_print("OCR完成，但未提取到文字内容")
     except Exception as e:
         safe_print(f"OCR处理错误: {e}")
 
 async def main():
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+
+    # 常驻守护进程模式：预热Agent后监听本地套接字
+    if args and args[0] == '--daemon':
+        await run_daemon()
+        return
+
+    # 查看运行中 Ollama 服务的启动参数与驻留模型
+    if args and args[0] == '--server-info':
+        from utils.ollama_health import print_server_info
+        if not ensure_ollama_running():
+            safe_print("无法启动Ollama服务，程序退出。")
+            return
+        print_server_info(report=safe_print)
+        return
+
+    # 响应缓存命中统计
+    if args and args[0] == '--cache-stats':
+        from utils.response_cache import print_cache_stats
+        print_cache_stats(report=safe_print)
+        return
+
+    # 列出命名会话
+    if args and args[0] == '--sessions':
+        from utils.session_store import print_sessions
+        print_sessions(report=safe_print)
+        return
+
+    # 启动耗时分析：在 -X importtime 子进程中运行其余参数并汇总报告
+    if args and args[0] == '--profile-startup':
+        from utils.startup_profiler import run_profiled
+        run_profiled(os.path.abspath(__file__), args[1:])
+        return
+
+    await run_command(args)
+
+async def run_daemon():
+    """启动常驻守护进程，保持 SmartAgent、模型客户端和工具注册表常驻内存"""
+    from daemon import serve
+
+    if not ensure_ollama_running():
+        safe_print("无法启动Ollama服务，守护进程退出。")
+        return
+
+    # 预热：构建 SmartAgent 各场景的模型客户端、工具注册表，以及工具内部使用的Agent
+    from agents.smart_agent import get_smart_agent
+    from agents.image_reader import get_image_reader_agent
+    from agents.ocr_agent import get_ocr_agent
+    get_smart_agent().preload()
+    get_image_reader_agent()
+    get_ocr_agent()
+
+    await serve(run_command, on_request_done=reset_agent_memory, classify=request_model)
+
+async def request_model(args, clipboard_content=None):
+    """推断一次 xs 命令将使用的模型，供守护进程按模型驻留情况调度（不构建任何Agent）
+
+    Returns:
+        模型名；不使用模型的命令返回 None
+    """
+    from agents.smart_agent import get_smart_agent
+    smart_agent = get_smart_agent()
+
+    args = [arg for arg in args if arg != '--no-cache']
+    if args[:1] in (['-s'], ['--session']):
+        args = args[2:]
+    if not args or args[0] == 'bench':
+        return None
+    if args[0] == 'ocr':
+        return smart_agent.model_names['ocr']
+    if args[0] == 'p':
+        text = " ".join([clipboard_content or ''] + args[1:])
+    else:
+        text = " ".join(args)
+    return smart_agent.model_names[await smart_agent._detect_scenario(text)]
+
+async def reset_agent_memory():
+    """清空各Agent的对话记忆，使守护进程中的每次请求与独立进程运行时一致"""
+    from agents.smart_agent import get_smart_agent
+    from agents.image_reader import get_image_reader_agent
+    from agents.ocr_agent import get_ocr_agent
+
+    await get_smart_agent().reset_memory()
+    await get_image_reader_agent().memory.clear()
+    await get_ocr_agent().agent.memory.clear()
+
+async def run_command(args, cwd=None, clipboard_content=None):
+    """执行一次 xs 命令
+
+    Args:
+        args: 命令参数（不含程序名）
+        cwd: 用户终端所在目录，默认为当前进程目录
+        clipboard_content: 客户端预先读取的剪贴板内容，None 表示在本进程中读取
+    """
+    # --no-cache：本次请求跳过响应缓存（可出现在任意位置）
+    from utils.response_cache import set_bypass
+    set_bypass('--no-cache' in args)
+    args = [arg for arg in args if arg != '--no-cache']
+
+    # -s/--session <名称>：在命名会话中继续对话
+    session = None
+    if args and args[0] in ('-s', '--session'):
+        if len(args) < 2:
+            safe_print("会话命令格式: xs -s <会话名称> <你要输入的内容>")
+            return
+        from utils.session_store import get_session_store
+        session = get_session_store().open(args[1])
+        args = args[2:]
+        if not args:
+            print_session_history(session)
+            return
+
+    if len(args) < 1:
         safe_print("只需要在xs命令后输入您的要求即可。")
         safe_print("例如：xs <你要输入的内容>")
         safe_print("示例1：xs 下载视频，http……")
@@ -675,28 +853,51 @@ async def main():
         safe_print("示例3：xs 给1.png中的人物戴上一顶草帽。")
         safe_print("特殊功能：xs p  # 使用剪贴板完整内容作为输入")
         safe_print("高级功能：xs p <问题>  # 对剪贴板完整内容提问")
-        safe_print("OCR功能：xs ocr [图片路径] [可选: 识别要求]  # 纯文字识别")
+        safe_print("OCR功能：xs ocr [--tiled] [图片路径] [可选: 识别要求]  # 纯文字识别；--tiled 长截图分块识别")
+        safe_print("批量OCR：xs ocr <目录|通配符> [--out 结果.jsonl] [-j 并发数]  # 结果逐行写入JSONL，可断点续跑")
+        safe_print("常驻模式：xs --daemon  # 启动常驻进程，后续 xs 调用无需冷启动")
+        safe_print("参数调优：xs bench tune  # 测量并写回本机最快的推理参数")
+        safe_print("服务信息：xs --server-info  # 查看Ollama服务启动参数与驻留模型")
+        safe_print("响应缓存：xs --no-cache <你要输入的内容>  # 跳过缓存；xs --cache-stats 查看命中统计")
+        safe_print("会话模式：xs -s <会话名称> <你要输入的内容>  # 在命名会话中追问；xs --sessions 列出会话")
+        safe_print("启动分析：xs --profile-startup <你要输入的内容>  # 查看模块导入和各启动阶段耗时")
         safe_print("提示：如果剪贴板图片识别失败，请直接使用图片文件路径")
         return  # 无参数时提示用法，直接退出
 
+    # 获取当前终端打开的目录路径
+    current_dir = cwd or os.getcwd()
+    # 兼容 Windows 路径
+    current_dir = os.path.abspath(current_dir)
+
+    # 推理参数自动调优：xs bench tune [选项]
+    if args[:2] == ['bench', 'tune']:
+        if not ensure_ollama_running():
+            safe_print("无法启动Ollama服务，程序退出。")
+            return
+        from utils.autotune import main as tune_main
+        tune_main(args[2:])
+        return
+
     # Handle OCR command
-    if sys.argv[1] == 'ocr':
+    if args[0] == 'ocr':
         # Ensure Ollama is running before proceeding
         if not ensure_ollama_running():
             safe_print("无法启动Ollama服务，程序退出。")
             return
-        await handle_ocr_command()
+        await handle_ocr_command(args, clipboard_content, session)
         return
 
     # Ensure Ollama is running before proceeding
     if not ensure_ollama_running():
         safe_print("无法启动Ollama服务，程序退出。")
         return
+    profiler.mark("ollama check")
 
     # Check if the first argument is 'p' for clipboard functionality
-    if sys.argv[1] == 'p':
+    if args[0] == 'p':
         # Get clipboard content
-        clipboard_content = get_clipboard_content()
+        if clipboard_content is None:
+            clipboard_content = get_clipboard_content()
         if not clipboard_content:
             safe_print("剪贴板为空或无法读取内容")
             safe_print("提示：请确保已复制图片到剪贴板，或直接使用图片文件路径")
@@ -706,37 +907,28 @@ async def main():
         input_content = clipboard_content
 
         # Add additional arguments if provided
-        if len(sys.argv) > 2:
-            additional_text = " ".join(sys.argv[2:])
+        if len(args) > 1:
+            additional_text = " ".join(args[1:])
             input_content = f"{clipboard_content} {additional_text}"
-
-        # 获取当前终端打开的目录路径
-        current_dir = os.getcwd()
-        # 兼容 Windows 路径
-        current_dir = os.path.abspath(current_dir)
-
-        msg = Msg(
-            name="user",
-            role="user",
-            content=input_content + f"当前目录为：{current_dir}"
-        )
     else:
         # Normal case:拼接所有参数
-        input_content = " ".join(sys.argv[1:])
-
-        # 获取当前终端打开的目录路径
-        current_dir = os.getcwd()
-        # 兼容 Windows 路径
-        current_dir = os.path.abspath(current_dir)
-
-        msg = Msg(
-            name="user",
-            role="user",
-            content=input_content + f"当前目录为：{current_dir}"
-        )
+        input_content = " ".join(args)
 
     # Use streaming response
-    await stream_response(msg)
+    await stream_response(input_content + f"当前目录为：{current_dir}", session)
+
+def print_session_history(session):
+    """显示会话中的对话记录"""
+    if not session.turns:
+        safe_print(f"会话 {session.name} 还没有对话")
+        return
+    for turn in session.turns:
+        speaker = "你" if turn['role'] == 'user' else "小帅"
+        safe_print(f"[{speaker}] {turn['content']}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        # Ctrl-C：进行中的流式请求已在取消时关闭
+        sys.exit(130)
@@ -2,41 +2,161 @@ from agentscope.tool import ToolResponse
 from agentscope.message import (
     Msg, 
     TextBlock,
-    ImageBlock,
-    Base64Source
+    ImageBlock
 )
-from agents.image_reader import image_reader_agent
+from agentscope.model import ChatResponse
+from agents.image_reader import get_image_reader_agent
+from utils.response_cache import get_response_cache, make_agent_key
+from utils.image_prep import image_source
+from config_manager import config
+import os
+import time
 import asyncio
 
-async def images_reader(prompt:str, image_dir:str):
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+def list_images(directory: str, order: str = "name"):
+    """
+    列出目录中的图片文件（不递归）
+
+    Args:
+        directory: 目录路径
+        order: 'name' 按文件名排序，'mtime' 按修改时间从旧到新排序
+
+    Returns:
+        图片文件路径列表
+    """
+    with os.scandir(directory) as entries:
+        images = [entry for entry in entries
+                  if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file()]
+    if order == "mtime":
+        # scandir 在 Windows 上已带有 stat 信息，不会逐个文件再次查询
+        images.sort(key=lambda entry: (entry.stat().st_mtime, entry.name.lower()))
+    else:
+        images.sort(key=lambda entry: entry.name.lower())
+    return [entry.path for entry in images]
+
+async def _ask_vision_model(agent, prompt: str, image_paths):
+    """直接调用视觉模型（不经过 ReActAgent 的记忆，多个请求可以并发），返回回答文本"""
+    # 缩小、编码在线程中进行，与进行中的模型请求重叠
+    sources = await asyncio.gather(*(asyncio.to_thread(image_source, path, 'vision') for path in image_paths))
+    msg = Msg(
+        name="user",
+        role="user",
+        content=[TextBlock(type="text", text=prompt)] + [ImageBlock(type="image", source=source) for source in sources]
+    )
+    formatted = await agent.formatter.format([Msg("system", agent.sys_prompt, "system"), msg])
+    response = await agent.model(formatted)
+
+    # 流式响应中每个数据块都是截至目前累积的内容，取最后一块
+    chunks = [response] if isinstance(response, ChatResponse) else [chunk async for chunk in response]
+    return ''.join(block.get('text', '') for block in chunks[-1].content
+                   if block.get('type') == 'text').strip() if chunks else ''
+
+async def _read_one_image(agent, prompt: str, image_path: str) -> str:
+    """分析一张图片（与单图模式共用响应缓存）"""
+    cache_key = make_agent_key(agent, prompt, [image_path])
+    if cache_key:
+        cached = get_response_cache().get(cache_key)
+        if cached:
+            return cached['text']
+    start = time.perf_counter()
+    text = await _ask_vision_model(agent, prompt, [image_path])
+    if cache_key and text:
+        get_response_cache().put(cache_key, agent.model.model_name, text,
+                                 {'elapsed_ms': (time.perf_counter() - start) * 1000})
+    return text
+
+async def _read_packed_images(agent, prompt: str, image_files) -> str:
+    """把所有图片放在同一个视觉请求中，要求模型按图片分节回答"""
+    names = "、".join(f"{index}. {os.path.basename(path)}" for index, path in enumerate(image_files, 1))
+    packed_prompt = (f"{prompt}\n\n下面依次是 {len(image_files)} 张图片：{names}。"
+                     f"请按图片顺序分别回答，每张图片的回答以「### 序号. 文件名」开头。")
+    cache_key = make_agent_key(agent, packed_prompt, image_files)
+    if cache_key:
+        cached = get_response_cache().get(cache_key)
+        if cached:
+            return cached['text']
+    start = time.perf_counter()
+    text = await _ask_vision_model(agent, packed_prompt, image_files)
+    if cache_key and text:
+        get_response_cache().put(cache_key, agent.model.model_name, text,
+                                 {'elapsed_ms': (time.perf_counter() - start) * 1000})
+    return text
+
+async def _read_multiple_images(prompt: str, image_files, order: str):
+    """
+    多图分析：每张图片单独请求并限制并发数（或按 [image] multi_mode 打包为一个请求），
+    返回按图片分节的汇总结果
+    """
+    image_config = config.get_image_config()
+    total = len(image_files)
+    image_files = image_files[:max(1, image_config['multi_max_images'])]
+    agent = get_image_reader_agent()
+    mode = image_config['multi_mode']
+    concurrency = image_config['multi_concurrency']
+
+    start = time.perf_counter()
+    if mode == 'packed':
+        print(f"[系统] 多图分析: {len(image_files)} 张图片合并为一个请求", flush=True)
+        try:
+            text_result = await _read_packed_images(agent, prompt, image_files)
+        except Exception as e:
+            text_result = f"图像识别过程中出现错误: {str(e)}"
+    else:
+        print(f"[系统] 多图分析: {len(image_files)} 张图片，并发 {concurrency}", flush=True)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def analyse(image_path):
+            async with semaphore:
+                return await _read_one_image(agent, prompt, image_path)
+
+        results = await asyncio.gather(*(analyse(path) for path in image_files), return_exceptions=True)
+        sections = []
+        for index, (path, result) in enumerate(zip(image_files, results), 1):
+            if isinstance(result, Exception):
+                result = f"图像识别过程中出现错误: {str(result)}"
+            sections.append(f"### {index}. {os.path.basename(path)}\n{result or '图像识别完成，但无法提取结果文本'}")
+        text_result = "\n\n".join(sections)
+
+    if total > len(image_files):
+        order_name = "修改时间" if order == "mtime" else "文件名"
+        text_result += f"\n\n（目录中共 {total} 张图片，只分析了按{order_name}排序的前 {len(image_files)} 张）"
+    return ToolResponse(
+        content=[
+            TextBlock(
+                type="text",
+                text=text_result
+            )
+        ],
+        metadata={'images': len(image_files), 'elapsed_ms': (time.perf_counter() - start) * 1000}
+    )
+
+async def images_reader(prompt:str, image_dir:str, order:str = "name"):
     """
     根据用户的提示词，识别并分析图片的内容
     :param prompt: 用户的提示词
-    :param image_dir: 图片的本地位置（可以是文件路径或目录路径）
+    :param image_dir: 图片的本地位置（可以是文件路径或目录路径；目录中有多张图片时逐张分析并分节汇总）
+    :param order: image_dir 为目录时图片的排列顺序："name" 按文件名，"mtime" 按修改时间
     """
-    import os
     import re
 
-    # 如果image_dir是目录，尝试找到其中的图片文件
+    # 如果image_dir是目录，分析其中的所有图片
     if os.path.isdir(image_dir):
-        image_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp']
-        image_files = []
-
-        for file in os.listdir(image_dir):
-            if any(file.lower().endswith(ext) for ext in image_extensions):
-                image_files.append(os.path.join(image_dir, file))
+        image_files = list_images(image_dir, order)
 
         if not image_files:
             return ToolResponse(
                 content=[
                     TextBlock(
                         type="text",
-                        text=f"在目录 {image_dir} 中未找到图片文件。支持的格式：{', '.join(image_extensions)}"
+                        text=f"在目录 {image_dir} 中未找到图片文件。支持的格式：{', '.join(IMAGE_EXTENSIONS)}"
                     )
                 ]
             )
 
-        # 使用找到的第一个图片文件
+        if len(image_files) > 1:
+            return await _read_multiple_images(prompt, image_files, order)
         image_path = image_files[0]
 
     elif os.path.isfile(image_dir):
@@ -80,13 +200,6 @@ async def images_reader(prompt:str, image_dir:str):
                 type="text",
                 text=prompt
             ),
-            ImageBlock(
-                type="image",
-                source=Base64Source(
-                    type="url",
-                    url=image_path
-                )
-            )
         ]
     )
 
@@ -103,8 +216,31 @@ async def images_reader(prompt:str, image_dir:str):
             ]
         )
 
+    # 相同图片内容 + 相同提示词直接返回缓存结果
+    image_reader_agent = get_image_reader_agent()
+    cache_key = make_agent_key(image_reader_agent, prompt, [image_path])
+    if cache_key:
+        cached = get_response_cache().get(cache_key)
+        if cached:
+            return ToolResponse(
+                content=[
+                    TextBlock(
+                        type="text",
+                        text=cached['text']
+                    )
+                ],
+                metadata={'cached': True}
+            )
+
     try:
+        # 缩小到视觉模型的有效分辨率后再发送（预处理关闭或失败时仍使用原文件）
+        msg.content.append(ImageBlock(
+            type="image",
+            source=image_source(image_path, 'vision', report=lambda line: print(line, flush=True))
+        ))
+        start = time.perf_counter()
         res = await image_reader_agent(msg)
+        elapsed_ms = (time.perf_counter() - start) * 1000
 
         # 更安全地提取结果，只提取text类型的块，忽略thinking块
         text_result = "图像识别完成，但无法提取结果文本"
@@ -124,6 +260,10 @@ async def images_reader(prompt:str, image_dir:str):
         else:
             text_result = "图像识别完成，但无法提取结果文本"
 
+        if cache_key and text_result != "图像识别完成，但无法提取结果文本":
+            get_response_cache().put(cache_key, image_reader_agent.model.model_name,
+                                     text_result, {'elapsed_ms': elapsed_ms})
+
         return ToolResponse(
             content=[
                 TextBlock(
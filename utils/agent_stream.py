@@ -0,0 +1,108 @@
+"""
+AgentScope Agent 的增量流式输出
+工具、视觉、OCR 场景的模型都以 stream=True 构建，ReActAgent 每收到一个数据块就调用一次 print(msg, last)，
+msg 中是截至目前累积的内容。各 Agent 关闭了 AgentScope 自带的控制台输出，这里通过 pre_print 钩子
+取得这些中间消息，只把新增的文本写入终端：
+
+- thinking 块直接丢弃
+- 文本块按消息 id 记录已输出的长度，每次只输出新增部分
+- 工具调用阶段输出一行进度（调用了哪个工具、工具执行完成）
+"""
+import json
+import contextlib
+from typing import Dict, Set
+
+from utils.startup_profiler import profiler
+from utils.terminal_writer import TerminalWriter
+
+HOOK_NAME = "xs_stream_output"
+
+# 工具调用参数在进度行中最多显示的字符数
+MAX_ARGS_PREVIEW = 80
+
+
+class AgentStreamPrinter:
+    """把 ReActAgent 的中间消息增量写入终端"""
+
+    def __init__(self, writer: TerminalWriter = None):
+        """
+        Args:
+            writer: 终端写入器，默认为当前 sys.stdout 创建一个
+        """
+        self.writer = writer if writer is not None else TerminalWriter()
+        self._printed: Dict[str, int] = {}
+        self._announced: Set[str] = set()
+        self._last_msg_id = None
+        self._at_line_start = True
+
+    def _write(self, text: str):
+        if text:
+            self.writer.write(text)
+            self._at_line_start = text.endswith('\n')
+
+    def _line(self, text: str):
+        """输出单独的一行（进度信息），必要时先换行"""
+        if not self._at_line_start:
+            self._write('\n')
+        self._write(text + '\n')
+
+    def _on_print(self, agent, kwargs):
+        """pre_print 钩子：只读取消息，不修改参数"""
+        msg = kwargs.get('msg')
+        if msg is None or not isinstance(msg.content, list):
+            return None
+        # 第一个数据块到达即为首字（xs --profile-startup）
+        profiler.mark("first byte")
+        last = kwargs.get('last', True)
+
+        text = ''.join(block.get('text', '') for block in msg.content
+                       if isinstance(block, dict) and block.get('type') == 'text')
+        printed = self._printed.get(msg.id, 0)
+        if len(text) > printed:
+            if msg.id != self._last_msg_id and not self._at_line_start:
+                self._write('\n')
+            self._write(text[printed:])
+            self._printed[msg.id] = len(text)
+            self._last_msg_id = msg.id
+
+        if last:
+            for block in msg.content:
+                if not isinstance(block, dict):
+                    continue
+                key = f"{block.get('type')}:{block.get('id')}"
+                if key in self._announced:
+                    continue
+                if block.get('type') == 'tool_use':
+                    self._announced.add(key)
+                    args = json.dumps(block.get('input') or {}, ensure_ascii=False)
+                    if len(args) > MAX_ARGS_PREVIEW:
+                        args = args[:MAX_ARGS_PREVIEW] + "..."
+                    self._line(f"[工具] 调用 {block.get('name')} {args}")
+                elif block.get('type') == 'tool_result':
+                    self._announced.add(key)
+                    self._line(f"[工具] {block.get('name')} 执行完成")
+        return None
+
+    def write(self, text: str):
+        """直接输出一段文本（不经过 Agent 钩子，例如分块 OCR 按顺序拼接的结果）"""
+        self._write(text)
+
+    def streamed(self, msg) -> bool:
+        """该消息的文本是否已经增量输出过（已输出则调用方无需再显示最终结果）"""
+        return self._printed.get(getattr(msg, 'id', None), 0) > 0
+
+    @contextlib.contextmanager
+    def attach(self, agent):
+        """在上下文中把 agent 的中间消息输出到终端"""
+        agent.register_instance_hook('pre_print', HOOK_NAME, self._on_print)
+        try:
+            yield self
+        finally:
+            agent.remove_instance_hook('pre_print', HOOK_NAME)
+            self.finish()
+
+    def finish(self):
+        """结束输出：补上换行并刷新缓冲"""
+        if not self._at_line_start:
+            self._write('\n')
+        self.writer.flush()
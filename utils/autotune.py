@@ -0,0 +1,241 @@
+"""
+本地推理参数自动调优（xs bench tune）
+针对 get_models() 中的每个模型扫描 num_thread、num_batch、num_ctx（以及已安装的其他量化版本），
+用 Ollama 返回的计时字段测量加载耗时、预填充速度、生成速度和首字延迟，并把最快的配置写回 [options.<场景>]
+"""
+import os
+import time
+import argparse
+from typing import Dict, List, Optional
+
+from config_manager import config
+
+# 固定的测试提示词：足够长以测出预填充速度
+BENCH_PROMPT = (
+    "下面是一段关于本地大模型推理的说明，请阅读后用三句话总结要点。\n"
+    + "在仅有CPU的机器上，推理速度主要受内存带宽、线程数和批大小影响。"
+    "上下文长度决定KV缓存的大小，过大的上下文会增加内存占用和预填充时间。"
+    "量化可以减小模型体积，从而提升加载和生成速度，但可能略微降低回答质量。\n" * 4
+)
+
+# 生成的 token 数（足以稳定测出生成速度）
+BENCH_NUM_PREDICT = 64
+
+# 用于综合评分的参考回答长度（token）
+REFERENCE_ANSWER_TOKENS = 256
+
+# 得分相差在该比例以内时，优先选择上下文更长的配置
+SCORE_TOLERANCE = 0.05
+
+# [models] 配置中各场景对应的键
+MODEL_KEYS = {'tool': 'tool_model', 'text': 'text_model', 'vision': 'vision_model', 'ocr': 'ocr_model'}
+
+
+def thread_candidates() -> List[int]:
+    """根据 CPU 核数生成线程数候选"""
+    cores = os.cpu_count() or 4
+    return sorted({max(1, cores // 2), max(1, cores * 3 // 4), cores})
+
+
+def group_models_by_name(models: Dict[str, str]) -> Dict[str, List[str]]:
+    """把场景按模型名分组（例如 vision 和 ocr 共用同一模型）"""
+    groups = {}
+    for scenario, model_name in models.items():
+        groups.setdefault(model_name, []).append(scenario)
+    return groups
+
+
+def quantization_variants(model_name: str, installed: List[str]) -> List[str]:
+    """
+    查找已安装的同一模型的其他量化版本
+
+    例如配置为 qwen3-vl:8b 时，qwen3-vl:8b-q4_K_M、qwen3-vl:8b-q8_0 都视为候选。
+    """
+    base, _, tag = model_name.partition(':')
+    tag = tag or 'latest'
+    variants = [model_name]
+    for name in installed:
+        other_base, _, other_tag = name.partition(':')
+        if other_base == base and other_tag != tag and other_tag.startswith(tag):
+            variants.append(name)
+    return variants
+
+
+def measure(client, model_name: str, options: Dict) -> Optional[Dict]:
+    """
+    运行一次生成并收集计时
+
+    Returns:
+        dict: load_ms、prompt_tps、eval_tps、ttft_ms、score_ms；失败时返回 None
+    """
+    request_options = dict(options, num_predict=BENCH_NUM_PREDICT, temperature=0, seed=42)
+    start = time.perf_counter()
+    first_token = None
+    final = None
+    try:
+        for chunk in client.generate(model=model_name, prompt=BENCH_PROMPT,
+                                     options=request_options, stream=True):
+            if first_token is None and chunk['response']:
+                first_token = time.perf_counter()
+            if chunk['done']:
+                final = chunk
+    except Exception as e:
+        print(f"    测量失败: {e}")
+        return None
+    if final is None or first_token is None:
+        return None
+
+    def seconds(field):
+        return (final[field] or 0) / 1e9
+
+    prompt_tps = (final['prompt_eval_count'] or 0) / seconds('prompt_eval_duration') \
+        if seconds('prompt_eval_duration') else 0.0
+    eval_tps = (final['eval_count'] or 0) / seconds('eval_duration') if seconds('eval_duration') else 0.0
+    ttft_ms = (first_token - start) * 1000
+    # 综合得分：冷启动首字延迟 + 生成一段参考长度回答的时间（越小越好）
+    score_ms = ttft_ms + (REFERENCE_ANSWER_TOKENS / eval_tps * 1000 if eval_tps else float('inf'))
+    return {
+        'load_ms': seconds('load_duration') * 1000,
+        'prompt_tps': prompt_tps,
+        'eval_tps': eval_tps,
+        'ttft_ms': ttft_ms,
+        'score_ms': score_ms,
+    }
+
+
+def _unload(client, model_name: str):
+    """卸载模型，使下一次测量包含加载时间"""
+    try:
+        client.generate(model=model_name, prompt='', keep_alive=0)
+    except Exception:
+        pass
+
+
+def _pick_best(results: List[Dict]) -> Dict:
+    """选出得分最好的结果；得分接近时优先上下文更长的配置"""
+    best_score = min(r['score_ms'] for r in results)
+    near_best = [r for r in results if r['score_ms'] <= best_score * (1 + SCORE_TOLERANCE)]
+    return max(near_best, key=lambda r: (r['options'].get('num_ctx', 0), -r['score_ms']))
+
+
+def _print_result(label: str, result: Dict):
+    print(f"    {label:<36}加载 {result['load_ms']:8.0f} ms  预填充 {result['prompt_tps']:7.1f} tok/s  "
+          f"生成 {result['eval_tps']:6.1f} tok/s  首字 {result['ttft_ms']:7.0f} ms  得分 {result['score_ms']:7.0f}")
+
+
+def tune_model(client, model_name: str, scenarios: List[str], installed: List[str],
+               sweep_quant: bool, repeat: int, ctx_candidates: List[int]) -> Optional[Dict]:
+    """
+    对一个模型做坐标下降式调优：依次扫描量化版本、num_thread、num_batch、num_ctx，
+    每一维固定其余参数为当前最优值
+
+    Returns:
+        dict: {'model': 最优模型名, 'options': 最优选项}；全部测量失败时返回 None
+    """
+    base_options = config.get_model_options(scenarios[0])
+    current = {
+        'num_thread': base_options.get('num_thread', max(thread_candidates())),
+        'num_batch': base_options.get('num_batch', 512),
+        'num_ctx': base_options.get('num_ctx', 4096),
+    }
+    current_model = model_name
+
+    def run(candidate_model, options, label):
+        samples = []
+        for _ in range(repeat):
+            _unload(client, candidate_model)
+            result = measure(client, candidate_model, options)
+            if result:
+                samples.append(result)
+        if not samples:
+            return None
+        averaged = {key: sum(s[key] for s in samples) / len(samples) for key in samples[0]}
+        averaged.update(model=candidate_model, options=dict(options))
+        _print_result(label, averaged)
+        return averaged
+
+    sweeps = []
+    if sweep_quant:
+        variants = quantization_variants(model_name, installed)
+        if len(variants) > 1:
+            sweeps.append(('model', variants))
+    sweeps += [
+        ('num_thread', thread_candidates()),
+        ('num_batch', [128, 256, 512]),
+        ('num_ctx', ctx_candidates),
+    ]
+
+    best = None
+    for dimension, candidates in sweeps:
+        print(f"  扫描 {dimension}: {candidates}")
+        results = []
+        for candidate in candidates:
+            if dimension == 'model':
+                result = run(candidate, current, candidate)
+            else:
+                options = dict(current, **{dimension: candidate})
+                result = run(current_model, options, f"{dimension}={candidate}")
+            if result:
+                results.append(result)
+        if not results:
+            continue
+        best = _pick_best(results)
+        current_model = best['model']
+        current = dict(best['options'])
+
+    if best is None:
+        return None
+    return {'model': current_model, 'options': current}
+
+
+def write_profile(scenarios: List[str], configured_model: str, tuned: Dict):
+    """把调优结果写回 [options.<场景>]，量化版本变化时同时更新 [models]"""
+    for scenario in scenarios:
+        config.update_section(f'options.{scenario}', tuned['options'])
+        if tuned['model'] != configured_model:
+            config.update_section('models', {MODEL_KEYS[scenario]: tuned['model']})
+
+
+def main(argv=None):
+    """xs bench tune 入口"""
+    parser = argparse.ArgumentParser(prog="xs bench tune", description="扫描推理参数并写回最快的配置")
+    parser.add_argument('--models', default='', help="只调优指定的场景，逗号分隔（如 text,vision）")
+    parser.add_argument('--repeat', type=int, default=1, help="每个配置测量的次数")
+    parser.add_argument('--min-ctx', type=int, default=4096, help="num_ctx 候选的下限")
+    parser.add_argument('--no-quant', action='store_true', help="不扫描其他量化版本")
+    parser.add_argument('--dry-run', action='store_true', help="只输出结果，不写回配置")
+    args = parser.parse_args(argv)
+
+    from utils.ollama_transport import get_client
+    client = get_client()
+
+    try:
+        installed = [m['model'] for m in client.list()['models']]
+    except Exception as e:
+        print(f"无法获取已安装的模型列表: {e}")
+        return
+
+    models = config.get_models()
+    if args.models:
+        wanted = {name.strip() for name in args.models.split(',') if name.strip()}
+        models = {scenario: name for scenario, name in models.items() if scenario in wanted}
+
+    ctx_candidates = [ctx for ctx in (2048, 4096, 8192, 16384) if ctx >= args.min_ctx] or [args.min_ctx]
+
+    print(f"CPU 核数: {os.cpu_count()}  线程候选: {thread_candidates()}  上下文候选: {ctx_candidates}")
+    for model_name, scenarios in group_models_by_name(models).items():
+        print(f"\n模型 {model_name}（场景: {', '.join(scenarios)}）")
+        if model_name not in installed:
+            print("  未安装，跳过")
+            continue
+        tuned = tune_model(client, model_name, scenarios, installed,
+                           sweep_quant=not args.no_quant, repeat=max(1, args.repeat),
+                           ctx_candidates=ctx_candidates)
+        if tuned is None:
+            print("  所有配置均测量失败，保持原配置")
+            continue
+        options_text = ', '.join(f"{k}={v}" for k, v in tuned['options'].items())
+        print(f"  最优配置: {tuned['model']}  {options_text}")
+        if not args.dry_run:
+            write_profile(scenarios, model_name, tuned)
+            print(f"  已写入 {config.config_file}: " + ', '.join(f"[options.{s}]" for s in scenarios))
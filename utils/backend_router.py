@@ -0,0 +1,296 @@
+"""
+多后端 Ollama 路由
+[backends] 中可以配置多台 Ollama 服务并标注各自提供的模型；未配置时只使用 [system] 中的 ollama_host/ollama_port。
+
+每次请求按以下顺序选择后端：
+1. 提供该模型、且未被剔除的后端
+2. 模型已驻留内存（/api/ps）的后端优先
+3. 最近延迟（首个数据块到达时间的指数滑动平均）× (1 + 进行中请求数) 最小的后端
+
+请求在收到第一个数据块之前失败时自动切换到下一个后端；连接失败的后端被剔除一段时间，
+到期后先探测 /api/version，成功才重新加入。
+
+RoutedAsyncClient 提供与 ollama.AsyncClient 相同的 chat()/generate() 接口，
+AgentScope 模型（llm.py、llm_enhanced.py 通过 share_client）和文本场景的原生流式调用都经由它发送请求。
+"""
+import time
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from config_manager import config
+
+
+class Backend:
+    """一台 Ollama 服务"""
+
+    def __init__(self, name: str, url: str, models: Optional[Set[str]] = None):
+        """
+        Args:
+            name: 后端名称
+            url: 服务地址（http://host:port）
+            models: 该后端提供的模型，None 表示提供所有模型
+        """
+        self.name = name
+        self.url = url
+        self.models = models
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.missing: Dict[str, float] = {}  # 返回 404 的模型 -> 到期时间（到期后重新尝试，例如已 ollama pull）
+        self._loaded: Set[str] = set()
+        self._loaded_at = 0.0
+
+    def serves(self, model: str) -> bool:
+        if model in self.missing:
+            if time.monotonic() < self.missing[model]:
+                return False
+            del self.missing[model]
+        return self.models is None or model in self.models
+
+    @property
+    def ejected(self) -> bool:
+        return self.failures > 0
+
+    def score(self) -> float:
+        """延迟越低、进行中的请求越少越好；尚无延迟数据的后端优先试用"""
+        return (self.latency or 0.0) * (1 + self.in_flight)
+
+
+class BackendRouter:
+    """按模型驻留、延迟和负载选择后端，并负责剔除与重新加入"""
+
+    def __init__(self, backends: List[Backend], eject_seconds: float = 30, max_eject_seconds: float = 300,
+                 latency_alpha: float = 0.3, ps_ttl: float = 2.0):
+        self.backends = backends
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self.latency_alpha = latency_alpha
+        self.ps_ttl = ps_ttl
+
+    @property
+    def is_multi(self) -> bool:
+        return len(self.backends) > 1
+
+    async def _loaded_models(self, backend: Backend) -> Set[str]:
+        """查询后端驻留内存的模型（带缓存）"""
+        if time.monotonic() - backend._loaded_at < self.ps_ttl:
+            return backend._loaded
+        from utils.ollama_transport import get_async_http_client
+        try:
+            response = await get_async_http_client(backend.url).get(
+                "/api/ps", timeout=config.get_system_config()['connection_timeout'])
+            if response.status_code == 200:
+                backend._loaded = {m.get('model') or m.get('name', '') for m in response.json().get('models', [])}
+        except Exception:
+            pass
+        backend._loaded_at = time.monotonic()
+        return backend._loaded
+
+    async def _readmit(self, backend: Backend) -> bool:
+        """剔除期满后探测 /api/version，成功则重新加入"""
+        if time.monotonic() < backend.ejected_until:
+            return False
+        from utils.ollama_transport import get_async_http_client
+        try:
+            response = await get_async_http_client(backend.url).get(
+                "/api/version", timeout=config.get_system_config()['connection_timeout'])
+            healthy = response.status_code == 200
+        except Exception:
+            healthy = False
+        if healthy:
+            backend.failures = 0
+            return True
+        self._eject(backend)
+        return False
+
+    def _eject(self, backend: Backend):
+        """剔除后端，连续失败时剔除时间加倍"""
+        backend.failures += 1
+        duration = min(self.eject_seconds * 2 ** (backend.failures - 1), self.max_eject_seconds)
+        backend.ejected_until = time.monotonic() + duration
+
+    async def pick(self, model: str, exclude=()) -> Optional[Backend]:
+        """
+        选择处理该模型请求的后端
+
+        Args:
+            model: 模型名
+            exclude: 本次请求已经失败过的后端
+
+        Returns:
+            Backend；没有可用后端时返回 None
+        """
+        serving = [b for b in self.backends if b.serves(model) and b not in exclude]
+        if not self.is_multi:
+            return serving[0] if serving else None
+
+        available = [b for b in serving if not b.ejected or await self._readmit(b)]
+        # 全部被剔除时仍然尝试，避免因短暂故障直接失败
+        candidates = available or serving
+        if not candidates:
+            return None
+
+        loaded = {b.name: model in await self._loaded_models(b) for b in candidates}
+        return min(candidates, key=lambda b: (not loaded[b.name], b.score()))
+
+    def record_success(self, backend: Backend, latency: float):
+        """记录一次成功请求的首个数据块延迟"""
+        backend.failures = 0
+        if backend.latency is None:
+            backend.latency = latency
+        else:
+            backend.latency += self.latency_alpha * (latency - backend.latency)
+
+    def record_failure(self, backend: Backend, error: Exception, model: str):
+        """
+        记录失败：模型不存在时只把该模型在该后端上标记为暂时不可用，连接类错误则剔除后端
+
+        只有一个后端时不做任何标记：请求仍发往该后端，模型下载后立即可用
+        """
+        if not self.is_multi:
+            return
+        status_code = getattr(error, 'status_code', None)
+        if status_code == 404:
+            backend.missing[model] = time.monotonic() + self.eject_seconds
+        else:
+            self._eject(backend)
+
+    def describe(self) -> List[str]:
+        lines = []
+        now = time.monotonic()
+        for b in self.backends:
+            latency = f"{b.latency * 1000:.0f} ms" if b.latency is not None else "-"
+            state = f"已剔除（{max(0.0, b.ejected_until - now):.0f} 秒后重试）" if b.ejected else "正常"
+            models = ', '.join(sorted(b.models)) if b.models else "全部模型"
+            lines.append(f"{b.name:<12}{b.url:<28}{state:<20}延迟 {latency:<10}进行中 {b.in_flight}  模型: {models}")
+        return lines
+
+
+def _is_failover_error(error: Exception) -> bool:
+    """
+    连接失败、超时、5xx 和模型不存在（404）可以换一个后端重试
+
+    其余 4xx（请求格式错误、不支持的参数等）换哪个后端都会失败，直接抛给调用方，
+    不记为后端故障，否则一个错误请求就会把所有正常后端依次剔除
+    """
+    import httpx
+    from ollama import ResponseError
+    if isinstance(error, (httpx.TransportError, OSError)):
+        return True
+    if isinstance(error, ResponseError):
+        return error.status_code == 404 or error.status_code >= 500
+    return False
+
+
+class RoutedAsyncClient:
+    """与 ollama.AsyncClient 接口兼容的路由客户端，底层使用各后端共享的连接池"""
+
+    def __init__(self, router: BackendRouter):
+        self.router = router
+
+    async def chat(self, **kwargs):
+        return await self._request('chat', kwargs)
+
+    async def generate(self, **kwargs):
+        return await self._request('generate', kwargs)
+
+    async def embed(self, **kwargs):
+        return await self._request('embed', kwargs)
+
+    async def _request(self, method: str, kwargs: Dict):
+        from utils.ollama_transport import get_async_client
+
+        model = kwargs.get('model', '')
+        tried = []
+        last_error = None
+        while True:
+            backend = await self.router.pick(model, exclude=tried)
+            if backend is None:
+                raise last_error or ConnectionError(f"没有提供模型 {model} 的 Ollama 后端")
+            tried.append(backend)
+
+            start = time.monotonic()
+            backend.in_flight += 1
+            try:
+                result = await getattr(get_async_client(backend.url), method)(**kwargs)
+                if not kwargs.get('stream'):
+                    self.router.record_success(backend, time.monotonic() - start)
+                    backend.in_flight -= 1
+                    return result
+                # 流式请求：拿到第一个数据块才算成功，在此之前失败可以换后端重试
+                try:
+                    first = await result.__anext__()
+                except StopAsyncIteration:
+                    first = None
+            except asyncio.CancelledError:
+                backend.in_flight -= 1
+                raise
+            except Exception as e:
+                backend.in_flight -= 1
+                if not _is_failover_error(e):
+                    raise
+                self.router.record_failure(backend, e, model)
+                last_error = e
+                continue
+
+            self.router.record_success(backend, time.monotonic() - start)
+            return self._relay(first, result, backend)
+
+    @staticmethod
+    async def _relay(first, stream, backend: Backend):
+        """先返回已取得的第一个数据块，再继续转发剩余内容"""
+        try:
+            if first is not None:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+        finally:
+            backend.in_flight -= 1
+            await stream.aclose()
+
+
+def load_backends() -> List[Backend]:
+    """读取 [backends] 配置；未配置时使用 [system] 中的单个服务"""
+    from utils.ollama_transport import get_host_url
+
+    backends = []
+    for name, value in config.get_backends().items():
+        parts = value.split()
+        if not parts:
+            continue
+        models = set(parts[1:]) or None
+        backends.append(Backend(name, get_host_url(parts[0]), models))
+    if not backends:
+        backends.append(Backend('local', get_host_url()))
+    return backends
+
+
+_router = None
+_routed_client = None
+
+
+def get_router() -> BackendRouter:
+    """获取进程共享的后端路由器"""
+    global _router
+    if _router is None:
+        routing = config.get_routing_config()
+        _router = BackendRouter(load_backends(), eject_seconds=routing['eject_seconds'],
+                                max_eject_seconds=routing['max_eject_seconds'],
+                                latency_alpha=routing['latency_alpha'], ps_ttl=routing['ps_ttl'])
+    return _router
+
+
+def get_routed_client() -> RoutedAsyncClient:
+    """获取进程共享的路由客户端"""
+    global _routed_client
+    if _routed_client is None:
+        _routed_client = RoutedAsyncClient(get_router())
+    return _routed_client
+
+
+def uses_local_backend() -> bool:
+    """后端列表中是否包含本机 [system] 配置的服务（决定是否需要确保本机 Ollama 已启动）"""
+    from utils.ollama_transport import get_host_url
+    local_url = get_host_url()
+    return any(backend.url == local_url for backend in get_router().backends)
@@ -0,0 +1,121 @@
+"""
+剪贴板图片的内存表示
+截图从剪贴板读出后原本先以默认压缩级别保存为 PNG 临时文件，之后缓存键计算、感知哈希和图片预处理
+再各自读回并解码这个文件；4K 截图仅 PNG 压缩就要几百毫秒。
+
+现在剪贴板图片以 ClipboardImage 的形式留在内存中：
+- CF_DIB 数据用 memoryview 直接解析，不再拼接 BMP 文件头复制整份数据；
+  24/32 位非压缩位图通过 Image.frombuffer 按行跨度读取，只在转换为 RGB 时复制一次
+- 缓存键按原始像素数据计算，感知哈希和预处理直接使用内存中的图片
+- 只有确实需要文件路径时（例如交给 Agent 的工具）才写临时文件，且使用最快的压缩级别
+"""
+import io
+import os
+import struct
+import hashlib
+import tempfile
+from typing import Optional
+
+# 临时 PNG 的压缩级别：1 最快，文件比默认级别略大，临时文件只在本机读取，体积不重要
+TEMP_PNG_COMPRESS_LEVEL = 1
+
+# BITMAPINFOHEADER 中的压缩方式
+BI_RGB = 0
+BI_BITFIELDS = 3
+
+# 32 位位图的标准颜色掩码（BGRX）
+_STANDARD_MASKS = (0x00FF0000, 0x0000FF00, 0x000000FF)
+
+
+def dib_to_image(data):
+    """
+    把 CF_DIB 数据（BITMAPINFO + 像素，没有 BMP 文件头）转换为 PIL 图片
+
+    Args:
+        data: win32clipboard.GetClipboardData(CF_DIB) 返回的字节
+
+    Returns:
+        PIL.Image.Image
+    """
+    from PIL import Image
+
+    view = memoryview(data)
+    header_size, width, height, _, bit_count, compression = struct.unpack_from('<IiiHHI', view, 0)
+    colors_used = struct.unpack_from('<I', view, 32)[0]
+
+    if bit_count in (24, 32) and compression in (BI_RGB, BI_BITFIELDS):
+        offset = header_size + colors_used * 4
+        standard = True
+        if compression == BI_BITFIELDS:
+            # 掩码紧跟在 40 字节的 BITMAPINFOHEADER 之后（V4/V5 头中位于相同位置）
+            standard = struct.unpack_from('<III', view, 40) == _STANDARD_MASKS
+            if header_size == 40:
+                offset += 12
+        if standard:
+            rows = abs(height)
+            stride = (width * bit_count + 31) // 32 * 4
+            rawmode = 'BGR' if bit_count == 24 else 'BGRX'
+            # 高度为正表示自下而上存储
+            orientation = -1 if height > 0 else 1
+            return Image.frombuffer('RGB', (width, rows), view[offset:offset + stride * rows],
+                                    'raw', rawmode, stride, orientation)
+
+    # 调色板、RLE 压缩等少见格式交给 PIL 的 DIB 解析
+    from PIL import BmpImagePlugin
+    image = BmpImagePlugin.DibImageFile(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def save_temp_image(image, name: Optional[str] = None) -> str:
+    """用最快的压缩级别把图片保存为临时 PNG，返回路径"""
+    temp_path = os.path.join(tempfile.gettempdir(), name or f"clipboard_image_{os.getpid()}.png")
+    image.save(temp_path, 'PNG', compress_level=TEMP_PNG_COMPRESS_LEVEL)
+    return temp_path
+
+
+class ClipboardImage:
+    """留在内存中的剪贴板图片，需要时才写临时文件"""
+
+    def __init__(self, image, raw=None):
+        """
+        Args:
+            image: PIL 图片
+            raw: 图片的原始数据（例如 CF_DIB 字节），用于计算内容哈希；None 时按像素数据计算
+        """
+        self.image = image
+        self._raw = raw
+        self._digest = None
+        self._path = None
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def nbytes(self) -> int:
+        """内存中位图的大小（字节）"""
+        if self._raw is not None:
+            return memoryview(self._raw).nbytes
+        width, height = self.image.size
+        return width * height * len(self.image.getbands())
+
+    def digest(self) -> str:
+        """图片内容的 SHA-256（缓存键使用）"""
+        if self._digest is None:
+            if self._raw is not None:
+                self._digest = hashlib.sha256(self._raw).hexdigest()
+            else:
+                header = f"{self.image.mode}:{self.image.size}".encode()
+                self._digest = hashlib.sha256(header + self.image.tobytes()).hexdigest()
+        return self._digest
+
+    def path(self) -> str:
+        """需要文件路径时写出临时 PNG（只写一次）"""
+        if self._path is None:
+            self._path = save_temp_image(self.image)
+        return self._path
+
+    def __str__(self):
+        width, height = self.image.size
+        return self._path or f"剪贴板图片({width}x{height})"
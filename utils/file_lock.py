@@ -0,0 +1,75 @@
+"""
+跨进程文件锁
+POSIX 使用 fcntl.flock，Windows 使用 msvcrt.locking；进程退出时操作系统会自动释放锁
+"""
+import os
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """基于锁文件的跨进程互斥锁，可用作上下文管理器"""
+
+    def __init__(self, path: str, timeout: float = None, poll_interval: float = 0.05):
+        """
+        Args:
+            path: 锁文件路径
+            timeout: 获取锁的最长等待时间（秒），None 表示一直等待
+            poll_interval: 轮询间隔（秒）
+        """
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file = None
+
+    def _try_lock(self) -> bool:
+        try:
+            if os.name == 'nt':
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self):
+        """获取锁，超时抛出 TimeoutError"""
+        if self._file is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, 'a+')
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not self._try_lock():
+            if deadline is not None and time.monotonic() >= deadline:
+                self._file.close()
+                self._file = None
+                raise TimeoutError(f"等待文件锁超时: {self.path}")
+            time.sleep(self.poll_interval)
+
+    def release(self):
+        """释放锁"""
+        if self._file is None:
+            return
+        try:
+            if os.name == 'nt':
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
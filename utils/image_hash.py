@@ -0,0 +1,88 @@
+"""
+图片感知哈希
+用 dHash（差值哈希）给图片生成指纹：同一张截图重复粘贴或重新截取、只差几个像素时指纹的汉明距离很小，
+可以据此找到之前识别过的近似截图
+
+感知哈希对排版敏感、对细节不敏感：版式相同、只差一个字的两张文字截图指纹几乎一样。
+因此指纹只用于快速筛选候选，复用结果前还要用 count_changed_pixels 逐像素确认只差几个像素。
+
+依赖 NumPy；未安装时 fingerprint() 返回 None，调用方跳过近似查找
+"""
+from typing import TYPE_CHECKING, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 哈希边长：hash_size x hash_size 个比较位（16 -> 256 位）
+HASH_SIZE = 16
+
+# 灰度差超过该值的像素才计为"有变化"，忽略压缩和抗锯齿带来的轻微差异
+PIXEL_THRESHOLD = 24
+
+
+def dhash_array(gray, hash_size: int = HASH_SIZE) -> bytes:
+    """
+    根据灰度图计算 dHash
+
+    先缩小为 (hash_size + 1) x hash_size，再比较每行相邻像素的亮度
+    """
+    import numpy as np
+    from PIL import Image
+
+    small = Image.fromarray(gray).resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return np.packbits(bits).tobytes()
+
+
+def fingerprint(image_path) -> Optional[Tuple[bytes, "np.ndarray"]]:
+    """
+    读取图片并计算指纹
+
+    Args:
+        image_path: 图片路径，或内存中的 ClipboardImage（直接使用其中的图片，不读文件）
+
+    Returns:
+        (dHash, 灰度像素数组)；NumPy 不可用或图片无法读取时返回 None
+    """
+    try:
+        import numpy as np
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        if not isinstance(image_path, str):
+            gray = np.asarray(image_path.image.convert('L'), dtype=np.uint8)
+        else:
+            with Image.open(image_path) as img:
+                gray = np.asarray(img.convert('L'), dtype=np.uint8)
+    except (OSError, ValueError):
+        return None
+    return dhash_array(gray), gray
+
+
+def hamming_distances(query: bytes, hashes) -> "np.ndarray":
+    """
+    计算一个指纹与一组等长指纹之间的汉明距离（向量化）
+
+    Args:
+        query: 待查询的指纹
+        hashes: 指纹序列，长度需与 query 相同
+
+    Returns:
+        np.ndarray: 与 hashes 等长的距离数组
+    """
+    import numpy as np
+
+    values = np.frombuffer(b''.join(hashes), dtype=np.uint8).reshape(-1, len(query))
+    diff = np.bitwise_xor(values, np.frombuffer(query, dtype=np.uint8))
+    return np.unpackbits(diff, axis=1).sum(axis=1)
+
+
+def count_changed_pixels(gray_a, gray_b, threshold: int = PIXEL_THRESHOLD) -> int:
+    """统计两张同尺寸灰度图中亮度差超过 threshold 的像素数"""
+    import numpy as np
+
+    diff = np.abs(gray_a.astype(np.int16) - gray_b.astype(np.int16))
+    return int(np.count_nonzero(diff > threshold))
@@ -0,0 +1,209 @@
+"""
+图片预处理
+视觉和 OCR 调用原本把图片路径直接交给 AgentScope，由格式化器把整个文件 base64 编码后发给模型；
+一张 4K 截图有几 MB，而 CPU 上视觉模型的预填充时间随图片像素（视觉 token 数）增长，这是 OCR 最大的开销。
+
+调用模型前先把图片处理为模型实际使用的分辨率：
+- 按场景缩小到 [image] 中配置的最长边（qwen3-vl 每 28x28 像素对应一个视觉 token，超过有效分辨率的细节只会增加预填充时间）
+- OCR 转为灰度图并用 PNG 编码（文字边缘清晰、灰度 PNG 体积小）；视觉场景用 JPEG 编码
+- 处理结果比原文件还大且未缩小时直接使用原文件
+- 处理结果按 原文件内容哈希 + 处理参数 缓存在磁盘上，同一张图片再次使用时直接读取
+- 剪贴板截图（utils.clipboard_image.ClipboardImage）直接从内存中的图片处理，不经过临时文件
+- 每次处理返回节省的字节数、视觉 token 数和处理耗时，调用方输出一行报告
+"""
+import io
+import os
+import time
+import glob
+import base64
+import contextlib
+import hashlib
+from typing import Optional, Tuple
+
+from config_manager import config
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认缓存目录（项目 .cache 目录下）
+DEFAULT_IMAGE_CACHE_DIR = os.path.join(PROJECT_ROOT, ".cache", "images")
+
+# qwen3-vl 每个视觉 token 对应的像素块边长
+VISION_PATCH_SIZE = 28
+
+_MEDIA_TYPES = {'png': 'image/png', 'jpeg': 'image/jpeg', 'gif': 'image/gif', 'webp': 'image/webp', 'bmp': 'image/bmp'}
+
+
+def estimate_vision_tokens(size: Tuple[int, int]) -> int:
+    """按 28x28 像素块估算图片占用的视觉 token 数"""
+    width, height = size
+    return -(-width // VISION_PATCH_SIZE) * -(-height // VISION_PATCH_SIZE)
+
+
+def _parse_size(text: str) -> Tuple[int, int]:
+    width, height = text.split('x')
+    return int(width), int(height)
+
+
+def _format_bytes(count: int) -> str:
+    if count >= 1024 * 1024:
+        return f"{count / 1024 / 1024:.1f} MB"
+    return f"{count / 1024:.0f} KB"
+
+
+class PreparedImage:
+    """预处理后的图片"""
+
+    def __init__(self, path: str, media_type: str, original_bytes: int, prepared_bytes: int,
+                 original_size: Tuple[int, int], prepared_size: Tuple[int, int], elapsed_ms: float, cached: bool,
+                 data: Optional[bytes] = None):
+        self.path = path
+        self._data = data  # 刚处理完的编码结果，生成 source 时不必再读缓存文件
+        self.media_type = media_type
+        self.original_bytes = original_bytes
+        self.prepared_bytes = prepared_bytes
+        self.original_size = original_size
+        self.prepared_size = prepared_size
+        self.elapsed_ms = elapsed_ms
+        self.cached = cached
+
+    def source(self) -> dict:
+        """AgentScope ImageBlock 的 base64 source（Ollama 格式化器直接使用其中的 data）"""
+        if self._data is None:
+            with open(self.path, 'rb') as f:
+                self._data = f.read()
+        data = base64.b64encode(self._data).decode('ascii')
+        return {'type': 'base64', 'media_type': self.media_type, 'data': data}
+
+    def describe(self) -> str:
+        """一行处理报告"""
+        (ow, oh), (pw, ph) = self.original_size, self.prepared_size
+        saved = self.original_bytes - self.prepared_bytes
+        ratio = saved / self.original_bytes if self.original_bytes else 0
+        timing = "缓存命中" if self.cached else f"耗时 {self.elapsed_ms:.0f} ms"
+        return (f"[系统] 图片预处理: {ow}x{oh} → {pw}x{ph}，{_format_bytes(self.original_bytes)} → "
+                f"{_format_bytes(self.prepared_bytes)}（节省 {ratio:.0%}），视觉 token ≈ "
+                f"{estimate_vision_tokens(self.original_size)} → {estimate_vision_tokens(self.prepared_size)}，{timing}")
+
+
+def _settings(purpose: str) -> Tuple[int, str, bool, int]:
+    image_config = config.get_image_config()
+    if purpose == 'ocr':
+        return (image_config['ocr_max_side'], image_config['ocr_format'], image_config['ocr_grayscale'],
+                image_config['jpeg_quality'])
+    return image_config['vision_max_side'], image_config['vision_format'], False, image_config['jpeg_quality']
+
+
+def _prune(cache_dir: str, max_entries: int):
+    """缓存文件超过上限时删除最早的文件"""
+    entries = [entry for entry in os.scandir(cache_dir) if entry.is_file()]
+    if len(entries) <= max_entries:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - max_entries]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def prepare_image(image_path, purpose: str = 'vision') -> Optional[PreparedImage]:
+    """
+    把图片处理为适合发给模型的大小和格式
+
+    Args:
+        image_path: 原图片路径，或内存中的 ClipboardImage
+        purpose: 'vision' 或 'ocr'
+
+    Returns:
+        PreparedImage；预处理已关闭或图片无法解码时返回 None（调用方直接使用原文件）
+    """
+    image_config = config.get_image_config()
+    if not image_config['enabled']:
+        return None
+
+    start = time.perf_counter()
+    in_memory = not isinstance(image_path, str)
+    if in_memory:
+        data = None
+        digest = image_path.digest()
+        original_bytes = image_path.nbytes
+    else:
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        original_bytes = len(data)
+    max_side, image_format, grayscale, quality = _settings(purpose)
+    key = hashlib.sha256(f"{digest}\0{purpose}:{max_side}:{image_format}:{grayscale}:{quality}".encode()).hexdigest()
+    cache_dir = image_config['cache_dir'] or DEFAULT_IMAGE_CACHE_DIR
+
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+
+    # 已处理过：文件名中带有原尺寸和处理后的尺寸（<哈希>_<宽>x<高>_<宽>x<高>.<格式>）
+    for cached_path in glob.glob(os.path.join(cache_dir, f"{key}_*")):
+        name, ext = os.path.splitext(os.path.basename(cached_path))
+        if ext[1:] not in _MEDIA_TYPES:
+            continue
+        _, original, prepared = name.split('_')
+        os.utime(cached_path)
+        return PreparedImage(cached_path, _MEDIA_TYPES[ext[1:]], original_bytes, os.path.getsize(cached_path),
+                             _parse_size(original), _parse_size(prepared),
+                             (time.perf_counter() - start) * 1000, cached=True)
+
+    try:
+        # 剪贴板中的位图没有 EXIF 方向信息
+        with contextlib.nullcontext(image_path.image) if in_memory else Image.open(io.BytesIO(data)) as img:
+            original_format = (img.format or '').lower()
+            if not in_memory:
+                img = ImageOps.exif_transpose(img)
+            original_size = img.size
+            img = img.convert('L' if grayscale else 'RGB')
+            if max_side and max(img.size) > max_side:
+                img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            prepared_size = img.size
+            buffer = io.BytesIO()
+            if image_format == 'jpeg':
+                img.save(buffer, 'JPEG', quality=quality, optimize=True)
+            else:
+                image_format = 'png'
+                img.save(buffer, 'PNG')
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    prepared = buffer.getvalue()
+    # 没有缩小且重新编码后反而更大（例如本来就很小的 PNG）：使用原文件
+    if (data is not None and prepared_size == original_size and len(prepared) >= len(data)
+            and original_format in _MEDIA_TYPES):
+        prepared, image_format = data, original_format
+
+    os.makedirs(cache_dir, exist_ok=True)
+    prepared_path = os.path.join(
+        cache_dir, f"{key}_{original_size[0]}x{original_size[1]}_{prepared_size[0]}x{prepared_size[1]}.{image_format}")
+    temp_path = f"{prepared_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(prepared)
+    os.replace(temp_path, prepared_path)
+    _prune(cache_dir, image_config['cache_max_entries'])
+
+    return PreparedImage(prepared_path, _MEDIA_TYPES[image_format], original_bytes, len(prepared),
+                         original_size, prepared_size, (time.perf_counter() - start) * 1000, cached=False,
+                         data=prepared)
+
+
+def image_source(image_path, purpose: str = 'vision', report=None) -> dict:
+    """
+    生成 ImageBlock 的 source：预处理成功时使用处理后的 base64 数据，否则仍使用原文件路径
+
+    Args:
+        image_path: 原图片路径，或内存中的 ClipboardImage（预处理不可用时才写出临时文件）
+        purpose: 'vision' 或 'ocr'
+        report: 输出处理报告的函数，None 表示不输出
+    """
+    prepared = prepare_image(image_path, purpose)
+    if prepared is None:
+        return {'type': 'url', 'url': image_path if isinstance(image_path, str) else image_path.path()}
+    if report is not None:
+        report(prepared.describe())
+    return prepared.source()
@@ -0,0 +1,232 @@
+"""
+模型驻留感知的请求调度器
+工具、文本、视觉/OCR 场景使用不同的模型，混合请求按到达顺序执行时 Ollama 会不断换入换出模型；
+在只有 CPU 的机器上加载一个 20B 模型需要几十秒。
+
+调度器位于守护进程（以及批量任务）的请求队列前：
+- 通过 /api/ps 查询当前驻留内存的模型，优先执行所需模型已加载的请求，把同一模型的请求排在一起
+- 公平性：每个请求最多被后来的请求插队 max_skips 次，之后必定按到达顺序执行
+- 队列中还有同一模型的请求时，正在执行的请求本身带上 keep_alive=-1 固定该模型
+  （Ollama 每个请求都会重置模型的过期时间，单独发送的固定请求会被下一个真实请求覆盖）；
+  该模型最后一个请求使用默认的 keep_alive，排队的请求被取消时再单独恢复；
+  需要加载新模型且驻留数量已达上限时，主动卸载队列中不再需要的模型，而不是让 Ollama 按 LRU 淘汰
+- 统计实际发生的模型切换和避免的切换次数
+"""
+import time
+import asyncio
+import contextlib
+from typing import Dict, List, Optional, Set
+
+from config_manager import config
+from utils.ollama_transport import override_keep_alive
+
+# /api/ps 结果的缓存时间（秒）
+LOADED_MODELS_TTL = 1.0
+
+
+class _Ticket:
+    """排队中的一个请求"""
+
+    def __init__(self, model: Optional[str], seq: int):
+        self.model = model
+        self.seq = seq
+        self.skips = 0
+        self.keep_alive = None  # 执行时请求使用的 keep_alive 覆盖值，None 表示使用默认值
+        self.granted = asyncio.Event()
+
+
+class ModelScheduler:
+    """按模型驻留情况对串行执行的请求重新排序"""
+
+    def __init__(self, max_skips: int = 3, pin: bool = True, report=None):
+        """
+        Args:
+            max_skips: 每个请求最多被插队的次数（公平性上限），0 表示严格按到达顺序
+            pin: 是否主动固定/卸载模型
+            report: 输出调度日志的函数，None 表示不输出
+        """
+        self.max_skips = max_skips
+        self.pin = pin
+        self.report = report
+        self._queue: List[_Ticket] = []
+        self._busy = False
+        self._seq = 0
+        self._current_model: Optional[str] = None
+        self._loaded: Set[str] = set()
+        self._loaded_at = 0.0
+        self._pinned: Set[str] = set()
+        self._background: Set[asyncio.Task] = set()
+        self.stats: Dict[str, int] = {'requests': 0, 'reordered': 0, 'swaps': 0, 'swaps_avoided': 0,
+                                      'pins': 0, 'unloads': 0}
+
+    # ---- 驻留模型 ----
+
+    async def _refresh_loaded(self, force: bool = False):
+        """刷新驻留内存的模型列表（/api/ps）"""
+        if not force and time.monotonic() - self._loaded_at < LOADED_MODELS_TTL:
+            return
+        from utils.ollama_health import get_json
+        running = await asyncio.to_thread(get_json, "/api/ps")
+        if running is not None:
+            self._loaded = {model.get('model') or model.get('name', '') for model in running.get('models', [])}
+        self._loaded_at = time.monotonic()
+
+    def _is_loaded(self, model: Optional[str]) -> bool:
+        # 不需要模型的请求（如 xs bench tune）不会引起切换
+        return model is None or model == self._current_model or model in self._loaded
+
+    # ---- 排队与分派 ----
+
+    @contextlib.asynccontextmanager
+    async def slot(self, model: Optional[str]):
+        """
+        等待轮到该请求执行；退出上下文时让出执行权
+
+        Args:
+            model: 请求将使用的模型名，None 表示不使用模型
+        """
+        self._seq += 1
+        ticket = _Ticket(model, self._seq)
+        self._queue.append(ticket)
+        self.stats['requests'] += 1
+        try:
+            # 查询驻留模型时被取消也要把请求移出队列，否则后面的请求永远轮不到
+            await self._refresh_loaded()
+            self._dispatch()
+            await ticket.granted.wait()
+        except asyncio.CancelledError:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+            elif ticket.granted.is_set():
+                await self._release()
+            raise
+        try:
+            # 上下文内发出的模型请求带上调度器决定的 keep_alive
+            with override_keep_alive(ticket.keep_alive):
+                yield
+        finally:
+            await self._release()
+
+    async def _release(self):
+        self._busy = False
+        await self._refresh_loaded(force=True)
+        self._dispatch()
+
+    def _choose(self) -> _Ticket:
+        """选出下一个执行的请求"""
+        head = self._queue[0]
+        if head.skips >= self.max_skips or self._is_loaded(head.model):
+            return head
+        for ticket in self._queue[1:]:
+            if self._is_loaded(ticket.model):
+                return ticket
+        return head
+
+    def _dispatch(self):
+        if self._busy or not self._queue:
+            return
+        head = self._queue[0]
+        ticket = self._choose()
+        if ticket is not head:
+            # 插队：排在前面的请求各记一次跳过
+            for waiting in self._queue[:self._queue.index(ticket)]:
+                waiting.skips += 1
+            self.stats['reordered'] += 1
+            self.stats['swaps_avoided'] += 1
+            self._log(f"[调度] 先执行已加载的 {ticket.model}，推迟 {head.model}（避免一次模型切换）")
+        self._queue.remove(ticket)
+
+        if not self._is_loaded(ticket.model):
+            self.stats['swaps'] += 1
+            self._prepare_swap(ticket.model)
+        if ticket.model is not None:
+            self._current_model = ticket.model
+        ticket.keep_alive = self._manage_pins(ticket.model)
+
+        self._busy = True
+        ticket.granted.set()
+
+    # ---- 固定与卸载 ----
+
+    def _queued_models(self) -> Set[Optional[str]]:
+        return {ticket.model for ticket in self._queue}
+
+    def _manage_pins(self, running_model: Optional[str]):
+        """
+        决定即将执行的请求使用的 keep_alive
+
+        Returns:
+            队列中还有同一模型的请求时返回 -1（该请求把模型固定在内存中），否则返回 None（默认值，同时解除固定）
+        """
+        if not self.pin:
+            return None
+        queued = self._queued_models()
+        keep_alive = None
+        if running_model is not None and running_model in queued:
+            self._pinned.add(running_model)
+            self.stats['pins'] += 1
+            keep_alive = -1
+        else:
+            self._pinned.discard(running_model)
+        # 排队的请求被取消后，之前固定的模型没有后续请求来恢复默认 keep_alive，单独恢复
+        for model in list(self._pinned):
+            if model != running_model and model not in queued:
+                self._pinned.discard(model)
+                self._set_keep_alive(model, None)
+        return keep_alive
+
+    def _prepare_swap(self, model: Optional[str]):
+        """驻留数量已达上限时，主动卸载队列中不再需要的模型，为即将加载的模型腾出内存"""
+        if not self.pin or model is None:
+            return
+        limit = config.get_server_config()['max_loaded_models']
+        if not limit.isdigit() or len(self._loaded) < int(limit):
+            return
+        queued = self._queued_models()
+        for loaded_model in sorted(self._loaded):
+            if loaded_model not in queued and loaded_model != model:
+                self.stats['unloads'] += 1
+                self._pinned.discard(loaded_model)
+                self._loaded.discard(loaded_model)
+                self._log(f"[调度] 卸载队列中不再需要的 {loaded_model}，为 {model} 腾出内存")
+                self._set_keep_alive(loaded_model, 0)
+                break
+
+    def _set_keep_alive(self, model: str, keep_alive):
+        """
+        发送空请求调整模型的驻留时间（0 表示立即卸载，None 表示恢复服务端默认值）
+
+        与真实请求一样经由后端路由发送：配置了多个 [backends] 时发往驻留该模型的后端
+        """
+        from utils.backend_router import get_routed_client
+
+        async def request():
+            with contextlib.suppress(Exception):
+                await get_routed_client().generate(model=model, prompt='', keep_alive=keep_alive)
+
+        task = asyncio.ensure_future(request())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def close(self):
+        """恢复所有被固定模型的默认 keep_alive"""
+        for model in list(self._pinned):
+            self._set_keep_alive(model, None)
+        self._pinned.clear()
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+    # ---- 报告 ----
+
+    def _log(self, line: str):
+        if self.report is not None:
+            self.report(line)
+
+    def describe(self) -> List[str]:
+        """调度统计"""
+        stats = self.stats
+        return [
+            f"调度请求: {stats['requests']}  重新排序: {stats['reordered']}",
+            f"模型切换: {stats['swaps']}  避免的切换: {stats['swaps_avoided']}",
+            f"固定模型的请求: {stats['pins']} 次  主动卸载: {stats['unloads']} 次",
+        ]
@@ -0,0 +1,243 @@
+"""
+批量 OCR
+xs ocr 原本一次只处理一张图片；成千上万张票据、扫描件意味着同样多次冷启动的 xs 进程。
+
+`xs ocr <目录|通配符>...` 在一个进程中处理所有图片：
+- 目录递归查找图片，通配符支持 **；结果按路径排序、去重
+- 固定数量的 worker 从工作队列中取图片，直接调用 OCR 模型（ocr_utils.ocr_direct），并发数见 [ocr] batch_concurrency
+- 每张图片识别完成后立即向 JSONL 文件追加一行（路径、内容哈希、文字、耗时），中断后重新运行时
+  跳过哈希已在结果文件中的图片；失败的图片记录错误，下次运行时重试
+- 内容相同的重复文件只识别一次，但每个路径都有自己的一行（duplicate_of 指向实际识别的文件），
+  按路径查找结果时不会遗漏
+- 进度行显示完成数、跳过数、失败数、吞吐量和预计剩余时间
+"""
+import os
+import sys
+import glob
+import json
+import time
+import asyncio
+from typing import Dict, Iterable, List, Set, Tuple
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+# 输出不是终端时（重定向、守护进程）进度行的最短间隔（秒）
+PROGRESS_INTERVAL = 2.0
+
+
+def is_batch_input(arg: str) -> bool:
+    """参数是否为目录或通配符（文件名本身含 [ ] * ? 的现有文件不算）"""
+    if os.path.isfile(arg):
+        return False
+    return os.path.isdir(arg) or glob.has_magic(arg)
+
+
+def collect_images(inputs: Iterable[str]) -> List[str]:
+    """展开目录和通配符，返回图片文件路径（按路径排序、去重）"""
+    images = []
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(root, name) for root, _, names in os.walk(item) for name in names]
+        elif glob.has_magic(item) and not os.path.isfile(item):
+            candidates = glob.glob(item, recursive=True)
+        else:
+            candidates = [item]
+        for path in sorted(candidates):
+            absolute = os.path.abspath(path)
+            if absolute not in seen and path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+                seen.add(absolute)
+                images.append(absolute)
+    return images
+
+
+def load_done(output_path: str) -> Tuple[Dict[str, dict], Set[str]]:
+    """
+    读取结果文件中已成功识别的图片（忽略中断时写了一半的行）
+
+    Returns:
+        (图片哈希 -> 识别记录, 已有记录的路径)
+    """
+    done = {}
+    recorded = set()
+    if not os.path.exists(output_path):
+        return done, recorded
+    with open(output_path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get('sha256') and 'error' not in record:
+                done.setdefault(record['sha256'], record)
+                recorded.add(record.get('path'))
+    return done, recorded
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}时{seconds % 3600 // 60:02d}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60:02d}秒"
+    return f"{seconds}秒"
+
+
+class BatchProgress:
+    """批量任务的进度统计与进度行"""
+
+    def __init__(self, total: int, stream=None):
+        self.total = total
+        self.stream = stream if stream is not None else sys.stdout
+        isatty = getattr(self.stream, 'isatty', None)
+        self.tty = bool(isatty and isatty())
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.start = time.monotonic()
+        self._last_report = 0.0
+
+    def line(self) -> str:
+        processed = self.done + self.failed
+        finished = processed + self.skipped
+        elapsed = time.monotonic() - self.start
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        text = (f"[批量OCR] {finished}/{self.total}  完成 {self.done}  跳过 {self.skipped}  失败 {self.failed}  "
+                f"{rate:.2f} 张/秒")
+        if rate > 0 and finished < self.total:
+            text += f"  预计剩余 {_format_duration((self.total - finished) / rate)}"
+        return text
+
+    def update(self, force: bool = False):
+        now = time.monotonic()
+        if self.tty:
+            # 终端中原地刷新同一行
+            self.stream.write('\r' + self.line() + '\033[K')
+            self.stream.flush()
+        elif force or now - self._last_report >= PROGRESS_INTERVAL:
+            self.stream.write(self.line() + '\n')
+            self.stream.flush()
+            self._last_report = now
+
+    def finish(self):
+        if self.tty:
+            self.stream.write('\r' + self.line() + '\033[K\n')
+            self.stream.flush()
+        else:
+            self.update(force=True)
+
+
+async def run_ocr_batch(images: List[str], prompt: str, output_path: str, concurrency: int) -> Dict[str, int]:
+    """
+    批量识别图片，结果逐行追加到 JSONL 文件
+
+    Args:
+        images: 图片路径（collect_images 的结果）
+        prompt: 用户的识别要求
+        output_path: 结果文件路径，已存在时跳过其中已识别的图片
+        concurrency: 同时进行的识别请求数
+
+    Returns:
+        {'total', 'done', 'skipped', 'failed'}
+    """
+    from agents.ocr_agent import get_ocr_agent
+    from utils.ocr_utils import build_ocr_prompt, ocr_direct
+    from utils.response_cache import hash_file
+
+    agent = get_ocr_agent().agent
+    ocr_prompt = build_ocr_prompt(prompt)
+    done, recorded = load_done(output_path)
+    # 正在识别的图片哈希 -> 等待同一结果的重复文件路径
+    claimed: Dict[str, List[str]] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for path in images:
+        queue.put_nowait(path)
+    progress = BatchProgress(len(images))
+
+    # 上次中断时最后一行可能只写了一半，先补上换行
+    needs_newline = False
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        if needs_newline:
+            out.write('\n')
+
+        def write_record(record: dict):
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            out.flush()
+
+        def write_duplicate(path: str, original: dict):
+            """为内容相同的重复文件写一行，文字（或错误）取自实际识别的文件"""
+            record = {'path': path, 'sha256': original['sha256'], 'duplicate_of': original['path']}
+            for field in ('text', 'model', 'error'):
+                if field in original:
+                    record[field] = original[field]
+            write_record(record)
+
+        async def worker():
+            while True:
+                try:
+                    path = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    digest = await asyncio.to_thread(hash_file, path)
+                except OSError as e:
+                    write_record({'path': path, 'sha256': None, 'error': str(e)})
+                    progress.failed += 1
+                    progress.update()
+                    continue
+                hash_ms = (time.perf_counter() - start) * 1000
+
+                # 已识别过：本路径没有记录时（内容相同的另一个文件）补写一行
+                if digest in done:
+                    if path not in recorded:
+                        write_duplicate(path, done[digest])
+                        recorded.add(path)
+                    progress.skipped += 1
+                    progress.update()
+                    continue
+                # 内容相同的文件正在识别，等它完成后一起写记录
+                if digest in claimed:
+                    claimed[digest].append(path)
+                    progress.skipped += 1
+                    progress.update()
+                    continue
+                claimed[digest] = []
+
+                ocr_start = time.perf_counter()
+                try:
+                    text = await ocr_direct(agent, ocr_prompt, path)
+                except Exception as e:
+                    record = {'path': path, 'sha256': digest, 'error': str(e),
+                              'timings': {'hash_ms': round(hash_ms, 1),
+                                          'ocr_ms': round((time.perf_counter() - ocr_start) * 1000, 1)}}
+                    write_record(record)
+                    for duplicate in claimed.pop(digest):
+                        write_duplicate(duplicate, record)
+                    progress.failed += 1
+                    progress.update()
+                    continue
+                record = {'path': path, 'sha256': digest, 'text': text.strip(), 'model': agent.model.model_name,
+                          'timings': {'hash_ms': round(hash_ms, 1),
+                                      'ocr_ms': round((time.perf_counter() - ocr_start) * 1000, 1)}}
+                write_record(record)
+                done[digest] = record
+                recorded.add(path)
+                for duplicate in claimed.pop(digest):
+                    write_duplicate(duplicate, record)
+                    recorded.add(duplicate)
+                progress.done += 1
+                progress.update()
+
+        progress.update(force=True)
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(images))))))
+        finally:
+            progress.finish()
+
+    return {'total': len(images), 'done': progress.done, 'skipped': progress.skipped, 'failed': progress.failed}
@@ -0,0 +1,169 @@
+"""
+分块 OCR 的切分与拼接
+长截图、文档扫描件整张发给模型时要么被缩小到看不清文字，要么远超模型的有效分辨率。
+分块 OCR 把图片切成横向条带分别识别，再按顺序拼接：
+
+- 切分点：对灰度图做行投影（每行与背景色差异明显的像素数），在目标高度附近选空白行切开，不会切断文字行；
+  找不到空白行时直接在目标高度切开
+- 相邻条带有重叠：条带向下延伸到重叠范围内最远的空白行，下一条带从重叠范围内最近的空白行开始，
+  重叠区域中的文字行在两个条带中都是完整的
+- 拼接时去掉前一条带末尾与后一条带开头重复识别的行（忽略空白差异、允许个别字符识别不同）；
+  重叠区域全是空白时两个条带不会识别出同一行，不做去重，避免误删内容相同的相邻行（例如票据上相同的条目）
+"""
+import difflib
+from typing import TYPE_CHECKING, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 与背景的灰度差超过该值的像素视为文字
+INK_THRESHOLD = 40
+
+# 文字像素数不超过行宽的该比例时视为空白行（容忍噪点和细线）
+BLANK_ROW_RATIO = 0.002
+
+# 在目标切分点之前多大范围内（占目标高度的比例）寻找空白行
+SEARCH_RATIO = 0.25
+
+# 拼接时最多比较的重复行数
+MAX_OVERLAP_LINES = 8
+
+# 两行视为同一行的最低相似度
+LINE_SIMILARITY = 0.85
+
+
+def blank_rows(gray) -> "np.ndarray":
+    """
+    行投影：返回每一行是否为空白行的布尔数组
+
+    Args:
+        gray: 灰度像素数组（高 x 宽，uint8）
+    """
+    import numpy as np
+
+    # 背景色取中位数，浅色和深色主题都适用
+    background = int(np.median(gray[:, ::max(1, gray.shape[1] // 256)]))
+    ink = np.abs(gray.astype(np.int16) - background) > INK_THRESHOLD
+    return ink.sum(axis=1) <= max(1, int(gray.shape[1] * BLANK_ROW_RATIO))
+
+
+def find_bands(gray, tile_height: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    沿空白行把图片切成有重叠的横向条带
+
+    Args:
+        gray: 灰度像素数组
+        tile_height: 每个条带的目标高度
+        overlap: 相邻条带的重叠高度
+
+    Returns:
+        [(起始行, 结束行), ...]，结束行不包含在内；图片不高于 tile_height 时只有一个条带
+    """
+    import numpy as np
+
+    height = gray.shape[0]
+    if tile_height <= 0 or height <= tile_height:
+        return [(0, height)]
+
+    blank = blank_rows(gray)
+    blank_index = np.flatnonzero(blank)
+    window = max(1, int(tile_height * SEARCH_RATIO))
+
+    cuts = []
+    position = 0
+    while height - position > tile_height:
+        target = position + tile_height
+        # 目标切分点之前（不早于 target - window）最靠后的空白行
+        candidates = blank_index[(blank_index > target - window) & (blank_index <= target)]
+        cut = int(candidates[-1]) if len(candidates) else target
+        cuts.append((cut, bool(len(candidates))))
+        position = cut
+
+    bands = []
+    start = 0
+    for cut, on_blank in cuts:
+        if on_blank:
+            # 重叠范围内向下最远、向上最近的空白行，重叠区域只包含完整的文字行
+            below = blank_index[(blank_index >= cut) & (blank_index <= cut + overlap)]
+            above = blank_index[(blank_index >= cut - overlap) & (blank_index <= cut)]
+            end, next_start = int(below[-1]) + 1, int(above[0])
+        else:
+            end, next_start = min(height, cut + overlap), max(0, cut - overlap)
+        bands.append((start, end))
+        start = next_start
+    bands.append((start, height))
+    return bands
+
+
+def overlaps_with_ink(gray, bands: Sequence[Tuple[int, int]]) -> List[bool]:
+    """
+    每个条带与前一条带的重叠区域中是否有文字（第一个条带为 False）
+
+    Args:
+        gray: 灰度像素数组
+        bands: find_bands 的结果
+    """
+    blank = blank_rows(gray)
+    result = [False]
+    for (_, previous_end), (start, _) in zip(bands, bands[1:]):
+        result.append(start < previous_end and not bool(blank[start:previous_end].all()))
+    return result
+
+
+def _normalize(line: str) -> str:
+    return ''.join(line.split())
+
+
+def _same_line(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio() >= LINE_SIMILARITY
+
+
+def overlap_length(previous: Sequence[str], following: Sequence[str]) -> int:
+    """前一条带末尾与后一条带开头重复的行数（只比较非空行）"""
+    tail = [_normalize(line) for line in previous if line.strip()][-MAX_OVERLAP_LINES:]
+    head = [_normalize(line) for line in following if line.strip()][:MAX_OVERLAP_LINES]
+    for count in range(min(len(tail), len(head)), 0, -1):
+        if all(_same_line(a, b) for a, b in zip(tail[-count:], head[:count])):
+            return count
+    return 0
+
+
+class TextStitcher:
+    """按条带顺序拼接识别结果，去掉重叠区域的重复行"""
+
+    def __init__(self):
+        self._lines: List[str] = []
+
+    def add(self, text: str, dedup: bool = True) -> str:
+        """
+        追加下一个条带的文字
+
+        Args:
+            text: 条带的识别结果
+            dedup: 是否去掉与前一条带重复的行（重叠区域没有文字时应为 False）
+
+        Returns:
+            去重后新增的文字（可直接输出到终端）
+        """
+        lines = text.strip('\n').splitlines()
+        skip = overlap_length(self._lines, lines) if dedup else 0
+        # 跳过开头的 skip 个非空行及其间的空行
+        index = 0
+        while skip and index < len(lines):
+            if lines[index].strip():
+                skip -= 1
+            index += 1
+        new_lines = lines[index:]
+        while new_lines and not new_lines[0].strip():
+            new_lines.pop(0)
+        if not new_lines:
+            return ''
+        added = ('\n' if self._lines else '') + '\n'.join(new_lines)
+        self._lines.extend(new_lines)
+        return added
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self._lines)
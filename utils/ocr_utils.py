@@ -3,26 +3,46 @@ OCR 工具函数
 提供文字识别相关的辅助功能
 """
 import os
-import tempfile
+import time
+import contextlib
 from PIL import Image
-from agentscope.message import Msg, TextBlock, ImageBlock, Base64Source
+from agentscope.message import Msg, TextBlock, ImageBlock
 from agentscope.tool import ToolResponse
-from agents.ocr_agent import ocr_agent
+from agentscope.model import ChatResponse
+from agents.ocr_agent import get_ocr_agent
+from utils.response_cache import get_response_cache, make_agent_key
+from utils.image_hash import fingerprint
+from utils.image_prep import image_source, prepare_image
+from utils.ollama_health import invalidate_on_connection_error
+from config_manager import config
 import asyncio
+from typing import TYPE_CHECKING, Union
 
-async def ocr_image(prompt: str, image_path: str):
+if TYPE_CHECKING:
+    from utils.clipboard_image import ClipboardImage
+
+# 分块识别的结果与整张识别分别缓存
+TILED_KEY_SUFFIX = "\0tiled"
+
+def build_ocr_prompt(prompt: str) -> str:
+    """把用户的识别要求优化为OCR专用提示词"""
+    return f"请识别图片中的文字内容。{prompt}" if prompt.strip() else "请识别图片中的所有文字内容。"
+
+async def run_ocr(prompt: str, image_path: Union[str, "ClipboardImage"], printer=None, tiled: bool = False):
     """
-    专用OCR文字识别工具
+    OCR文字识别的内部入口（main.py 的 xs ocr 使用）：在 ocr_image 工具的基础上支持增量输出和分块识别
 
     Args:
         prompt: 用户的提示词（会被优化为OCR专用）
-        image_path: 图片文件路径
+        image_path: 图片文件路径，或内存中的剪贴板图片（utils.clipboard_image.ClipboardImage）
+        printer: AgentStreamPrinter，识别过程中把文字增量输出到终端；None 表示识别完成后一次返回
+        tiled: 分块识别（长截图、文档扫描件切成横向条带并发识别，见 ocr_tiled）
 
     Returns:
-        ToolResponse: 识别的文字内容
+        ToolResponse: 识别的文字内容；已增量输出时 metadata 中 'streamed' 为 True
     """
-    # 验证图片文件
-    if not os.path.exists(image_path):
+    # 验证图片文件（内存中的剪贴板图片不需要）
+    if isinstance(image_path, str) and not os.path.exists(image_path):
         return ToolResponse(
             content=[
                 TextBlock(
@@ -33,8 +53,7 @@ async def ocr_image(prompt: str, image_path: str):
         )
 
     # 检查文件大小
-    file_size = os.path.getsize(image_path)
-    if file_size == 0:
+    if isinstance(image_path, str) and os.path.getsize(image_path) == 0:
         return ToolResponse(
             content=[
                 TextBlock(
@@ -44,8 +63,27 @@ async def ocr_image(prompt: str, image_path: str):
             ]
         )
 
+    if tiled:
+        return await ocr_tiled(prompt, image_path, printer)
+
     # 优化提示词为OCR专用
-    ocr_prompt = f"请识别图片中的文字内容。{prompt}" if prompt.strip() else "请识别图片中的所有文字内容。"
+    ocr_prompt = build_ocr_prompt(prompt)
+
+    # 相同图片内容 + 相同提示词直接返回缓存结果
+    ocr_agent = get_ocr_agent()
+    cache_key = make_agent_key(ocr_agent.agent, ocr_prompt, [image_path])
+    if cache_key:
+        cached = get_response_cache().get(cache_key)
+        if cached:
+            return ToolResponse(
+                content=[
+                    TextBlock(
+                        type="text",
+                        text=cached['text']
+                    )
+                ],
+                metadata={'cached': True}
+            )
 
     # 创建消息
     msg = Msg(
@@ -58,17 +96,18 @@ async def ocr_image(prompt: str, image_path: str):
             ),
             ImageBlock(
                 type="image",
-                source=Base64Source(
-                    type="url",
-                    url=image_path
-                )
+                # 缩小、转灰度后再发送（预处理关闭或失败时仍使用原文件）
+                source=image_source(image_path, 'ocr', report=lambda line: print(line, flush=True))
             )
         ]
     )
 
     try:
         # 调用OCR代理
-        result = await ocr_agent(msg)
+        start = time.perf_counter()
+        with printer.attach(ocr_agent.agent) if printer else contextlib.nullcontext():
+            result = await ocr_agent(msg)
+        elapsed_ms = (time.perf_counter() - start) * 1000
 
         # 提取纯文本结果
         if hasattr(result, 'content') and result.content:
@@ -76,13 +115,18 @@ async def ocr_image(prompt: str, image_path: str):
                 if isinstance(block, dict) and block.get('type') == 'text':
                     text_result = block.get('text', '').strip()
                     if text_result:
+                        if cache_key:
+                            get_response_cache().put(cache_key, ocr_agent.agent.model.model_name,
+                                                     text_result, {'elapsed_ms': elapsed_ms})
                         return ToolResponse(
                             content=[
                                 TextBlock(
                                     type="text",
                                     text=text_result
                                 )
-                            ]
+                            ],
+                            metadata={'cached': False,
+                                      'streamed': printer is not None and printer.streamed(result)}
                         )
 
         return ToolResponse(
@@ -95,6 +139,7 @@ async def ocr_image(prompt: str, image_path: str):
         )
 
     except Exception as e:
+        invalidate_on_connection_error(e)
         return ToolResponse(
             content=[
                 TextBlock(
@@ -104,46 +149,245 @@ async def ocr_image(prompt: str, image_path: str):
             ]
         )
 
-def preprocess_image_for_ocr(image_path: str) -> str:
+async def ocr_image(prompt: str, image_path: str):
     """
-    为OCR预处理图片
+    专用OCR文字识别工具
 
     Args:
-        image_path: 原始图片路径
+        prompt: 用户的提示词（会被优化为OCR专用）
+        image_path: 图片文件路径
 
     Returns:
-        str: 预处理后的图片路径
+        ToolResponse: 识别的文字内容
     """
-    try:
-        img = Image.open(image_path)
+    return await run_ocr(prompt, image_path)
+
+async def run_clipboard_ocr(prompt: str, image_path: Union[str, "ClipboardImage"], printer=None,
+                            tiled: bool = False):
+    """
+    剪贴板截图的OCR：先查找之前识别过的近似截图，未命中时再调用 run_ocr
+
+    同一张截图重复粘贴或重新截取（只差几个像素）时文件内容不同，精确缓存无法命中；
+    这里先按感知哈希筛选候选，再逐像素确认，复用之前的结果而不必再次调用视觉模型。
+
+    Args:
+        prompt: 用户的识别要求
+        image_path: 内存中的剪贴板图片（ClipboardImage），或剪贴板图片保存后的文件路径
+        printer: 未命中时传给 run_ocr 的 AgentStreamPrinter
+        tiled: 未命中时分块识别（分块与整张识别的结果分别索引）
+
+    Returns:
+        ToolResponse: 识别的文字内容；近似命中时 metadata 中带有 'distance'
+    """
+    cache = get_response_cache()
+    ocr_prompt = build_ocr_prompt(prompt) + (TILED_KEY_SUFFIX if tiled else '')
+    signature = make_agent_key(get_ocr_agent().agent, ocr_prompt) if cache else None
+    image_print = fingerprint(image_path) if signature else None
+    cache_config = config.get_cache_config()
+
+    if image_print is not None:
+        image_hash, gray = image_print
+        similar = cache.find_similar(signature, image_hash, gray,
+                                     cache_config['similar_max_distance'],
+                                     cache_config['similar_max_pixels'])
+        if similar:
+            return ToolResponse(
+                content=[
+                    TextBlock(
+                        type="text",
+                        text=similar['text']
+                    )
+                ],
+                metadata={'cached': True, 'distance': similar['distance']}
+            )
+
+    result = await run_ocr(prompt, image_path, printer, tiled)
+
+    # 只有成功识别的结果（带 metadata）才加入索引，错误提示不缓存
+    if image_print is not None and result.metadata is not None:
+        text = ''.join(block.get('text', '') for block in result.content if isinstance(block, dict))
+        if text:
+            cache.add_similar(signature, image_hash, gray, text, cache_config['similar_max_entries'])
+    return result
+
+async def ocr_clipboard_image(prompt: str, image_path: str):
+    """
+    剪贴板截图的OCR（识别完成后一次返回，见 run_clipboard_ocr）
+
+    Args:
+        prompt: 用户的识别要求
+        image_path: 剪贴板图片保存后的文件路径
+
+    Returns:
+        ToolResponse: 识别的文字内容
+    """
+    return await run_clipboard_ocr(prompt, image_path)
+
+async def ocr_direct(agent, ocr_prompt: str, image: Union[str, "ClipboardImage"]) -> str:
+    """
+    直接调用 OCR 模型识别一张图片（或一个条带），不经过 ReActAgent：
+    请求之间不共享 Agent 的记忆，可以并发（分块识别、批量识别）
+
+    Args:
+        agent: OCR 的 ReActAgent（使用其中的模型、格式化器和系统提示词）
+        ocr_prompt: OCR 提示词
+        image: 图片路径或 ClipboardImage
+
+    Returns:
+        识别出的文字
+    """
+    # 缩小、编码在线程中进行，与进行中的模型请求重叠
+    source = await asyncio.to_thread(image_source, image, 'ocr')
+    msg = Msg(
+        name="user",
+        role="user",
+        content=[
+            TextBlock(type="text", text=ocr_prompt),
+            ImageBlock(type="image", source=source)
+        ]
+    )
+    prompt = await agent.formatter.format([Msg("system", agent.sys_prompt, "system"), msg])
+    response = await agent.model(prompt)
 
-        # 预处理步骤
-        # 1. 转换为RGB模式（如果不是）
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+    # 流式响应中每个数据块都是截至目前累积的内容，取最后一块
+    chunks = [response] if isinstance(response, ChatResponse) else [chunk async for chunk in response]
+    return ''.join(block.get('text', '') for block in chunks[-1].content
+                   if block.get('type') == 'text') if chunks else ''
 
-        # 2. 可选：调整大小以提高识别速度
-        max_size = 2048
-        if max(img.size) > max_size:
-            ratio = max_size / max(img.size)
-            new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-            img = img.resize(new_size, Image.Resampling.LANCZOS)
+async def ocr_tiled(prompt: str, image_path: Union[str, "ClipboardImage"], printer=None):
+    """
+    分块OCR：沿空白行把图片切成有重叠的横向条带，限制并发数同时识别，再按顺序拼接并去掉重叠的重复行
 
-        # 3. 可选：增强对比度
-        from PIL import ImageEnhance
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(1.2)
+    条带划分与并发数见 [ocr]；图片不高于一个条带时与 ocr_image 相同。
 
-        # 保存预处理后的图片
-        temp_dir = tempfile.gettempdir()
-        processed_path = os.path.join(temp_dir, f"ocr_processed_{os.path.basename(image_path)}")
-        img.save(processed_path, 'PNG')
+    Args:
+        prompt: 用户的识别要求
+        image_path: 图片文件路径或内存中的 ClipboardImage
+        printer: AgentStreamPrinter，前面的条带都识别完成后立即输出该条带新增的文字
 
-        return processed_path
+    Returns:
+        ToolResponse: 拼接后的文字；metadata 中 'tiles' 为条带数
+    """
+    import numpy as np
+    from PIL import ImageOps
+    from utils.clipboard_image import ClipboardImage
+    from utils.ocr_tiles import TextStitcher, find_bands, overlaps_with_ink
+
+    ocr_config = config.get_ocr_config()
+    ocr_prompt = build_ocr_prompt(prompt)
+    ocr_agent = get_ocr_agent()
+    cache_key = make_agent_key(ocr_agent.agent, ocr_prompt + TILED_KEY_SUFFIX, [image_path])
+    if cache_key:
+        cached = get_response_cache().get(cache_key)
+        if cached:
+            return ToolResponse(
+                content=[
+                    TextBlock(
+                        type="text",
+                        text=cached['text']
+                    )
+                ],
+                metadata={'cached': True}
+            )
 
+    try:
+        if isinstance(image_path, ClipboardImage):
+            image = image_path.image
+        else:
+            with Image.open(image_path) as img:
+                image = ImageOps.exif_transpose(img)
+                image.load()
+        gray = np.asarray(image.convert('L'), dtype=np.uint8)
+        bands = find_bands(gray, ocr_config['tile_height'], ocr_config['tile_overlap'])
+    except (OSError, ValueError) as e:
+        return ToolResponse(
+            content=[
+                TextBlock(
+                    type="text",
+                    text=f"错误: 无法读取图片: {e}"
+                )
+            ]
+        )
+    if len(bands) == 1:
+        return await run_ocr(prompt, image_path, printer)
+
+    width, height = image.size
+    concurrency = ocr_config['tile_concurrency']
+    print(f"[系统] 分块识别: {width}x{height} 切分为 {len(bands)} 个条带，并发 {concurrency}", flush=True)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def recognize(top: int, bottom: int) -> str:
+        async with semaphore:
+            return await ocr_direct(ocr_agent.agent, ocr_prompt, ClipboardImage(image.crop((0, top, width, bottom))))
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(recognize(top, bottom)) for top, bottom in bands]
+    inked = overlaps_with_ink(gray, bands)
+    stitcher = TextStitcher()
+    try:
+        # 按条带顺序取结果：先完成的条带等前面的条带输出后再输出；重叠区域空白时不去重
+        for task, dedup in zip(tasks, inked):
+            added = stitcher.add(await task, dedup)
+            if printer is not None:
+                printer.write(added)
     except Exception as e:
-        print(f"图片预处理失败，使用原图: {e}")
-        return image_path
+        invalidate_on_connection_error(e)
+        return ToolResponse(
+            content=[
+                TextBlock(
+                    type="text",
+                    text=f"OCR识别过程中出现错误: {str(e)}"
+                )
+            ]
+        )
+    finally:
+        # 出错、Ctrl-C、超时或守护进程客户端断开（CancelledError）时取消其余条带，
+        # 关闭各自的流式连接，Ollama 随即停止生成
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if printer is not None:
+            printer.finish()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    text_result = stitcher.text.strip()
+    if not text_result:
+        return ToolResponse(
+            content=[
+                TextBlock(
+                    type="text",
+                    text="OCR识别完成，但未提取到文字内容"
+                )
+            ]
+        )
+    if cache_key:
+        get_response_cache().put(cache_key, ocr_agent.agent.model.model_name, text_result,
+                                 {'elapsed_ms': elapsed_ms, 'tiles': len(bands)})
+    return ToolResponse(
+        content=[
+            TextBlock(
+                type="text",
+                text=text_result
+            )
+        ],
+        metadata={'cached': False, 'streamed': printer is not None, 'tiles': len(bands)}
+    )
+
+def preprocess_image_for_ocr(image_path: str) -> str:
+    """
+    为OCR预处理图片（缩小到 [image] ocr_max_side、转为灰度，结果按图片内容缓存）
+
+    Args:
+        image_path: 原始图片路径
+
+    Returns:
+        str: 预处理后的图片路径，预处理关闭或失败时返回原路径
+    """
+    prepared = prepare_image(image_path, 'ocr')
+    return prepared.path if prepared is not None else image_path
 
 def format_ocr_result(text: str, preserve_formatting: bool = True) -> str:
     """
@@ -1,48 +1,505 @@
-import requests
+"""
+Ollama 服务健康检查
+提供就绪探测（指数退避轮询 /api/version）、带 TTL 的健康状态缓存、跨平台进程检测与服务启动，
+main.py 与本脚本的命令行入口共用同一套实现
+"""
+import os
+import sys
+import json
 import time
 import subprocess
-import sys
+from typing import Tuple
 
-def check_ollama_health():
-    """检查Ollama服务健康状态"""
+if not __package__:
+    # 作为脚本直接运行时，把项目根目录加入导入路径
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_manager import config
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 健康状态缓存文件名（位于日志目录）
+HEALTH_STATE_FILE = ".ollama_health.json"
+
+# 由 xs 启动的 Ollama 服务统一使用的日志、PID 和启动锁文件（位于日志目录）
+OLLAMA_LOG_FILE = "ollama.log"
+OLLAMA_PID_FILE = "ollama.pid"
+STARTUP_LOCK_FILE = ".ollama_start.lock"
+
+# [server] 配置项与 ollama serve 环境变量的对应关系
+SERVER_ENV_KEYS = {
+    'num_parallel': 'OLLAMA_NUM_PARALLEL',
+    'max_loaded_models': 'OLLAMA_MAX_LOADED_MODELS',
+    'keep_alive': 'OLLAMA_KEEP_ALIVE',
+    'flash_attention': 'OLLAMA_FLASH_ATTENTION',
+    'context_length': 'OLLAMA_CONTEXT_LENGTH',
+    'kv_cache_type': 'OLLAMA_KV_CACHE_TYPE',
+}
+
+
+def get_logs_dir() -> str:
+    """获取日志目录（相对路径以项目根目录为基准），不存在时创建"""
+    log_directory = config.get_system_config()['log_directory']
+    if not os.path.isabs(log_directory):
+        log_directory = os.path.join(PROJECT_ROOT, log_directory)
+    os.makedirs(log_directory, exist_ok=True)
+    return log_directory
+
+
+def probe_ollama(timeout: float = None) -> Tuple[bool, str]:
+    """
+    请求一次 /api/version 判断服务是否就绪（使用共享的同步连接池，重复检查时复用同一个连接）
+
+    Returns:
+        tuple: (是否就绪, 说明信息)
+    """
+    import httpx
+    from utils.ollama_transport import get_http_client
+
+    if timeout is None:
+        timeout = config.get_system_config()['connection_timeout']
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = get_http_client().get("/api/version", timeout=timeout)
         if response.status_code == 200:
-            return True, "Ollama服务正常"
-        else:
-            return False, f"Ollama服务响应异常: {response.status_code}"
-    except requests.exceptions.ConnectionError:
+            try:
+                version = response.json().get('version', '')
+            except ValueError:
+                version = ''
+            return True, f"Ollama服务正常 {version}".strip()
+        return False, f"Ollama服务响应异常: {response.status_code}"
+    except httpx.ConnectError:
         return False, "无法连接到Ollama服务"
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         return False, "Ollama服务响应超时"
-    except Exception as e:
+    except (OSError, httpx.HTTPError) as e:
         return False, f"检查Ollama服务时出错: {str(e)}"
 
+
+def get_json(path: str, timeout: float = None):
+    """请求 Ollama 的只读接口（如 /api/ps），失败时返回 None"""
+    import httpx
+    from utils.ollama_transport import get_http_client
+
+    if timeout is None:
+        timeout = config.get_system_config()['connection_timeout']
+    try:
+        response = get_http_client().get(path, timeout=timeout)
+        if response.status_code != 200:
+            return None
+        return response.json()
+    except (OSError, ValueError, httpx.HTTPError):
+        return None
+
+
+def wait_until_ready(timeout: float = None, initial_delay: float = 0.05, max_delay: float = 1.0) -> bool:
+    """
+    以指数退避轮询服务直到就绪，替代固定时长的 sleep
+
+    Args:
+        timeout: 最长等待时间（秒），默认取 [system] startup_timeout
+        initial_delay: 首次重试间隔（秒）
+        max_delay: 重试间隔上限（秒）
+
+    Returns:
+        bool: 超时前服务是否就绪
+    """
+    if timeout is None:
+        timeout = config.get_system_config()['startup_timeout']
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        remaining = deadline - time.monotonic()
+        ready, _ = probe_ollama(timeout=max(0.1, min(1.0, remaining)))
+        if ready:
+            record_healthy()
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def _health_state_path() -> str:
+    return os.path.join(get_logs_dir(), HEALTH_STATE_FILE)
+
+
+def _endpoint_key() -> str:
+    system_config = config.get_system_config()
+    return f"{system_config['ollama_host']}:{system_config['ollama_port']}"
+
+
+def record_healthy():
+    """记录最近一次确认服务健康的时间"""
+    try:
+        with open(_health_state_path(), 'w', encoding='utf-8') as f:
+            json.dump({'endpoint': _endpoint_key(), 'healthy_at': time.time()}, f)
+    except OSError:
+        pass
+
+
+def invalidate_health_cache():
+    """清除健康状态缓存，下一次调用会重新探测服务（服务已退出时重新启动）"""
+    try:
+        os.unlink(_health_state_path())
+    except OSError:
+        pass
+
+
+def invalidate_on_connection_error(error: BaseException) -> bool:
+    """
+    请求因连接不到 Ollama（连接失败、超时、连接断开）而失败时清除健康状态缓存
+
+    否则服务在 health_cache_ttl 内退出后，后续调用仍会信任缓存、跳过探测，不会重新启动服务
+
+    Returns:
+        是否为连接类错误
+    """
+    import httpx
+
+    # ollama 库把连接失败包装为内置的 ConnectionError（OSError 的子类）
+    if isinstance(error, (httpx.TransportError, OSError)):
+        invalidate_health_cache()
+        return True
+    return False
+
+
+def is_health_cache_fresh() -> bool:
+    """最近一次健康记录是否仍在 TTL 内"""
+    ttl = config.get_system_config()['health_cache_ttl']
+    if ttl <= 0:
+        return False
+    try:
+        with open(_health_state_path(), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if state.get('endpoint') != _endpoint_key():
+        return False
+    age = time.time() - state.get('healthy_at', 0)
+    return 0 <= age < ttl
+
+
+def is_ollama_ready(use_cache: bool = True) -> bool:
+    """
+    判断服务是否就绪：TTL 内有健康记录时直接返回，否则探测一次
+
+    Args:
+        use_cache: 是否使用健康状态缓存
+    """
+    if use_cache and is_health_cache_fresh():
+        return True
+    ready, _ = probe_ollama()
+    if ready:
+        record_healthy()
+    return ready
+
+
+def is_ollama_process_running() -> bool:
+    """跨平台检测 ollama 进程是否存在"""
+    try:
+        if os.name == 'nt':
+            result = subprocess.run(['tasklist', '/FI', 'IMAGENAME eq ollama.exe'],
+                                    capture_output=True, text=True, timeout=2)
+            return 'ollama.exe' in result.stdout
+
+        # Linux：直接扫描 /proc，不依赖外部命令
+        if os.path.isdir('/proc'):
+            for pid in os.listdir('/proc'):
+                if not pid.isdigit():
+                    continue
+                try:
+                    with open(f'/proc/{pid}/comm', 'r') as f:
+                        if f.read().strip() == 'ollama':
+                            return True
+                except OSError:
+                    continue
+            return False
+
+        # macOS 等其他类 Unix 系统
+        result = subprocess.run(['pgrep', '-x', 'ollama'], capture_output=True, text=True, timeout=2)
+        return result.returncode == 0
+    except (subprocess.TimeoutExpired, subprocess.SubprocessError, OSError):
+        return False
+
+
+def detect_vpn() -> bool:
+    """跨平台检测是否存在VPN网络接口（简单检测）"""
+    try:
+        if os.name == 'nt':
+            result = subprocess.run(['ipconfig'], capture_output=True, text=True, timeout=5)
+            return 'VPN' in result.stdout or 'Tunnel' in result.stdout
+
+        vpn_prefixes = ('tun', 'tap', 'wg', 'ppp', 'utun', 'ipsec')
+        if os.path.isdir('/sys/class/net'):
+            interfaces = os.listdir('/sys/class/net')
+        else:
+            result = subprocess.run(['ifconfig', '-l'], capture_output=True, text=True, timeout=5)
+            interfaces = result.stdout.split()
+        return any(name.startswith(vpn_prefixes) for name in interfaces)
+    except (subprocess.TimeoutExpired, subprocess.SubprocessError, OSError):
+        return False
+
+
+def is_ollama_installed() -> bool:
+    """检查ollama命令是否存在"""
+    try:
+        result = subprocess.run(['ollama', '--version'], capture_output=True, text=True, timeout=5)
+        return result.returncode == 0
+    except (subprocess.TimeoutExpired, FileNotFoundError, OSError):
+        return False
+
+
+def start_ollama_server(log_handle=None, vpn_mode: bool = False) -> subprocess.Popen:
+    """
+    在后台启动 ollama serve
+
+    Args:
+        log_handle: 日志文件句柄，None 时丢弃输出
+        vpn_mode: VPN兼容模式（监听所有接口）
+
+    Returns:
+        subprocess.Popen: 服务进程
+    """
+    output = log_handle if log_handle is not None else subprocess.DEVNULL
+    env = os.environ.copy()
+    env.update(build_server_env())
+    if vpn_mode:
+        # VPN兼容模式：监听所有接口
+        port = config.get_system_config()['ollama_port']
+        env['OLLAMA_HOST'] = f'0.0.0.0:{port}'
+        env['OLLAMA_ORIGINS'] = '*'
+    return subprocess.Popen(['ollama', 'serve'], stdout=output, stderr=output, env=env)
+
+
+def build_server_env() -> dict:
+    """根据 [server] 配置生成 ollama serve 的环境变量（未配置的项不设置）"""
+    server_config = config.get_server_config()
+    return {env_name: str(server_config[key]) for key, env_name in SERVER_ENV_KEYS.items()
+            if str(server_config[key]).strip()}
+
+
+def _find_server_pid():
+    """在 Linux 上查找正在运行的 ollama serve 进程 PID"""
+    if not os.path.isdir('/proc'):
+        return None
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                argv = f.read().split(b'\0')
+        except OSError:
+            continue
+        if argv and os.path.basename(argv[0]) == b'ollama' and b'serve' in argv[1:]:
+            return int(pid)
+    return None
+
+
+def _read_process_env(pid: int):
+    """读取进程的 OLLAMA_* 环境变量，无权限或不支持时返回 None"""
+    try:
+        with open(f'/proc/{pid}/environ', 'rb') as f:
+            entries = f.read().split(b'\0')
+    except OSError:
+        return None
+    env = {}
+    for entry in entries:
+        name, _, value = entry.decode('utf-8', errors='replace').partition('=')
+        if name.startswith('OLLAMA_'):
+            env[name] = value
+    return env
+
+
+def _is_pid_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        result = subprocess.run(['tasklist', '/FI', f'PID eq {pid}'], capture_output=True, text=True)
+        return str(pid) in result.stdout
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+
+
+def get_running_server_env():
+    """
+    获取正在运行的 Ollama 服务实际使用的环境变量
+
+    优先读取进程的真实环境（Linux /proc），其次使用 xs 启动服务时的记录。
+
+    Returns:
+        tuple: (来源说明, 环境变量字典)；无法确定时返回 (None, None)
+    """
+    pid = _find_server_pid()
+    if pid is not None:
+        env = _read_process_env(pid)
+        if env is not None:
+            return f"/proc/{pid}/environ", env
+
+    record = read_server_pid()
+    if record and 'env' in record and _is_pid_alive(record['pid']):
+        return f"xs 启动记录 (PID {record['pid']})", record['env']
+    return None, None
+
+
+def describe_server_profile(only_mismatch: bool = False):
+    """
+    对比 [server] 配置与正在运行的服务实际使用的值
+
+    Args:
+        only_mismatch: 只返回与配置不一致的项
+
+    Returns:
+        list: 报告行；无法获取运行中服务的配置时返回说明行
+    """
+    configured = build_server_env()
+    source, running = get_running_server_env()
+    if running is None:
+        if only_mismatch:
+            return []
+        return ["无法获取运行中 Ollama 服务的启动参数（服务可能不是由 xs 启动的）"]
+
+    lines = []
+    for env_name in SERVER_ENV_KEYS.values():
+        want = configured.get(env_name, '')
+        have = running.get(env_name, '')
+        if only_mismatch and (not want or want == have):
+            continue
+        mark = '' if not want or want == have else '  ← 与配置不一致'
+        lines.append(f"  {env_name:<26}运行中: {have or '默认':<10}配置: {want or '默认'}{mark}")
+    if lines:
+        lines.insert(0, f"Ollama 服务启动参数（来源: {source}）:")
+    return lines
+
+
+def read_server_pid():
+    """读取由 xs 启动的 Ollama 服务的 PID 记录，没有记录时返回 None"""
+    try:
+        with open(os.path.join(get_logs_dir(), OLLAMA_PID_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def launch_ollama_server(report=print) -> bool:
+    """
+    在跨进程文件锁保护下启动 Ollama 服务
+
+    多个 xs 进程同时发现服务未运行时，只有第一个拿到锁的进程执行 ollama serve，
+    其余进程阻塞在同一把锁上，拿到锁后确认服务已就绪即直接复用。
+    日志统一追加到 logs/ollama.log，PID 与启动耗时记录在 logs/ollama.pid。
+
+    Args:
+        report: 输出进度信息的函数
+
+    Returns:
+        bool: 服务是否已就绪
+    """
+    from datetime import datetime
+    from utils.file_lock import FileLock
+
+    logs_dir = get_logs_dir()
+    startup_timeout = config.get_system_config()['startup_timeout']
+    wait_start = time.monotonic()
+
+    try:
+        lock = FileLock(os.path.join(logs_dir, STARTUP_LOCK_FILE), timeout=startup_timeout + 5)
+        lock.acquire()
+    except TimeoutError:
+        report("等待其他进程启动Ollama服务超时")
+        return False
+
+    try:
+        # 拿到锁时服务可能已被先到的进程启动
+        if probe_ollama()[0]:
+            record_healthy()
+            waited = time.monotonic() - wait_start
+            if waited > 0.05:
+                report(f"Ollama服务已由其他 xs 进程启动，等待 {waited:.1f} 秒后复用")
+            return True
+
+        # 检测是否需要VPN兼容模式
+        vpn_mode = detect_vpn()
+        if vpn_mode:
+            report("检测到VPN环境，使用兼容模式启动...")
+
+        log_path = os.path.join(logs_dir, OLLAMA_LOG_FILE)
+        start_time = time.monotonic()
+        with open(log_path, 'a', encoding='utf-8') as log_handle:
+            log_handle.write(f"\n===== {datetime.now():%Y-%m-%d %H:%M:%S} 由 xs (PID {os.getpid()}) 启动 =====\n")
+            log_handle.flush()
+            process = start_ollama_server(log_handle, vpn_mode=vpn_mode)
+        report(f"Ollama服务已在后台启动 (PID {process.pid})，日志保存至: {log_path}")
+
+        # 按指数退避轮询直到服务就绪
+        ready = wait_until_ready(startup_timeout)
+        startup_seconds = time.monotonic() - start_time
+
+        pid_record = {
+            'pid': process.pid,
+            'started_at': time.time(),
+            'startup_seconds': round(startup_seconds, 3),
+            'ready': ready,
+            'vpn_mode': vpn_mode,
+            'env': build_server_env(),
+        }
+        with open(os.path.join(logs_dir, OLLAMA_PID_FILE), 'w', encoding='utf-8') as f:
+            json.dump(pid_record, f)
+
+        if ready:
+            report(f"Ollama服务已就绪，启动耗时 {startup_seconds:.1f} 秒")
+            for line in describe_server_profile():
+                report(line)
+        else:
+            report(f"Ollama服务在 {startup_timeout:.0f} 秒内未就绪，请查看日志: {log_path}")
+        return ready
+    finally:
+        lock.release()
+
+
+def stop_ollama_processes():
+    """跨平台结束所有ollama进程"""
+    if os.name == 'nt':
+        subprocess.run(["taskkill", "/F", "/IM", "ollama.exe"], capture_output=True, text=True)
+        subprocess.run(["taskkill", "/F", "/IM", "ollama app.exe"], capture_output=True, text=True)
+    else:
+        subprocess.run(["pkill", "-x", "ollama"], capture_output=True, text=True)
+
+
+def check_ollama_health():
+    """检查Ollama服务健康状态（不使用缓存）"""
+    healthy, message = probe_ollama()
+    if healthy:
+        record_healthy()
+    else:
+        invalidate_health_cache()
+    return healthy, message
+
+
 def restart_ollama_service():
     """重启Ollama服务"""
     try:
         print("正在重启Ollama服务...")
 
         # 停止Ollama进程
-        subprocess.run(["taskkill", "/F", "/IM", "ollama.exe"],
-                      capture_output=True, text=True)
-        subprocess.run(["taskkill", "/F", "/IM", "ollama app.exe"],
-                      capture_output=True, text=True)
+        stop_ollama_processes()
+        invalidate_health_cache()
 
-        # 等待进程完全停止
-        time.sleep(2)
+        # 等待端口释放
+        deadline = time.monotonic() + 5
+        while probe_ollama(timeout=0.5)[0] and time.monotonic() < deadline:
+            time.sleep(0.2)
 
-        # 重新启动Ollama
-        subprocess.Popen(["ollama", "serve"],
-                        creationflags=subprocess.CREATE_NEW_CONSOLE)
-
-        # 等待服务启动
-        time.sleep(5)
-
-        return True, "Ollama服务重启完成"
+        # 重新启动Ollama并等待就绪
+        if launch_ollama_server():
+            return True, "Ollama服务重启完成"
+        return False, "Ollama服务已启动，但在超时前未就绪"
     except Exception as e:
         return False, f"重启Ollama服务失败: {str(e)}"
 
+
 def main():
     """主函数"""
     print("=== Ollama服务健康检查 ===")
@@ -58,19 +515,35 @@ def main():
 
         if success:
             # 再次检查
-            time.sleep(3)
             is_healthy, message = check_ollama_health()
             print(f"重启后状态: {message}")
 
         if not is_healthy:
             print("\n建议手动操作:")
-            print("1. 打开任务管理器，结束所有ollama进程")
+            print("1. 结束所有ollama进程（Windows：任务管理器；Linux/macOS：pkill ollama）")
             print("2. 重新启动Ollama应用程序")
             print("3. 或在命令行运行: ollama serve")
             return False
 
     print("\n✅ Ollama服务运行正常")
+    print_server_info()
     return True
 
+
+def print_server_info(report=print):
+    """输出运行中服务的启动参数及当前驻留内存的模型"""
+    for line in describe_server_profile():
+        report(line)
+
+    running_models = get_json("/api/ps")
+    if running_models is None:
+        return
+    models = running_models.get('models', [])
+    report(f"当前驻留内存的模型: {len(models)} 个")
+    for model in models:
+        size_gb = model.get('size', 0) / 1024 ** 3
+        report(f"  {model.get('name', '')}  {size_gb:.1f} GB  到期: {model.get('expires_at', '')}")
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,236 @@
+"""
+Ollama 共享传输层
+进程内所有 Ollama 调用（健康检查、原生流式输出、AgentScope 模型）共用同一组带 keep-alive 连接池的客户端，
+避免每次调用重复建立 TCP 连接和构造客户端
+
+每个服务地址有一个同步和一个异步 httpx 传输层（连接池）：
+- 同步：ollama.Client（get_client）与 get_http_client 共用，健康检查、/api/ps、嵌入请求走这里
+- 异步：ollama.AsyncClient（get_async_client）、AgentScope 模型与 get_async_http_client 共用，推理请求走这里
+同步与异步连接池无法互相复用连接，同步健康检查建立的连接不会被异步推理请求使用。
+
+说明：httpx 不支持 HTTP/1.1 管线化（Ollama 的流式响应也无法管线化），这里依靠连接池中的长连接复用来省去握手开销。
+"""
+import asyncio
+import threading
+import contextlib
+from contextvars import ContextVar
+from typing import Optional
+
+from config_manager import config
+
+_lock = threading.RLock()  # 创建客户端时会再次获取锁来创建共享的传输层
+
+# host -> httpx 传输层（连接池）
+_transports = {}
+_async_transports = {}
+
+# host -> ollama.Client / ollama.AsyncClient / httpx.Client / httpx.AsyncClient
+_clients = {}
+_async_clients = {}
+_http_clients = {}
+_async_http_clients = {}
+
+# 调度器为当前请求指定的 keep_alive（守护进程中队列里还有同一模型的请求时为 -1），None 表示不覆盖
+_keep_alive_override: ContextVar = ContextVar('keep_alive_override', default=None)
+
+
+@contextlib.contextmanager
+def override_keep_alive(keep_alive):
+    """在上下文内发出的模型请求使用指定的 keep_alive（None 表示不覆盖）"""
+    token = _keep_alive_override.set(keep_alive)
+    try:
+        yield
+    finally:
+        _keep_alive_override.reset(token)
+
+
+def request_keep_alive(default=None):
+    """本次请求实际使用的 keep_alive：调度器指定了覆盖值时使用覆盖值，否则使用场景配置的 default"""
+    override = _keep_alive_override.get()
+    return default if override is None else override
+
+
+def get_host_url(host: Optional[str] = None) -> str:
+    """获取 Ollama 服务地址，默认使用 [system] 中的 ollama_host/ollama_port"""
+    if host:
+        return host if '://' in host else f"http://{host}"
+    system_config = config.get_system_config()
+    return f"http://{system_config['ollama_host']}:{system_config['ollama_port']}"
+
+
+def _shared(cache: dict, url: str, factory):
+    """按服务地址缓存的单例"""
+    value = cache.get(url)
+    if value is None:
+        with _lock:
+            value = cache.get(url)
+            if value is None:
+                value = factory()
+                cache[url] = value
+    return value
+
+
+def _timeout():
+    """超时参数（来自 [system] 配置）"""
+    import httpx
+
+    system_config = config.get_system_config()
+    read_timeout = system_config['read_timeout'] or None  # 0 表示不限制，避免打断长时间的流式输出
+    return httpx.Timeout(connect=system_config['connection_timeout'], read=read_timeout,
+                         write=system_config['connection_timeout'], pool=system_config['connection_timeout'])
+
+
+def _limits():
+    """连接池参数（来自 [system] 配置）"""
+    import httpx
+
+    system_config = config.get_system_config()
+    return httpx.Limits(max_connections=system_config['pool_max_connections'],
+                        max_keepalive_connections=system_config['pool_max_connections'],
+                        keepalive_expiry=system_config['keepalive_expiry'])
+
+
+def _client_kwargs(url: str, asynchronous: bool = False) -> dict:
+    """创建客户端的参数：超时和该地址共享的传输层"""
+    import httpx
+
+    if asynchronous:
+        transport = _shared(_async_transports, url, lambda: httpx.AsyncHTTPTransport(limits=_limits()))
+    else:
+        transport = _shared(_transports, url, lambda: httpx.HTTPTransport(limits=_limits()))
+    return {'timeout': _timeout(), 'transport': transport}
+
+
+def get_client(host: Optional[str] = None):
+    """获取进程共享的同步 ollama.Client"""
+    from ollama import Client
+
+    url = get_host_url(host)
+    return _shared(_clients, url, lambda: Client(host=url, **_client_kwargs(url)))
+
+
+def get_async_client(host: Optional[str] = None):
+    """
+    获取进程共享的 ollama.AsyncClient
+
+    每个 xs 进程（包括守护进程）只运行一个事件循环，因此异步客户端按服务地址全局共享。
+    """
+    from ollama import AsyncClient
+
+    url = get_host_url(host)
+    return _shared(_async_clients, url, lambda: AsyncClient(host=url, **_client_kwargs(url, asynchronous=True)))
+
+
+def get_http_client(host: Optional[str] = None):
+    """
+    获取共享的同步 httpx.Client，用于 /api/version、/api/ps、/api/embed 等 ollama 库未封装或无需解析的接口
+
+    与 get_client() 共用同一个连接池；推理请求使用异步连接池，不会复用这里建立的连接。
+    """
+    import httpx
+
+    url = get_host_url(host)
+    return _shared(_http_clients, url, lambda: httpx.Client(base_url=url, **_client_kwargs(url)))
+
+
+def get_async_http_client(host: Optional[str] = None):
+    """获取共享的异步 httpx.AsyncClient，与 get_async_client() 及推理请求共用同一个连接池"""
+    import httpx
+
+    url = get_host_url(host)
+    return _shared(_async_http_clients, url,
+                   lambda: httpx.AsyncClient(base_url=url, **_client_kwargs(url, asynchronous=True)))
+
+
+def model_client_kwargs(host: Optional[str] = None) -> dict:
+    """
+    构造 OllamaChatModel 时的 client_kwargs
+
+    OllamaChatModel.__init__ 总会创建自己的 AsyncClient，随后被 share_client 替换；
+    让它使用共享的传输层，这个用不到的客户端就不会持有单独的连接池，也无需关闭。
+    """
+    url = get_host_url(host)
+    return _client_kwargs(url, asynchronous=True)
+
+
+class _KeepAliveClient:
+    """包装 AgentScope 模型使用的客户端，让模型请求带上调度器的 keep_alive 覆盖值"""
+
+    def __init__(self, client):
+        self._client = client
+
+    async def chat(self, **kwargs):
+        kwargs['keep_alive'] = request_keep_alive(kwargs.get('keep_alive'))
+        return await self._client.chat(**kwargs)
+
+    async def generate(self, **kwargs):
+        kwargs['keep_alive'] = request_keep_alive(kwargs.get('keep_alive'))
+        return await self._client.generate(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def share_client(model, host: Optional[str] = None):
+    """
+    让 AgentScope 的 OllamaChatModel 改用共享的异步客户端
+
+    配置了多个 [backends] 且未指定 host 时改用路由客户端，请求按模型驻留、延迟和负载分发到各后端
+
+    Args:
+        model: OllamaChatModel 实例
+        host: 服务地址，默认使用 [system] 配置
+
+    Returns:
+        传入的 model，便于链式调用
+    """
+    from utils.backend_router import get_router, get_routed_client
+
+    if host is None and get_router().is_multi:
+        client = get_routed_client()
+    else:
+        client = get_async_client(host)
+    model.client = _KeepAliveClient(client)
+    return model
+
+
+class StreamDeadlineExceeded(Exception):
+    """流式响应超过总时限或长时间没有新内容"""
+
+
+async def iter_stream(stream, total_timeout: float = 0, stall_timeout: float = 0):
+    """
+    带时限地迭代 AsyncClient 返回的流式响应
+
+    超时、被取消（Ctrl-C）或调用方提前结束迭代时都会关闭流，底层 HTTP 连接随之断开，
+    Ollama 检测到客户端断开后会立即停止生成，而不是一直生成到 num_predict 用完。
+
+    Args:
+        stream: await client.chat(..., stream=True) 返回的异步生成器
+        total_timeout: 整个响应的最长耗时（秒），0 表示不限制
+        stall_timeout: 两个数据块之间的最长间隔（秒），0 表示不限制
+
+    Raises:
+        StreamDeadlineExceeded: 超过任一时限
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + total_timeout if total_timeout else None
+    try:
+        while True:
+            timeout = stall_timeout or None
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise StreamDeadlineExceeded(f"响应超过总时限 {total_timeout:g} 秒")
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                if deadline is not None and loop.time() >= deadline:
+                    raise StreamDeadlineExceeded(f"响应超过总时限 {total_timeout:g} 秒") from None
+                raise StreamDeadlineExceeded(f"超过 {stall_timeout:g} 秒未收到新内容") from None
+            yield chunk
+    finally:
+        await stream.aclose()
@@ -0,0 +1,348 @@
+"""
+持久化响应缓存
+对确定性较高的请求（相同截图的 OCR、相同剪贴板内容和问题）按内容寻址缓存最终回答，
+命中时直接输出，不再调用模型
+
+缓存键：模型名 + 推理选项 + 系统提示词 + 用户文本 + 图片内容哈希
+缓存值：最终文本 + Ollama 计时信息
+淘汰：超过 max_age_days 的条目直接删除；总大小超过 max_size_mb 时按最近访问时间（LRU）淘汰
+
+另有一张按感知哈希（dHash）索引的近似截图表，用于剪贴板截图 OCR：重新截取的同一画面
+与之前的截图只差几个像素，内容哈希不同但感知哈希的汉明距离很小，逐像素确认后复用之前的结果
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from config_manager import config
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认缓存目录（项目根目录下，已加入 .gitignore）
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, ".cache")
+
+CACHE_DB_FILE = "responses.sqlite3"
+
+# 计算图片哈希时的读取块大小
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# 本次请求是否跳过缓存（xs --no-cache）；守护进程串行处理请求，按请求设置即可
+_bypass = False
+
+
+def set_bypass(bypass: bool):
+    """设置本次请求是否跳过缓存"""
+    global _bypass
+    _bypass = bypass
+
+
+def hash_file(path: str) -> str:
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def image_digest(image) -> str:
+    """图片内容的 SHA-256：文件路径按文件内容计算，内存中的剪贴板图片（ClipboardImage）按像素数据计算"""
+    if isinstance(image, str):
+        return hash_file(image)
+    return image.digest()
+
+
+def make_key(model: str, options: Optional[Dict[str, Any]], system_prompt: str = '',
+             text: str = '', image_paths: Iterable = ()) -> str:
+    """
+    生成内容寻址的缓存键
+
+    图片按文件内容而不是路径参与计算：同一张截图换了临时文件名也能命中。
+    image_paths 中也可以是内存中的 ClipboardImage，不必为计算缓存键写临时文件。
+    """
+    payload = {
+        'model': model,
+        'options': options or {},
+        'system': system_prompt or '',
+        'text': text,
+        'images': [image_digest(image) for image in image_paths],
+    }
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """基于 SQLite 的响应缓存，可在多个 xs 进程之间共享"""
+
+    def __init__(self, db_path: str, max_size_mb: float = 100, max_age_days: float = 30):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径
+            max_size_mb: 缓存内容总大小上限（MB）
+            max_age_days: 条目最长保留时间（天），0 表示不限制
+        """
+        self.db_path = db_path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at);
+            CREATE TABLE IF NOT EXISTS similar_images (
+                signature TEXT NOT NULL,
+                image_hash BLOB NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                pixels BLOB NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_similar_signature ON similar_images(signature, width, height);
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def _bump(self, name: str):
+        self._conn.execute(
+            "INSERT INTO stats(name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存
+
+        Returns:
+            dict: {'text': 最终文本, 'metadata': 计时信息}；未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age and now - row[1] > self.max_age:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._bump('misses')
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._bump('hits')
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, text: str, metadata: Optional[Dict[str, Any]] = None):
+        """写入缓存并按需淘汰旧条目"""
+        value = json.dumps({'text': text, 'metadata': metadata or {}}, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries(key, model, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, len(value.encode('utf-8')), now, now))
+            self._evict(now)
+
+    def _evict(self, now: float):
+        """删除过期条目，并按最近访问时间淘汰直到总大小不超过上限"""
+        if self.max_age:
+            self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.max_age,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+        evicted = 0
+        for key, size in self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            if total <= self.max_size:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._conn.execute(
+            "INSERT INTO stats(name, value) VALUES ('evictions', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + ?", (evicted, evicted))
+
+    def find_similar(self, signature: str, image_hash: bytes, gray, max_distance: int,
+                     max_changed_pixels: int) -> Optional[Dict[str, Any]]:
+        """
+        在感知哈希索引中查找近似截图的结果
+
+        先按尺寸和 dHash 汉明距离筛选候选，再逐像素比较确认两张图只差几个像素
+        （只改了一个字的截图 dHash 几乎相同，必须经过这一步才能复用结果）。
+
+        Args:
+            signature: 请求签名（模型、参数、提示词，不含图片）
+            image_hash: 感知哈希（utils.image_hash.fingerprint）
+            gray: 灰度像素数组
+            max_distance: 允许的最大汉明距离
+            max_changed_pixels: 允许变化的最大像素数
+
+        Returns:
+            dict: {'text': 结果文本, 'distance': 汉明距离, 'changed_pixels': 变化像素数}；未找到时返回 None
+        """
+        import numpy as np
+        from utils.image_hash import hamming_distances, count_changed_pixels
+
+        height, width = gray.shape
+        oldest = time.time() - self.max_age if self.max_age else 0
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT rowid, image_hash, text FROM similar_images "
+                "WHERE signature = ? AND width = ? AND height = ? AND created_at >= ?",
+                (signature, width, height, oldest)).fetchall()
+            # 只比较同样长度的指纹（哈希尺寸变化后旧条目自然失效）
+            rows = [row for row in rows if len(row[1]) == len(image_hash)]
+
+            hit = None
+            if rows:
+                distances = hamming_distances(image_hash, [row[1] for row in rows])
+                for index in np.argsort(distances, kind='stable'):
+                    if distances[index] > max_distance:
+                        break
+                    rowid, _, text = rows[index]
+                    pixels = self._conn.execute(
+                        "SELECT pixels FROM similar_images WHERE rowid = ?", (rowid,)).fetchone()[0]
+                    previous = np.frombuffer(zlib.decompress(pixels), dtype=np.uint8).reshape(height, width)
+                    changed = count_changed_pixels(gray, previous)
+                    if changed <= max_changed_pixels:
+                        hit = rowid, {'text': text, 'distance': int(distances[index]), 'changed_pixels': changed}
+                        break
+
+            if hit is None:
+                self._bump('similar_misses')
+                return None
+            self._conn.execute("UPDATE similar_images SET accessed_at = ? WHERE rowid = ?", (time.time(), hit[0]))
+            self._bump('similar_hits')
+        return hit[1]
+
+    def add_similar(self, signature: str, image_hash: bytes, gray, text: str, max_entries: int):
+        """把截图的结果加入感知哈希索引，条目数超过 max_entries 时淘汰最久未访问的条目"""
+        height, width = gray.shape
+        # 保存压缩后的灰度像素，供下次逐像素确认
+        pixels = zlib.compress(gray.tobytes(), 1)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO similar_images"
+                "(signature, image_hash, width, height, pixels, text, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (signature, image_hash, width, height, pixels, text, now, now))
+            if self.max_age:
+                self._conn.execute("DELETE FROM similar_images WHERE created_at < ?", (now - self.max_age,))
+            self._conn.execute(
+                "DELETE FROM similar_images WHERE rowid NOT IN "
+                "(SELECT rowid FROM similar_images ORDER BY accessed_at DESC LIMIT ?)", (max_entries,))
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中次数、条目数和总大小"""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'evictions': counters.get('evictions', 0),
+            'similar_hits': counters.get('similar_hits', 0),
+            'similar_misses': counters.get('similar_misses', 0),
+            'entries': entries,
+            'size_bytes': size,
+        }
+
+    def clear(self):
+        """清空缓存条目和统计"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM similar_images")
+            self._conn.execute("DELETE FROM stats")
+
+
+_cache = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    获取进程共享的响应缓存
+
+    Returns:
+        ResponseCache；配置中禁用缓存或本次请求使用了 --no-cache 时返回 None
+    """
+    global _cache
+    cache_config = config.get_cache_config()
+    if _bypass or not cache_config['enabled']:
+        return None
+    if _cache is None:
+        cache_dir = cache_config['dir'] or DEFAULT_CACHE_DIR
+        _cache = ResponseCache(os.path.join(cache_dir, CACHE_DB_FILE),
+                               max_size_mb=cache_config['max_size_mb'],
+                               max_age_days=cache_config['max_age_days'])
+    return _cache
+
+
+# Ollama 未指定 temperature 时使用的采样温度
+OLLAMA_DEFAULT_TEMPERATURE = 0.8
+
+
+def is_cacheable(options: Optional[Dict[str, Any]]) -> bool:
+    """只缓存确定性的请求：采样温度不高于 [cache] max_temperature，或设置了固定 seed"""
+    options = options or {}
+    if options.get('seed') is not None:
+        return True
+    # 未设置温度时 Ollama 使用默认值 0.8
+    temperature = options.get('temperature', OLLAMA_DEFAULT_TEMPERATURE)
+    return temperature <= config.get_cache_config()['max_temperature']
+
+
+# Ollama 响应中随结果一起缓存的计时字段
+TIMING_FIELDS = ('total_duration', 'load_duration', 'prompt_eval_count', 'prompt_eval_duration',
+                 'eval_count', 'eval_duration')
+
+
+def timing_metadata(response) -> Dict[str, Any]:
+    """从 Ollama 的最终响应块中提取计时信息"""
+    if response is None:
+        return {}
+    return {field: response[field] for field in TIMING_FIELDS if response.get(field) is not None}
+
+
+def make_agent_key(agent, text: str, image_paths: Iterable = ()) -> Optional[str]:
+    """
+    为 ReActAgent 的单轮请求生成缓存键
+
+    Returns:
+        str；缓存不可用或采样温度过高时返回 None
+    """
+    model = agent.model
+    if get_response_cache() is None or not is_cacheable(model.options):
+        return None
+    return make_key(model.model_name, model.options, agent.sys_prompt, text, image_paths)
+
+
+def print_cache_stats(report=print):
+    """输出缓存统计（xs --cache-stats）"""
+    cache = get_response_cache()
+    if cache is None:
+        report("响应缓存已禁用")
+        return
+    stats = cache.stats()
+    report(f"缓存文件: {cache.db_path}")
+    report(f"条目: {stats['entries']}  大小: {stats['size_bytes'] / 1024 / 1024:.2f} MB  淘汰: {stats['evictions']}")
+    report(f"命中: {stats['hits']}  未命中: {stats['misses']}  命中率: {stats['hit_rate']:.1%}")
+    report(f"近似图片命中: {stats['similar_hits']}  未命中: {stats['similar_misses']}")
@@ -0,0 +1,189 @@
+"""
+会话存储
+命名会话（xs -s <名称> ...）把每轮对话持久化到 SQLite，使后续追问（例如"把上面的翻译成英文"）能看到之前的内容
+
+- 文本场景走 Ollama 原生 generate 接口，保存返回的 context（KV 缓存对应的 token），
+  下一轮直接带上 context 续写，无需重新预填充历史
+- 其他场景（工具、视觉、OCR）把最近的若干轮注入 Agent 记忆；这些轮次不在 context 中，
+  因此会使已保存的 context 失效，下一轮文本请求改为用历史重建提示词
+- 超过 ttl_hours 未使用的会话自动过期删除
+"""
+import os
+import time
+import array
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from config_manager import config
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认存储目录（与响应缓存相同，已加入 .gitignore）
+DEFAULT_SESSION_DIR = os.path.join(PROJECT_ROOT, ".cache")
+
+SESSION_DB_FILE = "sessions.sqlite3"
+
+
+class Session:
+    """一个命名会话：对话历史 + 文本模型的 context"""
+
+    def __init__(self, store: "SessionStore", name: str, model: Optional[str],
+                 context: Optional[List[int]], turns: List[Dict[str, str]]):
+        self.store = store
+        self.name = name
+        self.model = model
+        self.context = context
+        self.turns = turns
+
+    def context_for(self, model_name: str) -> Optional[List[int]]:
+        """获取可用于该模型续写的 context；模型不同或已失效时返回 None"""
+        if self.context and self.model == model_name:
+            return self.context
+        return None
+
+    def recent_turns(self) -> List[Dict[str, str]]:
+        """最近 max_turns 轮对话（每轮包含 user 和 assistant 两条消息）"""
+        max_turns = config.get_session_config()['max_turns']
+        return self.turns[-max_turns * 2:] if max_turns else list(self.turns)
+
+    def build_prompt(self, user_input: str) -> str:
+        """没有可用 context 时，用历史对话重建提示词"""
+        history = self.recent_turns()
+        if not history:
+            return user_input
+        lines = ["以下是我们之前的对话："]
+        for turn in history:
+            speaker = "用户" if turn['role'] == 'user' else "助手"
+            lines.append(f"{speaker}：{turn['content']}")
+        lines.append("")
+        lines.append(f"请继续回答：{user_input}")
+        return "\n".join(lines)
+
+    def add_turn(self, user_input: str, answer: str, scenario: str,
+                 model_name: Optional[str] = None, context: Optional[List[int]] = None):
+        """
+        记录一轮对话
+
+        Args:
+            user_input: 用户输入
+            answer: 最终回答
+            scenario: 场景类型
+            model_name: 生成 context 的模型（仅文本场景）
+            context: generate 接口返回的 context；None 表示本轮不在 context 中，已保存的 context 随之失效
+        """
+        self.turns.append({'role': 'user', 'content': user_input})
+        self.turns.append({'role': 'assistant', 'content': answer})
+        self.model = model_name if context else None
+        self.context = context or None
+        self.store.save_turn(self, user_input, answer, scenario)
+
+
+class SessionStore:
+    """基于 SQLite 的会话存储，可在多个 xs 进程之间共享"""
+
+    def __init__(self, db_path: str, ttl_hours: float = 24):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径
+            ttl_hours: 会话在多久未使用后过期（小时），0 表示不过期
+        """
+        self.db_path = db_path
+        self.ttl = ttl_hours * 3600
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                name TEXT PRIMARY KEY,
+                model TEXT,
+                context BLOB,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session TEXT NOT NULL REFERENCES sessions(name) ON DELETE CASCADE,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                scenario TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_turns_session ON turns(session, id);
+        """)
+        self._conn.commit()
+
+    def _expire(self, now: float):
+        if self.ttl:
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+
+    def open(self, name: str) -> Session:
+        """打开会话，不存在或已过期时创建新会话"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._expire(now)
+            row = self._conn.execute("SELECT model, context FROM sessions WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO sessions(name, created_at, updated_at) VALUES (?, ?, ?)", (name, now, now))
+                return Session(self, name, None, None, [])
+            turns = [{'role': role, 'content': content} for role, content in self._conn.execute(
+                "SELECT role, content FROM turns WHERE session = ? ORDER BY id", (name,))]
+        context = array.array('i', row[1]).tolist() if row[1] else None
+        return Session(self, name, row[0], context, turns)
+
+    def save_turn(self, session: Session, user_input: str, answer: str, scenario: str):
+        """保存一轮对话和最新的 context"""
+        now = time.time()
+        context = array.array('i', session.context).tobytes() if session.context else None
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO turns(session, role, content, scenario, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(session.name, 'user', user_input, scenario, now),
+                 (session.name, 'assistant', answer, scenario, now)])
+            self._conn.execute(
+                "UPDATE sessions SET model = ?, context = ?, updated_at = ? WHERE name = ?",
+                (session.model, context, now, session.name))
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        """列出未过期的会话"""
+        with self._lock, self._conn:
+            self._expire(time.time())
+            rows = self._conn.execute(
+                "SELECT s.name, s.updated_at, s.context IS NOT NULL, COUNT(t.id) "
+                "FROM sessions s LEFT JOIN turns t ON t.session = s.name "
+                "GROUP BY s.name ORDER BY s.updated_at DESC").fetchall()
+        return [{'name': name, 'updated_at': updated_at, 'has_context': bool(has_context), 'turns': count // 2}
+                for name, updated_at, has_context, count in rows]
+
+    def delete(self, name: str) -> bool:
+        """删除会话，返回是否存在"""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM sessions WHERE name = ?", (name,)).rowcount > 0
+
+
+_store = None
+
+
+def get_session_store() -> SessionStore:
+    """获取进程共享的会话存储"""
+    global _store
+    if _store is None:
+        session_config = config.get_session_config()
+        session_dir = session_config['dir'] or DEFAULT_SESSION_DIR
+        _store = SessionStore(os.path.join(session_dir, SESSION_DB_FILE), ttl_hours=session_config['ttl_hours'])
+    return _store
+
+
+def print_sessions(report=print):
+    """列出会话（xs --sessions）"""
+    sessions = get_session_store().list_sessions()
+    if not sessions:
+        report("没有会话")
+        return
+    for item in sessions:
+        updated = time.strftime('%Y-%m-%d %H:%M', time.localtime(item['updated_at']))
+        context = "  可续写" if item['has_context'] else ""
+        report(f"{item['name']:<20}{item['turns']:>4} 轮  最近使用 {updated}{context}")
@@ -0,0 +1,175 @@
+"""
+启动耗时分析
+记录冷启动各阶段（配置加载、Ollama 检查、场景路由、首字输出）的墙钟时间，
+并在 xs --profile-startup 模式下汇总 -X importtime 的模块导入耗时
+"""
+import os
+import sys
+import json
+import time
+import atexit
+
+# 子进程通过该环境变量得知需要记录阶段耗时，以及结果写到哪里
+PROFILE_OUTPUT_ENV = "XS_PROFILE_STARTUP_OUTPUT"
+
+
+class StartupProfiler:
+    """启动阶段计时器，未启用时 mark() 不做任何事"""
+
+    def __init__(self):
+        self.output_path = os.environ.get(PROFILE_OUTPUT_ENV)
+        self.enabled = bool(self.output_path)
+        self._start = time.perf_counter()
+        self._last = self._start
+        self.phases = []
+        if self.enabled:
+            atexit.register(self.dump)
+
+    def mark(self, phase: str):
+        """记录从上一个阶段结束到现在的耗时，同名阶段只记录第一次"""
+        if not self.enabled or any(name == phase for name, _, _ in self.phases):
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self._last) * 1000, (now - self._start) * 1000))
+        self._last = now
+
+    def dump(self):
+        """把阶段耗时写入父进程指定的文件"""
+        if not self.enabled:
+            return
+        # 退出时的累计耗时：首字之后的生成时间据此单独计算
+        finished_ms = (time.perf_counter() - self._start) * 1000
+        try:
+            with open(self.output_path, 'w', encoding='utf-8') as f:
+                json.dump({'phases': self.phases, 'finished_ms': finished_ms}, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+
+profiler = StartupProfiler()
+
+
+def parse_importtime(stderr_text: str):
+    """
+    解析 -X importtime 的输出
+
+    Returns:
+        tuple: (模块耗时列表 [(模块名, 自身耗时us, 累计耗时us, 层级)], 其余 stderr 行)
+    """
+    modules = []
+    other_lines = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:"):
+            other_lines.append(line)
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            # 表头行
+            continue
+        raw_name = parts[2].rstrip()
+        name = raw_name.strip()
+        # 模块名前的缩进表示导入层级（每层两个空格）
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        modules.append((name, self_us, cumulative_us, depth))
+    return modules, other_lines
+
+
+def _top_level_package(name: str) -> str:
+    return name.split('.')[0]
+
+
+def format_report(modules, phases, wall_ms: float, top: int = 15, finished_ms: float = None) -> str:
+    """
+    生成启动耗时报告
+
+    Args:
+        finished_ms: 子进程退出前的累计耗时；首字之后的生成时间单独列出，不计入"解释器及其他"
+    """
+    lines = ["", "========== 启动耗时分析 =========="]
+
+    total_import_ms = sum(m[1] for m in modules) / 1000
+    lines.append(f"进程总耗时: {wall_ms:.1f} ms    模块导入合计: {total_import_ms:.1f} ms")
+
+    if phases:
+        lines.append("")
+        lines.append("启动阶段（墙钟时间）:")
+        for name, delta_ms, elapsed_ms in phases:
+            lines.append(f"  {name:<14}{delta_ms:>10.1f} ms   累计 {elapsed_ms:>10.1f} ms")
+        first_byte_ms = next((elapsed for name, _, elapsed in phases if name == "first byte"), None)
+        anchor_ms = first_byte_ms if first_byte_ms is not None else phases[-1][2]
+        if finished_ms is not None and finished_ms >= anchor_ms:
+            label = '首字之后的生成' if first_byte_ms is not None else '最后阶段之后'
+            lines.append(f"  {label:<{14 - len(label)}}{finished_ms - anchor_ms:>10.1f} ms")
+            interpreter_ms = wall_ms - finished_ms
+        else:
+            interpreter_ms = wall_ms - anchor_ms
+        # 中文字符占两列，按显示宽度与上面的阶段名对齐
+        lines.append(f"  {'解释器及其他':<8}{interpreter_ms:>10.1f} ms")
+
+    # 按顶层包汇总自身耗时
+    packages = {}
+    for name, self_us, _, _ in modules:
+        package = _top_level_package(name)
+        packages[package] = packages.get(package, 0) + self_us
+    lines.append("")
+    lines.append(f"顶层包导入耗时 Top {top}:")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        lines.append(f"  {package:<40}{self_us / 1000:>10.1f} ms")
+
+    lines.append("")
+    lines.append(f"单个模块自身耗时 Top {top}:")
+    for name, self_us, cumulative_us, _ in sorted(modules, key=lambda m: m[1], reverse=True)[:top]:
+        lines.append(f"  {name:<40}{self_us / 1000:>10.1f} ms   累计 {cumulative_us / 1000:>10.1f} ms")
+
+    return "\n".join(lines)
+
+
+def run_profiled(script_path: str, args, top: int = 15):
+    """
+    在 -X importtime 子进程中运行一次 xs 命令，命令输出照常显示，结束后打印启动耗时报告
+
+    Args:
+        script_path: main.py 路径
+        args: 传给 main.py 的参数
+        top: 报告中列出的条目数
+    """
+    import subprocess
+    import tempfile
+
+    fd, output_path = tempfile.mkstemp(prefix="xs_profile_", suffix=".json")
+    os.close(fd)
+    env = dict(os.environ, **{PROFILE_OUTPUT_ENV: output_path})
+
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", script_path, *args],
+                            env=env, stderr=subprocess.PIPE)
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    stderr_text = result.stderr.decode('utf-8', errors='replace')
+    modules, other_lines = parse_importtime(stderr_text)
+    # 子进程自身的 stderr 输出原样转发
+    if other_lines:
+        sys.stderr.write("\n".join(other_lines) + "\n")
+
+    phases = []
+    finished_ms = None
+    try:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        phases = data.get('phases', [])
+        finished_ms = data.get('finished_ms')
+    except (OSError, ValueError):
+        pass
+    finally:
+        try:
+            os.unlink(output_path)
+        except OSError:
+            pass
+
+    print(format_report(modules, phases, wall_ms, top, finished_ms))
+    return result.returncode
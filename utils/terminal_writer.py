@@ -0,0 +1,105 @@
+"""
+流式输出的终端写入器
+把逐 token 的输出合并后再写入，避免每个 token 都触发一次 print、编码回退和 flush 系统调用
+
+- 终端（TTY）：遇到换行或距上次刷新超过时间预算（默认 16 ms，约一帧）时刷新
+- 非终端（重定向到文件或管道）：原始模式，按块缓冲，只在缓冲区满或结束时写出
+- 编码在创建时确定一次，写入时直接编码为字节（无法编码的字符替换为 ?）
+"""
+import sys
+import time
+import asyncio
+import codecs
+
+# 默认刷新时间预算（秒）
+DEFAULT_FLUSH_INTERVAL = 0.016
+
+# 原始模式下的块大小（字符数）
+RAW_BLOCK_SIZE = 64 * 1024
+
+
+class TerminalWriter:
+    """合并写入的输出缓冲，绑定创建时的 sys.stdout（守护进程模式下即客户端连接）"""
+
+    def __init__(self, stream=None, flush_interval: float = DEFAULT_FLUSH_INTERVAL, raw: bool = None):
+        """
+        Args:
+            stream: 输出流，默认使用当前的 sys.stdout
+            flush_interval: 终端模式下的刷新时间预算（秒）
+            raw: 是否使用原始模式，默认在输出不是终端时启用
+        """
+        self.stream = stream if stream is not None else sys.stdout
+        self.flush_interval = flush_interval
+        if raw is None:
+            isatty = getattr(self.stream, 'isatty', None)
+            raw = not (isatty and isatty())
+        self.raw = raw
+
+        # 编码只在这里处理一次：有底层字节缓冲时直接写字节，绕过文本层的逐次编码
+        self._binary = getattr(self.stream, 'buffer', None)
+        encoding = getattr(self.stream, 'encoding', None) or 'utf-8'
+        self._encoder = codecs.getincrementalencoder(encoding)(errors='replace')
+
+        self._parts = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+        # 先把之前通过 print 写入文本层的内容刷出，保证输出顺序
+        self.stream.flush()
+
+    def write(self, text: str):
+        """写入一段文本（通常是一个 token）"""
+        if not text:
+            return
+        self._parts.append(text)
+        self._size += len(text)
+
+        if self.raw:
+            if self._size >= RAW_BLOCK_SIZE:
+                self.flush()
+            return
+
+        if '\n' in text or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        """在事件循环中安排一次延迟刷新，保证输出停顿时缓冲内容也能在预算内显示"""
+        if self._timer is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        delay = max(0.0, self.flush_interval - (time.monotonic() - self._last_flush))
+        self._timer = loop.call_later(delay, self.flush)
+
+    def flush(self):
+        """把缓冲内容写出"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._last_flush = time.monotonic()
+        if not self._parts:
+            return
+        text = ''.join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        if self._binary is not None:
+            self._binary.write(self._encoder.encode(text))
+            self._binary.flush()
+        else:
+            self.stream.write(text)
+            self.stream.flush()
+
+    def close(self):
+        """写出剩余内容"""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
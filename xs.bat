@@ -4,13 +4,13 @@ setlocal
 
 REM Get the directory where this batch file is located
 set "SCRIPT_DIR=%~dp0"
-set "PY_SCRIPT=%SCRIPT_DIR%main.py"
+set "PY_SCRIPT=%SCRIPT_DIR%xs_client.py"
 
 REM Change to the script directory
 cd /d "%SCRIPT_DIR%"
 
 if not exist "%PY_SCRIPT%" (
-    echo Error: main.py not found at %PY_SCRIPT%
+    echo Error: xs_client.py not found at %PY_SCRIPT%
     pause
     exit /b 1
 )
@@ -4,13 +4,13 @@ $OutputEncoding = [System.Text.Encoding]::UTF8
 
 # Get the directory where this script is located
 $SCRIPT_DIR = Split-Path -Parent $MyInvocation.MyCommand.Path
-$PY_SCRIPT = Join-Path $SCRIPT_DIR "main.py"
+$PY_SCRIPT = Join-Path $SCRIPT_DIR "xs_client.py"
 
 # Change to the script directory
 Set-Location $SCRIPT_DIR
 
 if (-not (Test-Path $PY_SCRIPT)) {
-    Write-Host "Error: main.py not found at $PY_SCRIPT" -ForegroundColor Red
+    Write-Host "Error: xs_client.py not found at $PY_SCRIPT" -ForegroundColor Red
     Read-Host "Press Enter to exit"
     exit 1
 }
@@ -0,0 +1,66 @@
+"""
+xs 命令入口（瘦客户端）
+守护进程（xs --daemon）运行时，把 argv、当前目录和剪贴板内容通过 Unix 域套接字转发给它并流式输出结果；
+否则在本进程中直接运行 main.py。
+"""
+import os
+import sys
+import runpy
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# 可以和普通命令一起转发给守护进程的选项
+FORWARDED_OPTIONS = ('--no-cache',)
+
+
+def _needs_clipboard(args) -> bool:
+    """该命令是否需要读取剪贴板"""
+    return args[0] == 'p' or (args[0] == 'ocr' and len([arg for arg in args if arg != '--tiled']) == 1)
+
+
+def _read_clipboard():
+    """在客户端读取剪贴板，读取失败时返回 None 交由守护进程自行处理"""
+    try:
+        from clipboard_manager import clipboard_manager
+        return clipboard_manager.get_clipboard_content() or None
+    except Exception:
+        return None
+
+
+def run():
+    args = sys.argv[1:]
+
+    if args == ['--daemon-stop']:
+        import daemon
+        if not daemon.forward_request([], command='shutdown'):
+            print("守护进程未运行")
+        return
+
+    if args == ['--daemon-stats']:
+        import daemon
+        if not daemon.forward_request([], command='stats'):
+            print("守护进程未运行")
+        return
+
+    # 选项参数（如 --daemon）和无参数的用法提示都在本进程中处理；--no-cache 属于单次请求的参数，照常转发
+    command_args = [arg for arg in args if arg not in FORWARDED_OPTIONS]
+    if command_args[:1] in (['-s'], ['--session']):
+        # 会话参数 -s <名称> 之后才是实际命令
+        command_args = command_args[2:] or ['']
+    if command_args and not command_args[0].startswith('--'):
+        import daemon
+        if daemon.is_supported():
+            clipboard_content = _read_clipboard() if _needs_clipboard(command_args) else None
+            if daemon.forward_request(args, clipboard_content):
+                return
+
+    sys.path.insert(0, os.path.dirname(MAIN_SCRIPT))
+    runpy.run_path(MAIN_SCRIPT, run_name="__main__")
+
+
+if __name__ == "__main__":
+    try:
+        run()
+    except KeyboardInterrupt:
+        # 断开连接后守护进程会取消该请求并停止生成
+        sys.exit(130)